@@ -235,3 +235,78 @@ class FrequencyModel:
         model.offset_to_symbol = state['offset_to_symbol']
         model.total_freq = state['total_freq']
         return model
+
+
+class BinaryArithmeticEncoder:
+    """
+    Binarny koder arytmetyczny (styl paq/lpaq)
+    Koduje pojedyncze bity z prawdopodobieństwem P(bit=1) w 12 bitach (1..4095)
+    """
+    
+    def __init__(self):
+        self.x1 = 0
+        self.x2 = 0xFFFFFFFF
+        self.output = bytearray()
+    
+    def encode_bit(self, bit, p):
+        """
+        Koduje jeden bit
+        
+        Args:
+            bit: 0 lub 1
+            p: P(bit=1) skalowane do 12 bitów
+        """
+        xmid = self.x1 + ((self.x2 - self.x1) >> 12) * p
+        if bit:
+            self.x2 = xmid
+        else:
+            self.x1 = xmid + 1
+        
+        # Wypychanie bajtów o wspólnym prefiksie
+        while ((self.x1 ^ self.x2) & 0xFF000000) == 0:
+            self.output.append(self.x2 >> 24)
+            self.x1 = (self.x1 << 8) & 0xFFFFFFFF
+            self.x2 = ((self.x2 << 8) & 0xFFFFFFFF) | 0xFF
+    
+    def flush(self):
+        """Kończy kodowanie i zwraca bajty"""
+        self.output.append(self.x1 >> 24)
+        self.output.extend(b'\xff\xff\xff')
+        return bytes(self.output)
+
+
+class BinaryArithmeticDecoder:
+    """Dekoder dla BinaryArithmeticEncoder"""
+    
+    def __init__(self, data, pos=0):
+        self.data = data
+        self.pos = pos
+        self.x1 = 0
+        self.x2 = 0xFFFFFFFF
+        self.x = 0
+        for _ in range(4):
+            self.x = (self.x << 8) | self._next_byte()
+    
+    def _next_byte(self):
+        if self.pos < len(self.data):
+            byte = self.data[self.pos]
+            self.pos += 1
+            return byte
+        return 0xFF
+    
+    def decode_bit(self, p):
+        """Dekoduje jeden bit przy P(bit=1) = p/4096"""
+        xmid = self.x1 + ((self.x2 - self.x1) >> 12) * p
+        if self.x <= xmid:
+            bit = 1
+            self.x2 = xmid
+        else:
+            bit = 0
+            self.x1 = xmid + 1
+        
+        while ((self.x1 ^ self.x2) & 0xFF000000) == 0:
+            self.x1 = (self.x1 << 8) & 0xFFFFFFFF
+            self.x2 = ((self.x2 << 8) & 0xFFFFFFFF) | 0xFF
+            self.x = ((self.x << 8) & 0xFFFFFFFF) | self._next_byte()
+        
+        return bit
@@ -0,0 +1,330 @@
+#!/usr/bin/env python3
+"""
+Article similarity order (local STARLIT order generation)
+
+STARLITReorder could only replay the new_article_order file shipped with
+the STARLIT repository. This module computes an order of its own:
+
+1. MinHash signature per article (word shingles of the article text),
+   computed by a process pool, each worker reading its spans from an
+   mmap of the input - memory stays bounded by one batch per worker.
+2. LSH banding of the signatures to find candidate neighbours.
+3. Greedy nearest-neighbour tour: go to the most similar unvisited
+   candidate, fall back to the next article in file order. Articles
+   without words (redirects, stubs) all share the EMPTY signature; they
+   are left out of the tour and appended at its end in file order.
+
+The permutation is stored in a compact binary file together with its
+inverse (needed to restore the original order after decompression).
+"""
+import mmap
+import os
+import re
+import struct
+import sys
+import time
+import zlib
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Optional, Tuple
+
+import numpy as np
+
+from starlit_reorder import ArticleExtractor
+
+ORDER_MAGIC = b'AORD'
+
+SHINGLE_PATTERN = re.compile(rb'[a-z]{3,}')
+TEXT_START = re.compile(rb'<text[^>]*>')
+
+# Multipliers of the MinHash permutations: h_i(x) = high 32 bits of (x ^ seed_i) * mult_i
+_RNG = np.random.default_rng(0x5EED)
+_MAX_PERM = 256
+SEEDS = _RNG.integers(1, 1 << 63, size=_MAX_PERM, dtype=np.uint64)
+MULTIPLIERS = _RNG.integers(1, 1 << 63, size=_MAX_PERM, dtype=np.uint64) | np.uint64(1)
+EMPTY = np.uint32(0xFFFFFFFF)
+
+
+def article_spans(data) -> Tuple[np.ndarray, np.ndarray]:
+    """(starts, ends) of all articles as int64 arrays (bytes or mmap)"""
+    return ArticleExtractor().article_spans(data)
+
+
+def minhash_signature(article: bytes, num_perm: int = 64) -> np.ndarray:
+    """MinHash of the set of lowercase words (>= 3 letters) of the article text"""
+    m = TEXT_START.search(article)
+    text = article[m.end():] if m else article
+    words = set(SHINGLE_PATTERN.findall(text.lower()))
+    if not words:
+        return np.full(num_perm, EMPTY, dtype=np.uint32)
+
+    shingles = np.fromiter((zlib.crc32(w) for w in words), dtype=np.uint64, count=len(words))
+    mixed = (shingles[:, None] ^ SEEDS[:num_perm]) * MULTIPLIERS[:num_perm]
+    return (mixed >> np.uint64(32)).astype(np.uint32).min(axis=0)
+
+
+def _signature_batch(args) -> np.ndarray:
+    """Worker: signatures of a batch of spans, read from an mmap of the input"""
+    path, starts, ends, num_perm = args
+    out = np.empty((len(starts), num_perm), dtype=np.uint32)
+    with open(path, 'rb') as f:
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            for i, (start, end) in enumerate(zip(starts.tolist(), ends.tolist())):
+                out[i] = minhash_signature(mm[start:end], num_perm)
+    return out
+
+
+def save_order(path: Path, order: np.ndarray):
+    """
+    Binary order file:
+        'AORD' | uint32 n | uint32 order[n] | uint32 inverse[n]   (little endian)
+
+    order[new_position] = original article index,
+    inverse[original index] = new position.
+    """
+    order = np.asarray(order, dtype='<u4')
+    inverse = inverse_permutation(order).astype('<u4')
+    with open(path, 'wb') as f:
+        f.write(ORDER_MAGIC + struct.pack('<I', len(order)))
+        f.write(order.tobytes())
+        f.write(inverse.tobytes())
+
+
+def load_order(path: Path) -> Tuple[np.ndarray, np.ndarray]:
+    """Returns (order, inverse) from a file written by save_order()"""
+    raw = Path(path).read_bytes()
+    if raw[:4] != ORDER_MAGIC:
+        raise ValueError(f"{path} is not a binary article order file")
+    n = struct.unpack_from('<I', raw, 4)[0]
+    order = np.frombuffer(raw, dtype='<u4', count=n, offset=8)
+    inverse = np.frombuffer(raw, dtype='<u4', count=n, offset=8 + 4 * n)
+    return order, inverse
+
+
+def inverse_permutation(order: np.ndarray) -> np.ndarray:
+    inverse = np.empty(len(order), dtype=np.int64)
+    inverse[np.asarray(order, dtype=np.int64)] = np.arange(len(order))
+    return inverse
+
+
+class ArticleOrderGenerator:
+    """
+    Computes a similarity order for the articles of an enwik file.
+
+    num_perm must be divisible by bands; rows per band = num_perm // bands.
+    Buckets larger than max_candidates (boilerplate such as redirects) only
+    contribute their first max_candidates unvisited members per step.
+    """
+
+    def __init__(self, num_perm: int = 64, bands: int = 32, workers: Optional[int] = None,
+                 batch_size: int = 2000, max_candidates: int = 64):
+        if num_perm % bands or num_perm > _MAX_PERM:
+            raise ValueError("num_perm must be a multiple of bands and <= 256")
+        self.num_perm = num_perm
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.workers = workers or os.cpu_count() or 1
+        self.batch_size = batch_size
+        self.max_candidates = max_candidates
+        self.stats = {}
+        self.last_signatures: Optional[np.ndarray] = None  # of the last generate()
+
+    def signatures(self, path: Path, starts: np.ndarray, ends: np.ndarray) -> np.ndarray:
+        """(n_articles, num_perm) uint32 MinHash signatures, computed in parallel"""
+        batches = [(str(path), starts[i:i + self.batch_size], ends[i:i + self.batch_size], self.num_perm)
+                   for i in range(0, len(starts), self.batch_size)]
+        if not batches:
+            return np.empty((0, self.num_perm), dtype=np.uint32)
+        if self.workers == 1:
+            parts = [_signature_batch(b) for b in batches]
+        else:
+            with ProcessPoolExecutor(max_workers=self.workers) as pool:
+                parts = list(pool.map(_signature_batch, batches))
+        return np.concatenate(parts)
+
+    def band_keys(self, signatures: np.ndarray) -> np.ndarray:
+        """(n_articles, bands) uint64 keys, one hash per band of rows"""
+        n = len(signatures)
+        rows = signatures.reshape(n, self.bands, self.rows).astype(np.uint64)
+        keys = np.zeros((n, self.bands), dtype=np.uint64)
+        for r in range(self.rows):
+            keys = (keys ^ rows[:, :, r]) * np.uint64(0x100000001B3)
+        # Band index in the key so equal rows in different bands don't collide
+        return keys ^ (np.arange(self.bands, dtype=np.uint64) << np.uint64(56))
+
+    def buckets(self, keys: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        LSH buckets of at least two articles, grouped by sorting the band keys
+
+        Returns (members, bounds, groups): bucket g holds the articles
+        members[bounds[g]:bounds[g + 1]] in file order, and groups[article, band]
+        is the bucket of that band key, -1 for singletons (they can never
+        supply a neighbour).
+        """
+        n = len(keys)
+        flat = keys.ravel()
+        by_key = np.argsort(flat, kind='stable')  # stable: file order within a bucket
+        sorted_keys = flat[by_key]
+        first = np.ones(len(flat), dtype=bool)
+        first[1:] = sorted_keys[1:] != sorted_keys[:-1]
+        del sorted_keys
+        run = np.cumsum(first) - 1
+        sizes = np.diff(np.append(np.flatnonzero(first), len(flat)))
+        shared = sizes > 1
+        kept = shared[run]
+        bucket_of_run = np.cumsum(shared) - 1
+
+        groups = np.full(len(flat), -1, dtype=np.int32)
+        groups[by_key[kept]] = bucket_of_run[run[kept]]
+        members = by_key[kept] // self.bands
+        bounds = np.zeros(int(shared.sum()) + 1, dtype=np.int64)
+        np.cumsum(sizes[shared], out=bounds[1:])
+        return members, bounds, groups.reshape(n, self.bands)
+
+    def tour(self, signatures: np.ndarray) -> np.ndarray:
+        """Greedy nearest-neighbour tour over the LSH candidate graph, empty articles last"""
+        n = len(signatures)
+        members, bounds, groups = self.buckets(self.band_keys(signatures))
+        # All-EMPTY signatures would match each other with similarity 1.0:
+        # never candidates, never visited by the tour, appended in file order
+        empty = (signatures == EMPTY).all(axis=1)
+        groups[empty] = -1
+        tail = np.flatnonzero(empty)
+        m = n - len(tail)
+        member = array('q', members.astype(np.int64).tobytes())
+        bound = bounds.tolist()
+        # skip[p]: position to continue from; p itself while members[p] may be
+        # unvisited. Visited members are linked past (with path compression),
+        # so each bucket is scanned once in total, not once per step.
+        skip = array('q', np.arange(len(member) + 1, dtype=np.int64).tobytes())
+        visited = bytearray(empty.astype(np.uint8).tobytes())
+        order = np.empty(n, dtype=np.int64)
+        order[m:] = tail
+        next_unvisited = visited.find(0)
+        jumps = 0
+        similarity_sum = 0.0
+
+        def first_unvisited(p, end):
+            root = p
+            while root < end:
+                link = skip[root]
+                if link != root:
+                    root = link
+                elif visited[member[root]]:
+                    skip[root] = root = root + 1
+                else:
+                    break
+            while p < root:
+                link = skip[p]
+                skip[p] = root
+                p = link
+            return root
+
+        current = next_unvisited
+        for step in range(m):
+            order[step] = current
+            visited[current] = 1
+            if step == m - 1:
+                break
+
+            candidates = []
+            for g in groups[current].tolist():
+                if g < 0:
+                    continue
+                end = bound[g + 1]
+                p = first_unvisited(bound[g], end)
+                taken = 0
+                while p < end and taken < self.max_candidates:
+                    candidates.append(member[p])
+                    taken += 1
+                    p = first_unvisited(p + 1, end)
+
+            if candidates:
+                candidates = np.unique(np.array(candidates, dtype=np.int64))
+                scores = (signatures[candidates] == signatures[current]).mean(axis=1)
+                best = int(scores.argmax())
+                current = int(candidates[best])
+                similarity_sum += float(scores[best])
+            else:
+                while visited[next_unvisited]:
+                    next_unvisited += 1
+                current = next_unvisited
+                jumps += 1
+
+        self.stats['jumps'] = jumps
+        self.stats['empty'] = len(tail)
+        self.stats['mean_neighbour_similarity'] = similarity_sum / max(1, m - 1 - jumps)
+        return order
+
+    def generate(self, input_path: Path) -> np.ndarray:
+        """Order (new position -> original article index) for input_path"""
+        input_path = Path(input_path)
+        start = time.perf_counter()
+        with open(input_path, 'rb') as f:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                starts, ends = article_spans(mm)
+        self.stats['articles'] = len(starts)
+        self.stats['spans_time'] = time.perf_counter() - start
+
+        start = time.perf_counter()
+        signatures = self.last_signatures = self.signatures(input_path, starts, ends)
+        self.stats['signature_time'] = time.perf_counter() - start
+
+        start = time.perf_counter()
+        order = self.tour(signatures)
+        self.stats['tour_time'] = time.perf_counter() - start
+        return order
+
+
+def adjacent_similarity(signatures: np.ndarray, order: np.ndarray) -> float:
+    """Mean estimated Jaccard similarity of consecutive articles in an order (empty articles match nothing)"""
+    if len(order) < 2:
+        return 0.0
+    s = signatures[order]
+    return float(((s[1:] == s[:-1]) & (s[1:] != EMPTY)).mean())
+
+
+def main():
+    input_file = Path(sys.argv[1]) if len(sys.argv) > 1 else Path("wiki_1mb.txt")
+    output_file = Path(sys.argv[2]) if len(sys.argv) > 2 else input_file.with_suffix('.order')
+
+    print("=" * 70)
+    print("ARTICLE SIMILARITY ORDER (local STARLIT order generation)")
+    print("=" * 70)
+
+    if not input_file.exists():
+        print(f"❌ Error: Input file not found: {input_file}")
+        return 1
+
+    generator = ArticleOrderGenerator()
+    order = generator.generate(input_file)
+    save_order(output_file, order)
+
+    loaded, inverse = load_order(output_file)
+    if not (np.array_equal(loaded, order) and np.array_equal(loaded[inverse], np.arange(len(order)))):
+        raise RuntimeError("Order file round trip FAILED")
+
+    stats = generator.stats
+    print(f"\nInput:       {input_file} ({input_file.stat().st_size:,} bytes)")
+    print(f"Articles:    {stats['articles']:,}")
+    print(f"Workers:     {generator.workers}")
+    print(f"Spans:       {stats['spans_time']:.2f} s")
+    print(f"Signatures:  {stats['signature_time']:.2f} s")
+    print(f"Tour:        {stats['tour_time']:.2f} s ({stats['jumps']:,} jumps to file order, "
+          f"{stats['empty']:,} empty articles appended)")
+
+    signatures = generator.last_signatures
+    identity = np.arange(len(order))
+    print("\nMean similarity of neighbouring articles:")
+    print(f"  file order:        {adjacent_similarity(signatures, identity):.3f}")
+    print(f"  similarity order:  {adjacent_similarity(signatures, order):.3f}")
+
+    print(f"\nOrder written to {output_file} ({output_file.stat().st_size:,} bytes, with inverse)")
+    print("✅ Order file round trip verified")
+    print("=" * 70)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,22 @@
+"""
+Benchmark suite: registered compressor configurations x registered corpora
+
+Replaces the ad hoc test_order*_*.py / test_ultra_*.py scripts:
+
+    python -m benchmarks list
+    python -m benchmarks run -c cm-default,xz -C wiki_100k,data/enwik8@50M+1M -o after.json
+    python -m benchmarks compare before.json after.json
+
+Measures compressed bytes, bpc, compress/decompress MB/s and peak RSS,
+with a verified round trip for every run.
+"""
+from .registry import (COMPRESSORS, CORPORA, Compressor, Corpus, get_compressor, get_corpus,
+                       register_compressor, register_corpus)
+from .runner import load_results, measure, run_suite, save_results
+from .compare import compare_results, format_comparison, has_regressions
+
+__all__ = [
+    'COMPRESSORS', 'CORPORA', 'Compressor', 'Corpus', 'get_compressor', 'get_corpus',
+    'register_compressor', 'register_corpus', 'load_results', 'measure', 'run_suite',
+    'save_results', 'compare_results', 'format_comparison', 'has_regressions',
+]
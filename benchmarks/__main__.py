@@ -0,0 +1,89 @@
+"""Command line: python -m benchmarks {list,run,compare}"""
+import argparse
+import sys
+
+import profiler
+
+from .compare import DEFAULT_TOLERANCES, compare_results, format_comparison, has_regressions
+from .registry import COMPRESSORS, CORPORA
+from .runner import HEADER, load_results, run_suite, save_results
+
+DEFAULT_COMPRESSORS = 'zlib,xz,cm-default'
+DEFAULT_CORPORA = 'sample,wiki_100k'
+
+
+def cmd_list(args) -> int:
+    print("Compressors:")
+    for c in COMPRESSORS.values():
+        print(f"  {c.name:<16} {c.description}")
+    print("\nCorpora (or PATH[@OFFSET][+SIZE]):")
+    for c in CORPORA.values():
+        state = "" if c.available() else "  (missing)"
+        print(f"  {c.name:<16} {c.description}{state}")
+    return 0
+
+
+def cmd_run(args) -> int:
+    profiler.from_args(args)
+    compressors = [c for c in args.compressors.split(',') if c]
+    corpora = [c for c in args.corpora.split(',') if c]
+    print("=" * 70)
+    print("BENCHMARK")
+    print("=" * 70)
+    print(HEADER)
+    results = run_suite(compressors, corpora, repeat=args.repeat, isolate=not args.in_process)
+    if args.output:
+        save_results(results, args.output)
+        print(f"\nResults written to {args.output}")
+    print("=" * 70)
+    return 1 if results['failed'] else 0
+
+
+def cmd_compare(args) -> int:
+    tolerances = {
+        'compressed_bytes': args.size_tolerance,
+        'compress_mb_s': args.speed_tolerance,
+        'decompress_mb_s': args.speed_tolerance,
+        'peak_rss_bytes': args.rss_tolerance,
+    }
+    base, new = load_results(args.base), load_results(args.new)
+    report = compare_results(base, new, tolerances)
+    print(f"base: {args.base} ({base['meta']['git_commit']}, {base['meta']['timestamp']})")
+    print(f"new:  {args.new} ({new['meta']['git_commit']}, {new['meta']['timestamp']})\n")
+    print(format_comparison(report))
+    if has_regressions(report):
+        print("\nRegressions found")
+        return 1
+    print("\nNo regressions")
+    return 0
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(prog='python -m benchmarks', description=__doc__)
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    sub.add_parser('list', help="registered compressors and corpora").set_defaults(func=cmd_list)
+
+    run = sub.add_parser('run', help="run compressors on corpora")
+    run.add_argument('-c', '--compressors', default=DEFAULT_COMPRESSORS, help="comma separated names")
+    run.add_argument('-C', '--corpora', default=DEFAULT_CORPORA, help="comma separated names or PATH[@OFFSET][+SIZE]")
+    run.add_argument('-r', '--repeat', type=int, default=1, help="runs per pair, fastest kept")
+    run.add_argument('-o', '--output', help="JSON result file")
+    run.add_argument('--in-process', action='store_true', help="no subprocess per run (peak RSS is cumulative)")
+    profiler.add_arguments(run)
+    run.set_defaults(func=cmd_run)
+
+    compare = sub.add_parser('compare', help="flag regressions between two result files")
+    compare.add_argument('base')
+    compare.add_argument('new')
+    compare.add_argument('--size-tolerance', type=float, default=DEFAULT_TOLERANCES['compressed_bytes'])
+    compare.add_argument('--speed-tolerance', type=float, default=DEFAULT_TOLERANCES['compress_mb_s'])
+    compare.add_argument('--rss-tolerance', type=float, default=DEFAULT_TOLERANCES['peak_rss_bytes'])
+    compare.set_defaults(func=cmd_compare)
+
+    args = parser.parse_args(argv)
+    return args.func(args)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
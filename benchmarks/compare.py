@@ -0,0 +1,79 @@
+"""
+Comparison of two benchmark result files
+
+Rows are matched on (compressor, corpus, input_bytes). Compressed size is
+deterministic, so any growth beyond size_tolerance is a regression;
+speeds and peak RSS are noisy and get wider tolerances. A row of the base
+file missing from the new one (a compressor that failed or was dropped)
+is a regression too; rows only in the new file are not.
+"""
+from typing import Dict, List, Tuple
+
+DEFAULT_TOLERANCES = {
+    'compressed_bytes': 0.0,    # relative growth allowed
+    'compress_mb_s': 0.10,      # relative slowdown allowed
+    'decompress_mb_s': 0.10,
+    'peak_rss_bytes': 0.10,     # relative growth allowed
+}
+
+# metric -> True if larger is better
+METRICS = {
+    'compressed_bytes': False,
+    'compress_mb_s': True,
+    'decompress_mb_s': True,
+    'peak_rss_bytes': False,
+}
+
+
+def _key(r: Dict) -> Tuple[str, str, int]:
+    return r['compressor'], r['corpus'], r['input_bytes']
+
+
+def compare_results(base: Dict, new: Dict, tolerances: Dict[str, float] = None) -> List[Dict]:
+    """
+    One entry per row present in both files:
+        {compressor, corpus, changes: {metric: (old, new, relative)}, regressions: [metric]}
+    Rows present in only one file are reported with 'missing': 'base' | 'new';
+    a row missing from the new file lists 'missing' among its regressions.
+    """
+    tolerances = {**DEFAULT_TOLERANCES, **(tolerances or {})}
+    old_rows = {_key(r): r for r in base['results']}
+    new_rows = {_key(r): r for r in new['results']}
+
+    report = []
+    for key in list(old_rows) + [k for k in new_rows if k not in old_rows]:
+        entry = {'compressor': key[0], 'corpus': key[1], 'changes': {}, 'regressions': []}
+        if key not in new_rows or key not in old_rows:
+            entry['missing'] = 'new' if key not in new_rows else 'base'
+            if entry['missing'] == 'new':
+                entry['regressions'].append('missing')
+            report.append(entry)
+            continue
+        old, cur = old_rows[key], new_rows[key]
+        for metric, higher_is_better in METRICS.items():
+            a, b = old[metric], cur[metric]
+            relative = (b - a) / a if a else 0.0
+            entry['changes'][metric] = (a, b, relative)
+            worse = -relative if higher_is_better else relative
+            if worse > tolerances[metric]:
+                entry['regressions'].append(metric)
+        report.append(entry)
+    return report
+
+
+def format_comparison(report: List[Dict]) -> str:
+    lines = [f"  {'compressor':<14} {'corpus':<16} {'bytes':>9} {'comp MB/s':>10} {'dec MB/s':>10} "
+             f"{'peak RSS':>10}  status"]
+    for entry in report:
+        if 'missing' in entry:
+            lines.append(f"  {entry['compressor']:<14} {entry['corpus']:<16} only in "
+                         f"{'base file  REGRESSION: missing' if entry['missing'] == 'new' else 'new file'}")
+            continue
+        cells = [f"{entry['changes'][m][2] * 100:>+9.1f}%" for m in METRICS]
+        status = "REGRESSION: " + ", ".join(entry['regressions']) if entry['regressions'] else "ok"
+        lines.append(f"  {entry['compressor']:<14} {entry['corpus']:<16} " + " ".join(cells) + f"  {status}")
+    return "\n".join(lines)
+
+
+def has_regressions(report: List[Dict]) -> bool:
+    return any(entry['regressions'] for entry in report)
@@ -0,0 +1,221 @@
+"""
+Registered compressor configurations and corpora
+
+A compressor configuration is a pair of functions bytes -> bytes
+(compress, decompress). A corpus is a slice (offset, size) of a file.
+Corpora can also be given ad hoc on the command line as
+
+    PATH[@OFFSET][+SIZE]      e.g. data/enwik8@50M+1M, wiki_1mb@0+20K
+
+with K/M/G suffixes (powers of 1024, as in the old 1 MB / 10 MB tests);
+PATH may also be the name of a registered corpus.
+"""
+import contextlib
+import io
+import lzma
+import re
+import struct
+import zlib
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Callable, Dict, Optional
+
+ROOT = Path(__file__).resolve().parent.parent
+
+SIZE_SUFFIXES = {'': 1, 'K': 1 << 10, 'M': 1 << 20, 'G': 1 << 30}
+CORPUS_SPEC = re.compile(r'^(?P<path>[^@+]+)(?:@(?P<offset>\d+[KMG]?))?(?:\+(?P<size>\d+[KMG]?))?$', re.I)
+
+
+def parse_size(text: str) -> int:
+    text = text.upper()
+    if text[-1:] in SIZE_SUFFIXES:
+        return int(text[:-1]) * SIZE_SUFFIXES[text[-1]]
+    return int(text)
+
+
+@dataclass
+class Corpus:
+    name: str
+    path: str
+    offset: int = 0
+    size: Optional[int] = None
+    description: str = ""
+
+    def resolve(self) -> Path:
+        path = Path(self.path)
+        return path if path.is_absolute() else ROOT / path
+
+    def available(self) -> bool:
+        path = self.resolve()
+        return path.is_file() and path.stat().st_size > self.offset
+
+    def load(self) -> bytes:
+        with open(self.resolve(), 'rb') as f:
+            f.seek(self.offset)
+            return f.read() if self.size is None else f.read(self.size)
+
+
+@dataclass
+class Compressor:
+    name: str
+    compress: Callable[[bytes], bytes]
+    decompress: Callable[[bytes], bytes]
+    description: str = ""
+
+
+COMPRESSORS: Dict[str, Compressor] = {}
+CORPORA: Dict[str, Corpus] = {}
+
+
+def register_compressor(name: str, compress, decompress, description: str = ""):
+    COMPRESSORS[name] = Compressor(name, compress, decompress, description)
+
+
+def register_corpus(name: str, path: str, offset: int = 0, size: Optional[int] = None,
+                    description: str = ""):
+    CORPORA[name] = Corpus(name, path, offset, size, description)
+
+
+def get_compressor(name: str) -> Compressor:
+    if name not in COMPRESSORS:
+        raise KeyError(f"Unknown compressor {name!r} (registered: {', '.join(COMPRESSORS)})")
+    return COMPRESSORS[name]
+
+
+def get_corpus(spec: str) -> Corpus:
+    """Registered corpus name or PATH[@OFFSET][+SIZE] (PATH may be a corpus name)"""
+    if spec in CORPORA:
+        return CORPORA[spec]
+    m = CORPUS_SPEC.match(spec)
+    if not m:
+        raise KeyError(f"Unknown corpus {spec!r} (registered: {', '.join(CORPORA)})")
+    offset = parse_size(m.group('offset')) if m.group('offset') else 0
+    size = parse_size(m.group('size')) if m.group('size') else None
+    path = m.group('path')
+    if path in CORPORA:
+        base = CORPORA[path]
+        path, offset = base.path, base.offset + offset
+    return Corpus(spec, path, offset, size)
+
+
+# ---- compressor configurations --------------------------------------
+
+def _cm_orders():
+    from context_mixing import OrderModel
+    return [OrderModel()]
+
+
+def _cm_compress(factory):
+    def compress(data: bytes) -> bytes:
+        from context_mixing import ContextMixingCompressor
+        return ContextMixingCompressor(factory).compress(data)
+    return compress
+
+
+def _cm_decompress(factory):
+    def decompress(blob: bytes) -> bytes:
+        from context_mixing import ContextMixingCompressor
+        return ContextMixingCompressor(factory).decompress(blob)
+    return decompress
+
+
+def _dict_cm_compress(data: bytes) -> bytes:
+    """Dictionary transform, then the default CM model set; side info xz-packed"""
+    from context_mixing import ContextMixingCompressor
+    from dictionary_transform import DictionaryTransform, _write_varint
+    from profiler import stage
+
+    transform = DictionaryTransform()
+    with stage('parse'):
+        transform.build(data)
+        encoded, side = transform.encode(data)
+    side = lzma.compress(side, preset=9)
+    out = bytearray()
+    _write_varint(out, len(side))
+    out += side
+    out += ContextMixingCompressor().compress(encoded)
+    return bytes(out)
+
+
+def _dict_cm_decompress(blob: bytes) -> bytes:
+    from context_mixing import ContextMixingCompressor
+    from dictionary_transform import DictionaryTransform, _read_varint
+
+    n, pos = _read_varint(blob, 0)
+    side = lzma.decompress(blob[pos:pos + n])
+    encoded = ContextMixingCompressor().decompress(blob[pos + n:])
+    return DictionaryTransform.decode(encoded, side)
+
+
+class _SequentialRanges:
+    """Frequency-model adapter of ArithmeticEncoder: advances the context after every symbol"""
+
+    def __init__(self, model):
+        self.model = model
+
+    def get_range(self, symbol):
+        result = self.model.get_range(symbol)
+        self.model.update_context(symbol)
+        return result
+
+    def get_total(self):
+        return self.model.get_total()
+
+    def get_symbol(self, offset):
+        return self.model.get_symbol(offset)
+
+
+def _static_order_compress(order):
+    """Semi-static order-N model of the old test_order*_1mb.py scripts (model stored)"""
+    def compress(data: bytes) -> bytes:
+        from arithmetic_coder import ArithmeticEncoder
+        from context_model import ContextModel
+
+        model = ContextModel(order=order)
+        with contextlib.redirect_stdout(io.StringIO()):
+            model.train(data)
+        model.start_encoding()
+        encoded = ArithmeticEncoder(precision_bits=32).encode(list(data), _SequentialRanges(model))
+        serialized = model.serialize()
+        return struct.pack('<II', len(data), len(serialized)) + serialized + encoded
+    return compress
+
+
+def _static_order_decompress(blob: bytes) -> bytes:
+    from arithmetic_coder import ArithmeticEncoder
+    from context_model import ContextModel
+
+    length, model_length = struct.unpack_from('<II', blob)
+    model = ContextModel.deserialize(blob[8:8 + model_length])
+    model.start_encoding()
+    decoded = ArithmeticEncoder(precision_bits=32).decode(blob[8 + model_length:], _SequentialRanges(model), length)
+    return bytes(decoded)
+
+
+register_compressor('zlib', lambda d: zlib.compress(d, 9), zlib.decompress, "zlib level 9 (reference)")
+register_compressor('xz', lambda d: lzma.compress(d, preset=9 | lzma.PRESET_EXTREME), lzma.decompress,
+                    "xz -9e (reference)")
+register_compressor('cm-orders', _cm_compress(_cm_orders), _cm_decompress(_cm_orders),
+                    "context mixing, orders 0-4,6")
+register_compressor('cm-default', _cm_compress(None), _cm_decompress(None),
+                    "context mixing, default_models() (orders, word, sparse, run)")
+register_compressor('cm-dict', _dict_cm_compress, _dict_cm_decompress,
+                    "dictionary transform + cm-default")
+register_compressor('static-order2', _static_order_compress(2), _static_order_decompress,
+                    "semi-static order-2 ContextModel + ArithmeticEncoder, model stored")
+register_compressor('static-order5', _static_order_compress(5), _static_order_decompress,
+                    "semi-static order-5 ContextModel (test_order5_1mb.py)")
+
+# ---- corpora ---------------------------------------------------------
+
+register_corpus('sample', 'data/sample.txt', description="small sanity sample")
+register_corpus('wiki_100k', 'wiki_1mb.txt', size=100 * 1000, description="first 100 KB of wiki_1mb.txt")
+register_corpus('wiki_1mb', 'wiki_1mb.txt', description="wiki_1mb.txt")
+register_corpus('enwik_10mb-1mb', 'data/enwik_10mb', size=1 << 20,
+                description="first 1 MB of enwik_10mb (test_order5_1mb.py, test_order7_1mb.py)")
+register_corpus('enwik_10mb', 'data/enwik_10mb', description="enwik_10mb (test_ultra_10mb.py)")
+register_corpus('enwik8-1mb', 'data/enwik8', size=1 << 20, description="first 1 MB of enwik8")
+register_corpus('enwik8-mid-1mb', 'data/enwik8', offset=50 << 20, size=1 << 20,
+                description="1 MB of enwik8 at offset 50 MB")
+register_corpus('enwik8-10mb', 'data/enwik8', size=10 << 20, description="first 10 MB of enwik8")
+register_corpus('enwik8', 'data/enwik8', description="enwik8")
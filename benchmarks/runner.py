@@ -0,0 +1,151 @@
+"""
+Benchmark runner
+
+Every (compressor, corpus) pair runs in a fresh spawned process so the
+peak RSS reported by getrusage() belongs to that run alone. The result
+file is plain JSON:
+
+    {"meta": {...}, "results": [{compressor, corpus, input_bytes,
+     compressed_bytes, bpc, compress_mb_s, decompress_mb_s,
+     peak_rss_bytes, ...}], "skipped": [{compressor, corpus, reason}],
+     "failed": [{compressor, corpus, reason}]}
+"""
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import subprocess
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from .registry import ROOT, get_compressor, get_corpus
+
+FORMAT_VERSION = 1
+
+
+def peak_rss_bytes() -> int:
+    """Peak resident set size of this process (ru_maxrss is KB on Linux, bytes on macOS)"""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def measure(compressor_name: str, corpus_spec: str, repeat: int = 1) -> Dict:
+    """Compress + decompress once per repeat, verify, keep the fastest times"""
+    compressor = get_compressor(compressor_name)
+    corpus = get_corpus(corpus_spec)
+    data = corpus.load()
+    baseline_rss = peak_rss_bytes()
+
+    compress_time = decompress_time = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        blob = compressor.compress(data)
+        compress_time = min(compress_time, time.perf_counter() - start)
+
+        start = time.perf_counter()
+        restored = compressor.decompress(blob)
+        decompress_time = min(decompress_time, time.perf_counter() - start)
+        if restored != data:
+            raise RuntimeError(f"{compressor_name} on {corpus.name}: round trip FAILED")
+        del restored
+
+    mb = len(data) / 1e6
+    return {
+        'compressor': compressor_name,
+        'corpus': corpus.name,
+        'path': corpus.path,
+        'offset': corpus.offset,
+        'input_bytes': len(data),
+        'compressed_bytes': len(blob),
+        'bpc': len(blob) * 8 / max(1, len(data)),
+        'compress_seconds': compress_time,
+        'decompress_seconds': decompress_time,
+        'compress_mb_s': mb / compress_time if compress_time else 0.0,
+        'decompress_mb_s': mb / decompress_time if decompress_time else 0.0,
+        'baseline_rss_bytes': baseline_rss,
+        'peak_rss_bytes': peak_rss_bytes(),
+        'repeat': repeat,
+    }
+
+
+def git_commit() -> Optional[str]:
+    try:
+        out = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT,
+                             capture_output=True, text=True, timeout=10)
+    except (OSError, subprocess.SubprocessError):
+        return None
+    return out.stdout.strip() or None
+
+
+def run_suite(compressors: List[str], corpora: List[str], repeat: int = 1,
+              isolate: bool = True, log=print) -> Dict:
+    """Runs every compressor on every available corpus"""
+    for name in compressors:
+        get_compressor(name)  # fail early on typos
+
+    started = datetime.now(timezone.utc).isoformat(timespec='seconds')
+    results, skipped, failed = [], [], []
+    context = multiprocessing.get_context('spawn')
+    for spec in corpora:
+        corpus = get_corpus(spec)
+        if not corpus.available():
+            for name in compressors:
+                skipped.append({'compressor': name, 'corpus': corpus.name,
+                                'reason': f"{corpus.path} not found"})
+            log(f"  skip {corpus.name}: {corpus.path} not found")
+            continue
+        for name in compressors:
+            try:
+                if isolate:
+                    with ProcessPoolExecutor(max_workers=1, mp_context=context) as pool:
+                        result = pool.submit(measure, name, spec, repeat).result()
+                else:
+                    result = measure(name, spec, repeat)
+            except Exception as e:
+                failed.append({'compressor': name, 'corpus': corpus.name, 'reason': f"{type(e).__name__}: {e}"})
+                log(f"  FAIL {name} on {corpus.name}: {e}")
+                continue
+            results.append(result)
+            log(format_row(result))
+
+    return {
+        'meta': {
+            'format': FORMAT_VERSION,
+            'timestamp': started,
+            'git_commit': git_commit(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'isolated': isolate,
+            'repeat': repeat,
+        },
+        'results': results,
+        'skipped': skipped,
+        'failed': failed,
+    }
+
+
+HEADER = (f"  {'compressor':<14} {'corpus':<16} {'input':>11} {'output':>11} {'bpc':>6} "
+          f"{'comp MB/s':>9} {'dec MB/s':>9} {'peak RSS':>9}")
+
+
+def format_row(r: Dict) -> str:
+    return (f"  {r['compressor']:<14} {r['corpus']:<16} {r['input_bytes']:>11,} {r['compressed_bytes']:>11,} "
+            f"{r['bpc']:>6.3f} {r['compress_mb_s']:>9.3f} {r['decompress_mb_s']:>9.3f} "
+            f"{r['peak_rss_bytes'] / 2**20:>7.0f}MB")
+
+
+def save_results(results: Dict, path: Path):
+    Path(path).write_text(json.dumps(results, indent=2) + '\n')
+
+
+def load_results(path: Path) -> Dict:
+    results = json.loads(Path(path).read_text())
+    if results.get('meta', {}).get('format') != FORMAT_VERSION:
+        raise ValueError(f"{path} is not a benchmark result file (format {FORMAT_VERSION})")
+    return results
@@ -0,0 +1,279 @@
+#!/usr/bin/env python3
+"""
+Bucketed context table - checksummed slots with a replacement policy
+
+ContextTable is direct-mapped without checksums: two contexts that hash
+to the same slot silently share (and fight over) one counter, and nothing
+is ever evicted. BucketedContextTable stores whole nibbles instead:
+
+    slot     16-bit checksum + the 15 counters of one nibble's bit tree
+             (1 + 2 + 4 + 8), located once per nibble per context input
+    bucket   `ways` consecutive slots (7 by default); a context hashes to
+             one bucket and is found by its checksum
+
+On a miss an empty slot is taken if there is one, else the slot with
+the lowest confidence - the hit count of its first counter, zero once
+the slot has not been touched for STALE_NIBBLES - and the oldest among
+equals. Ages come from 32-bit stamps of nibbles / 16; they wrap after
+2^36 nibbles (32 GB of input), far beyond enwik9. Slots located for the
+current nibble are never the victim, so inputs of the same nibble
+cannot evict each other. ways=1 is plain
+direct-mapped replacement: a mismatching checksum always replaces.
+
+Per-input statistics (lookups, hits, replacements of live slots) are
+kept in TableStats counters, labelled like bit_trace ('order3',
+'word.1', ...), and added to the profiler summary when a profiler is
+running - one report per table configuration, the latest table's, which
+the profiler does not keep alive.
+Everything is a function of the coded bytes, so encoder and decoder
+make identical decisions.
+"""
+import math
+import sys
+import time
+import weakref
+from array import array
+from typing import Dict, List
+
+import profiler
+from bit_trace import input_labels
+from context_mixing import ContextTable, ContextMixingCompressor, PHI32, default_models
+
+SLOT = 16                   # u16 per slot: checksum + 15 counters
+STAMP_SHIFT = 4             # stamps count nibbles / 16
+STAMP_MASK = 0xFFFFFFFF
+STALE_NIBBLES = 1 << 19     # untouched this long -> confidence 0
+_STALE = STALE_NIBBLES >> STAMP_SHIFT
+ENWIK8_SIZE = 10 ** 8
+BUDGETS_MB = (64, 256, 1024)
+
+
+def _nibble_slots():
+    """Counter of partial byte c0 within its nibble's slot (1..15)"""
+    index = [0] * 256
+    for c0 in range(1, 256):
+        known = c0.bit_length() - 1
+        if known < 4:
+            index[c0] = c0
+        else:
+            k = known - 4
+            index[c0] = (1 << k) | (c0 & ((1 << k) - 1))
+    return index
+
+
+NIBBLE_SLOT = _nibble_slots()
+
+
+class TableStats:
+    """Lookups, hits and replacements of live slots per labelled model input"""
+
+    def __init__(self):
+        self.labels: List[str] = []
+        self.ids: Dict[str, int] = {}
+        self.lookups = array('q')
+        self.hits = array('q')
+        self.replaced = array('q')
+
+    def stat_id(self, label: str) -> int:
+        i = self.ids.get(label)
+        if i is None:
+            i = self.ids[label] = len(self.labels)
+            self.labels.append(label)
+            for counters in (self.lookups, self.hits, self.replaced):
+                counters.append(0)
+        return i
+
+    def rows(self):
+        """(label, lookups, hits, replacements) per input"""
+        return [(label, self.lookups[i], self.hits[i], self.replaced[i]) for i, label in enumerate(self.labels)]
+
+    def totals(self):
+        return sum(self.lookups), sum(self.hits), sum(self.replaced)
+
+    def format(self, occupancy=None) -> str:
+        lines = [f"{'input':<12} {'lookups':>12} {'hit rate':>9} {'replaced':>9}", "-" * 45]
+        for label, lookups, hits, replaced in self.rows():
+            if lookups:
+                lines.append(f"{label:<12} {lookups:>12,} {hits / lookups * 100:>8.1f}% "
+                             f"{replaced / lookups * 100:>8.1f}%")
+        lookups, hits, replaced = self.totals()
+        if lookups:
+            line = f"{'all':<12} {lookups:>12,} {hits / lookups * 100:>8.1f}% {replaced / lookups * 100:>8.1f}%"
+            if occupancy is not None:
+                line += f"   occupancy {occupancy * 100:.1f}%"
+            lines.append(line)
+        return "\n".join(lines)
+
+
+class BucketedContextTable(ContextTable):
+    """
+    Counters in checksummed nibble slots, `ways` slots per bucket
+
+    Args:
+        budget_bytes: memory of slots + stamps; the bucket count follows
+        ways: slots per bucket (1 = direct-mapped replacement)
+    """
+
+    bucketed = True
+    nibble_slot = NIBBLE_SLOT
+
+    def __init__(self, budget_bytes=64 * 2**20, ways=7, limit=15):
+        self.ways = ways
+        self.n_buckets = max(1, budget_bytes // ((SLOT * 2 + 4) * ways))
+        n_slots = self.n_buckets * ways
+        self.bits = n_slots.bit_length() - 1
+        self.mask = 0
+        self.limit = limit
+        self.slots = array('H', [0]) * (n_slots * SLOT)
+        self.stamps = array('I', [0]) * n_slots
+        self.fresh = array('H', [0] + [2048 << 4] * (SLOT - 1))
+        self.nibbles = 0
+        self.claimed: List[int] = []
+        self.claim_c0 = 0
+        self.stats = stats = TableStats()
+        self.lookups, self.hits, self.replaced = stats.lookups, stats.hits, stats.replaced
+        # Holds the counters and a weak reference only: tables rebuilt by every
+        # compress() / decompress() replace the report instead of piling up
+        table = weakref.ref(self)
+        profiler.add_report(f"context table ({ways}-way, {self.memory_bytes() / 2**20:,.1f} MB)",
+                            lambda: stats.format(table().occupancy() if table() is not None else None))
+
+    def locate(self, model, c0):
+        """Slot bases of model's contexts for the nibble starting at c0 (1 or 16..31)"""
+        stats = model.__dict__.get('table_stats')
+        if stats is None:
+            stats = model.table_stats = [self.stats.stat_id(label) for label in input_labels([model])[1:]]
+        if c0 != self.claim_c0:
+            self.claim_c0 = c0
+            self.claimed = []
+            self.nibbles += 1
+        hashes = model.hashes
+        if c0 != 1:
+            hashes = [((h + c0 * 0x2C1B3C6D) * PHI32) & 0xFFFFFFFF for h in hashes]
+        find = self.find
+        return [find(h, s) for h, s in zip(hashes, stats)]
+
+    def find(self, h, stat):
+        """Base of the slot holding context hash h, replacing a slot on a miss"""
+        ways = self.ways
+        slots, stamps = self.slots, self.stamps
+        now = (self.nibbles >> STAMP_SHIFT) & STAMP_MASK
+        check = (h & 0xFFFF) or 1
+        first = ((h * self.n_buckets) >> 32) * ways
+        self.lookups[stat] += 1
+        checks = slots[first * SLOT:(first + ways) * SLOT:SLOT]
+        if check in checks:
+            k = first + checks.index(check)
+            stamps[k] = now
+            self.hits[stat] += 1
+            self.claimed.append(k)
+            return k * SLOT
+        victim, best = -1, None
+        claimed = self.claimed
+        for i, c in enumerate(checks):
+            k = first + i
+            if k in claimed:
+                continue
+            if not c:
+                victim, best = k, None
+                break
+            age = (now - stamps[k]) & STAMP_MASK
+            score = (0 if age > _STALE else slots[k * SLOT + 1] & 15) << 16
+            score -= age
+            if best is None or score < best:
+                victim, best = k, score
+        if victim < 0:  # every slot of the bucket is in use this nibble
+            victim = first + min(range(ways), key=lambda i: stamps[first + i])
+        base = victim * SLOT
+        if slots[base]:
+            self.replaced[stat] += 1
+        fresh = self.fresh
+        fresh[0] = check
+        slots[base:base + SLOT] = fresh
+        stamps[victim] = now
+        claimed.append(victim)
+        return base
+
+    def memory_bytes(self):
+        return len(self.slots) * self.slots.itemsize + len(self.stamps) * self.stamps.itemsize
+
+    def occupancy(self) -> float:
+        return sum(1 for c in self.slots[::SLOT] if c) / len(self.stamps)
+
+    def format_stats(self) -> str:
+        return self.stats.format(self.occupancy())
+
+
+def direct_table(budget_bytes):
+    """The default ContextTable (no checksums) at the largest power of two within budget"""
+    return ContextTable(bits=max(1, (budget_bytes // 2).bit_length() - 1))
+
+
+POLICIES = (
+    ('direct, no checksum', direct_table),
+    ('direct-mapped', lambda budget: BucketedContextTable(budget, ways=1)),
+    ('7-way buckets', lambda budget: BucketedContextTable(budget, ways=7)),
+)
+
+
+def compare(data, budgets, policies=POLICIES):
+    """Compresses data with every policy at every budget; verifies round trips; returns the last tables"""
+    tables = {}
+    print(f"{'policy':<20} {'budget':>10} {'bytes':>10} {'bpc':>7} {'KB/s':>7} {'hit rate':>9} {'replaced':>9}")
+    print("-" * 78)
+    for budget in budgets:
+        for name, make_table in policies:
+            made = []
+
+            def factory():
+                made.append(make_table(budget))
+                return default_models(made[-1])
+
+            compressor = ContextMixingCompressor(factory)
+            start = time.perf_counter()
+            blob = compressor.compress(data)
+            elapsed = time.perf_counter() - start
+            if compressor.decompress(blob) != data:
+                raise RuntimeError(f"{name} at {budget:,} bytes: round trip FAILED")
+            table = made[0]
+            rates = f"{'-':>9} {'-':>9}"
+            if isinstance(table, BucketedContextTable):
+                lookups, hits, replaced = table.stats.totals()
+                rates = f"{hits / lookups * 100:>8.1f}% {replaced / lookups * 100:>8.1f}%"
+            print(f"{name:<20} {_size(table.memory_bytes()):>10} {len(blob):>10,} "
+                  f"{len(blob) * 8 / len(data):>7.3f} {len(data) / 1024 / elapsed:>7.1f} {rates}")
+            tables[name] = table
+    return tables
+
+
+def _size(n):
+    return f"{n / 2**20:,.1f} MB" if n >= 1000 * 1024 else f"{n / 1024:,.0f} KB"
+
+
+def main():
+    path = sys.argv[1] if len(sys.argv) > 1 else "wiki_1mb.txt"
+    size = int(sys.argv[2]) if len(sys.argv) > 2 else 100000
+
+    print("=" * 70)
+    print("CONTEXT TABLE REPLACEMENT - direct-mapped vs 7-way buckets")
+    print("=" * 70)
+
+    with open(path, 'rb') as f:
+        data = f.read(size)
+    # Budgets keep the enwik8 ratio of table bytes to input bytes, rounded to
+    # a power of two so the direct table uses all of its budget
+    scale = min(1.0, len(data) / ENWIK8_SIZE)
+    budgets = [1 << round(math.log2(mb * 2**20 * scale)) for mb in BUDGETS_MB]
+    print(f"\nInput: {path}, first {len(data):,} bytes; budgets "
+          f"{', '.join(f'{mb} MB' for mb in BUDGETS_MB)} scaled to the input size\n")
+
+    tables = compare(data, budgets)
+    print(f"\nPer input, 7-way buckets at {_size(budgets[-1])}:")
+    print(tables['7-way buckets'].format_stats())
+
+    print("\n✅ Round trip verified")
+    print("=" * 70)
+
+
+if __name__ == "__main__":
+    main()
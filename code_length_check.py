@@ -0,0 +1,519 @@
+#!/usr/bin/env python3
+"""
+Code-length cross-check: estimated bits vs the real arithmetic coder
+
+ProductionHybridCompressor.compress_hybrid, ProductionOrder6Links
+.compress_all_links and ImprovedFallbackCompressor.compress_improved add
+up -log2(p) or fixed bucket costs (1/3/6 bits for top-1/5/50) and never
+write a bitstream. Sums like that can be unreachable: the bucket costs
+alone break the Kraft inequality (1/2 + 4/8 + 45/64 > 1), escapes to a
+shorter context are free, unknown symbols cost log2(vocab) although they
+are not in the vocabulary.
+
+Here the same trained statistics are coded for real, per channel:
+
+    context distribution (+ escape)  ->  fallback (+ escape)  ->  literal
+
+through ArithmeticEncoder, then decoded again with a fresh copy of the
+model. The report puts next to each other:
+
+    estimated   what the estimator claims (its own cost function)
+    ideal       sum of -log2(freq/total) of the coded events
+    actual      length of the arithmetic coded stream
+
+and CodeLengthMismatch is raised when |actual/estimated - 1| exceeds the
+tolerance, when the decoded channel differs, or when actual is off ideal
+by more than coder overhead. Model/dictionary size is counted on neither
+side, exactly like the estimators do.
+"""
+import argparse
+import contextlib
+import io
+import math
+import re
+import sys
+import time
+from bisect import bisect_right
+from collections import Counter
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Tuple
+
+from arithmetic_coder import ArithmeticEncoder
+
+LINK_PATTERN = re.compile(r'\[\[([^\]|]+)(?:\|([^\]]+))?\]\]')
+
+MAX_LITERAL = 1 << 12  # longest spelled literal in UTF-8 bytes
+CODER_SLACK_BITS = 64  # flush + rounding allowance of ArithmeticEncoder
+
+
+class CodeLengthMismatch(RuntimeError):
+    pass
+
+
+class _Escape:
+    def __repr__(self):
+        return 'ESCAPE'
+
+
+ESCAPE = _Escape()
+
+
+class Distribution:
+    """Integer frequencies over symbols (+ ESCAPE with PPM-C weight = number of symbols)"""
+
+    __slots__ = ('symbols', 'cum', 'total', 'ranges')
+
+    def __init__(self, counts, escape: bool = True):
+        self.symbols = []
+        self.cum = []
+        self.ranges = {}
+        total = 0
+        for symbol, count in counts:
+            if count <= 0:
+                continue
+            self.symbols.append(symbol)
+            self.cum.append(total)
+            self.ranges[symbol] = (total, total + count)
+            total += count
+        if escape:
+            weight = max(1, len(self.symbols))
+            self.symbols.append(ESCAPE)
+            self.cum.append(total)
+            self.ranges[ESCAPE] = (total, total + weight)
+            total += weight
+        self.total = total
+
+    def range(self, symbol):
+        return self.ranges.get(symbol)
+
+    def symbol_at(self, offset):
+        return self.symbols[bisect_right(self.cum, offset) - 1]
+
+
+class CodepointLiteral:
+    """Last resort for single characters: uniform over all Unicode code points"""
+
+    total = 0x110000
+
+    def range(self, symbol):
+        c = ord(symbol)
+        return c, c + 1
+
+    def symbol_at(self, offset):
+        return chr(offset)
+
+
+class SpelledLiteral:
+    """Last resort for strings: UTF-8 length, then every byte, all uniform"""
+
+
+CODEPOINT_LITERAL = CodepointLiteral()
+SPELLED_LITERAL = SpelledLiteral()
+
+
+def spell(symbol: str) -> List[Tuple[int, int, int]]:
+    raw = symbol.encode('utf-8')
+    if len(raw) >= MAX_LITERAL:
+        raise ValueError(f"literal of {len(raw)} bytes is too long to spell")
+    return [(len(raw), len(raw) + 1, MAX_LITERAL)] + [(b, b + 1, 256) for b in raw]
+
+
+# ---- channel models -----------------------------------------------------
+
+class ChannelModel:
+    """
+    What the checker drives, one fresh instance for coding and one for decoding:
+
+        distributions()      distributions for the next symbol, in order; every
+                             one but the last has an ESCAPE entry
+        claimed_bits(symbol) what the estimator charges for the next symbol
+        update(symbol)       symbol coded, move on
+    """
+
+    def distributions(self):
+        raise NotImplementedError()
+
+    def claimed_bits(self, symbol) -> float:
+        raise NotImplementedError()
+
+    def update(self, symbol):
+        raise NotImplementedError()
+
+
+class ContextTextModel(ChannelModel):
+    """
+    Characters from static order-N tables (longest first), then an order-0
+    fallback, then a code point literal. Distributions are cached per context.
+    """
+
+    def __init__(self, tables: List[Tuple[int, dict]], order0, claimed: Callable[[str, str], float]):
+        self.tables = tables
+        self.max_order = max((order for order, _ in tables), default=0)
+        self.order0 = Distribution(order0.items() if hasattr(order0, 'items') else ((c, 1) for c in order0))
+        self.claimed = claimed
+        self.context = ''
+        self.cache: Dict[Tuple[int, str], Distribution] = {}
+
+    def distributions(self):
+        context = self.context
+        for order, table in self.tables:
+            if len(context) < order:
+                continue
+            ctx = context[-order:]
+            dist = self.cache.get((order, ctx))
+            if dist is None:
+                counts = table.get(ctx)
+                if not counts:
+                    continue
+                dist = self.cache[(order, ctx)] = Distribution(counts.items())
+            yield dist
+        yield self.order0
+        yield CODEPOINT_LITERAL
+
+    def claimed_bits(self, symbol) -> float:
+        return self.claimed(symbol, self.context)
+
+    def update(self, symbol):
+        self.context = (self.context + symbol)[-self.max_order:]
+
+
+class LinkModel(ChannelModel):
+    """Link targets: order-6 and order-2 link contexts, vocabulary frequency, spelled literal"""
+
+    def __init__(self, order6: dict, order2: dict, vocab: Counter, claimed: Callable[[str, list], float]):
+        self.tables = ((6, order6), (2, order2))
+        self.vocab = Distribution(vocab.items())
+        self.claimed = claimed
+        self.history: List[str] = []
+        self.cache: Dict[tuple, Distribution] = {}
+
+    def distributions(self):
+        for order, table in self.tables:
+            if len(self.history) < order:
+                continue
+            ctx = tuple(self.history[-order:])
+            dist = self.cache.get(ctx)
+            if dist is None:
+                counts = table.get(ctx)
+                if not counts:
+                    continue
+                dist = self.cache[ctx] = Distribution(counts.items())
+            yield dist
+        yield self.vocab
+        yield SPELLED_LITERAL
+
+    def claimed_bits(self, symbol) -> float:
+        return self.claimed(symbol, self.history)
+
+    def update(self, symbol):
+        self.history.append(symbol)
+
+
+# ---- checker -------------------------------------------------------------
+
+@dataclass
+class ChannelResult:
+    estimator: str
+    channel: str
+    symbols: int
+    estimated_bits: float
+    ideal_bits: float
+    actual_bytes: int
+    escapes: int
+    literals: int
+    encode_seconds: float
+    decode_seconds: float
+    round_trip: bool
+
+    @property
+    def divergence(self) -> float:
+        """actual / estimated - 1 (positive: the estimate was too optimistic)"""
+        return self.actual_bytes * 8 / self.estimated_bits - 1 if self.estimated_bits else 0.0
+
+
+class _ReplayRanges:
+    """Encoder side: the events are the (low, high, total) triples themselves"""
+
+    @staticmethod
+    def get_range(event):
+        return event
+
+
+class _DecodeStepper:
+    """Decoder side frequency model: walks model.distributions() like the encoder did"""
+
+    def __init__(self, model: ChannelModel):
+        self.model = model
+        self.output = []
+        self.dists = None
+        self.dist = None
+        self.spelled = None  # [remaining bytes or None before the length, bytearray]
+
+    def _enter(self, dist):
+        self.dist = dist
+        if dist is SPELLED_LITERAL:
+            self.spelled = [None, bytearray()]
+
+    def _finish(self, symbol):
+        self.model.update(symbol)
+        self.output.append(symbol)
+        self.dist = self.spelled = None
+
+    def get_total(self):
+        if self.dist is None:
+            self.dists = iter(self.model.distributions())
+            self._enter(next(self.dists))
+        if self.spelled is not None:
+            return MAX_LITERAL if self.spelled[0] is None else 256
+        return self.dist.total
+
+    def get_symbol(self, offset):
+        if self.spelled is not None:
+            return offset
+        return self.dist.symbol_at(offset)
+
+    def get_range(self, symbol):
+        spelled = self.spelled
+        if spelled is not None:
+            if spelled[0] is None:
+                spelled[0] = symbol
+                event = (symbol, symbol + 1, MAX_LITERAL)
+            else:
+                spelled[1].append(symbol)
+                spelled[0] -= 1
+                event = (symbol, symbol + 1, 256)
+            if spelled[0] == 0:
+                self._finish(spelled[1].decode('utf-8'))
+            return event
+
+        low, high = self.dist.range(symbol)
+        event = (low, high, self.dist.total)
+        if symbol is ESCAPE:
+            self._enter(next(self.dists))
+        else:
+            self._finish(symbol)
+        return event
+
+
+class CodeLengthChecker:
+    """
+    Codes channels with the real coder and compares with the estimates
+
+    Args:
+        tolerance: allowed |actual / estimated - 1| per channel
+    """
+
+    def __init__(self, tolerance: float = 0.02):
+        self.tolerance = tolerance
+        self.results: List[ChannelResult] = []
+
+    def check_channel(self, estimator: str, channel: str, symbols: list,
+                      make_model: Callable[[], ChannelModel]) -> ChannelResult:
+        start = time.perf_counter()
+        model = make_model()
+        events = []
+        append = events.append
+        estimated = ideal = 0.0
+        escapes = literals = 0
+        for symbol in symbols:
+            estimated += model.claimed_bits(symbol)
+            for dist in model.distributions():
+                if dist is SPELLED_LITERAL:
+                    spelled = spell(symbol)
+                    events.extend(spelled)
+                    ideal += sum(math.log2(total) for _, _, total in spelled)
+                    literals += 1
+                    break
+                r = dist.range(symbol)
+                if r is None:
+                    r = dist.ranges[ESCAPE]
+                    escapes += 1
+                    append((r[0], r[1], dist.total))
+                    ideal += math.log2(dist.total / (r[1] - r[0]))
+                    continue
+                append((r[0], r[1], dist.total))
+                ideal += math.log2(dist.total / (r[1] - r[0]))
+                if dist is CODEPOINT_LITERAL:
+                    literals += 1
+                break
+            model.update(symbol)
+        coded = ArithmeticEncoder(precision_bits=32).encode(events, _ReplayRanges()) if events else b''
+        encode_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        stepper = _DecodeStepper(make_model())
+        if events:
+            ArithmeticEncoder(precision_bits=32).decode(coded, stepper, len(events))
+        decode_time = time.perf_counter() - start
+
+        result = ChannelResult(estimator, channel, len(symbols), estimated, ideal, len(coded),
+                               escapes, literals, encode_time, decode_time, stepper.output == list(symbols))
+        self.results.append(result)
+        return result
+
+    def failures(self) -> List[str]:
+        problems = []
+        for r in self.results:
+            name = f"{r.estimator}/{r.channel}"
+            if not r.round_trip:
+                problems.append(f"{name}: round trip FAILED")
+            if r.actual_bytes * 8 > r.ideal_bits + CODER_SLACK_BITS + r.ideal_bits * 1e-4:
+                problems.append(f"{name}: coder output {r.actual_bytes * 8:,} bits vs ideal {r.ideal_bits:,.0f}")
+            if abs(r.divergence) > self.tolerance:
+                problems.append(f"{name}: estimated {r.estimated_bits / 8:,.0f} bytes, "
+                                f"actual {r.actual_bytes:,} bytes ({r.divergence * 100:+.1f}%)")
+        return problems
+
+    def verify(self):
+        """Raises CodeLengthMismatch listing every failed check"""
+        problems = self.failures()
+        if problems:
+            raise CodeLengthMismatch("code length check failed:\n  " + "\n  ".join(problems))
+
+
+# ---- the three estimators -------------------------------------------------
+
+def split_link_channels(text: str) -> Tuple[str, List[str], int]:
+    """
+    The split compress_hybrid()/compress_improved() use: text outside
+    [[...]] and the link targets. Returns (text, targets, dropped chars) -
+    the |label part of piped links is coded by neither channel.
+    """
+    pieces, targets = [], []
+    pos = dropped = 0
+    for m in LINK_PATTERN.finditer(text):
+        pieces.append(text[pos:m.start()])
+        targets.append(m.group(1))
+        if m.group(2):
+            dropped += len(m.group(2))
+        pos = m.end()
+    pieces.append(text[pos:])
+    return ''.join(pieces), targets, dropped
+
+
+def _quiet(fn, *args):
+    with contextlib.redirect_stdout(io.StringIO()):
+        return fn(*args)
+
+
+def check_hybrid(checker: CodeLengthChecker, train: str, test: str):
+    """ProductionHybridCompressor: order-5 text + order-6/order-2 links"""
+    from production_hybrid_compressor import ProductionHybridCompressor
+
+    compressor = ProductionHybridCompressor()
+    _quiet(compressor.train, train, len(train))
+    text, links, dropped = split_link_channels(test)
+
+    def text_claim(char, context):
+        return compressor.encode_text_char(char, context[-5:]) if len(context) >= 5 else 8
+
+    checker.check_channel('hybrid', 'text', list(text), lambda: ContextTextModel(
+        [(5, compressor.text_model)], sorted(compressor.char_vocab), text_claim))
+    checker.check_channel('hybrid', 'links', links, lambda: LinkModel(
+        compressor.link_order6, compressor.link_order2, compressor.link_vocab, compressor.encode_link))
+    return dropped
+
+
+def check_order6_links(checker: CodeLengthChecker, train: str, test: str):
+    """ProductionOrder6Links: trains and evaluates on the same links, like compress_all_links()"""
+    from production_order6_links import ProductionOrder6Links
+
+    compressor = ProductionOrder6Links()
+    compressor.train(test)
+    checker.check_channel('order6_links', 'links', compressor.links, lambda: LinkModel(
+        compressor.order6_model, compressor.order2_model, compressor.link_vocab,
+        lambda link, history: compressor.encode_link(link, history)[0]))
+    return 0
+
+
+def check_cascading(checker: CodeLengthChecker, train: str, test: str):
+    """ImprovedFallbackCompressor: order-5..2 cascade + order-0 text, order-6 links"""
+    from improved_fallback_model import ImprovedFallbackCompressor
+
+    compressor = ImprovedFallbackCompressor()
+    _quiet(compressor.train, train, len(train))
+    text, links, dropped = split_link_channels(test)
+    vocab_bits = math.log2(max(2, len(compressor.link_vocab)))
+
+    def link_claim(target, history):
+        # compress_improved(): bucket cost if the order-6 context exists, else log2(vocab)
+        if len(history) >= 6:
+            ctx = tuple(history[-6:])
+            if ctx in compressor.link_order6:
+                candidates = [l for l, _ in compressor.link_order6[ctx].most_common()]
+                if target in candidates:
+                    pos = candidates.index(target)
+                    return 1 if pos == 0 else 3 if pos < 5 else 6 if pos < 50 else vocab_bits
+        return vocab_bits
+
+    tables = [(5, compressor.text_order5), (4, compressor.text_order4),
+              (3, compressor.text_order3), (2, compressor.text_order2)]
+    checker.check_channel('cascading', 'text', list(text), lambda: ContextTextModel(
+        tables, compressor.text_order1,
+        lambda char, context: compressor.encode_char_cascading(char, context)[0]))
+    checker.check_channel('cascading', 'links', links, lambda: LinkModel(
+        compressor.link_order6, compressor.link_order2, compressor.link_vocab, link_claim))
+    return dropped
+
+
+ESTIMATORS = {
+    'hybrid': check_hybrid,
+    'order6_links': check_order6_links,
+    'cascading': check_cascading,
+}
+
+
+def format_results(results: List[ChannelResult]) -> str:
+    lines = [f"{'estimator':<13} {'channel':<7} {'symbols':>9} {'estimated':>11} {'ideal':>11} "
+             f"{'actual':>11} {'diff':>8} {'esc':>8} {'lit':>6}  round trip",
+             "-" * 100]
+    for r in results:
+        lines.append(f"{r.estimator:<13} {r.channel:<7} {r.symbols:>9,} {r.estimated_bits / 8:>11,.0f} "
+                     f"{r.ideal_bits / 8:>11,.0f} {r.actual_bytes:>11,} {r.divergence * 100:>+7.1f}% "
+                     f"{r.escapes:>8,} {r.literals:>6,}  {'ok' if r.round_trip else 'FAILED'}")
+    return "\n".join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Estimated vs real arithmetic-coded code lengths")
+    parser.add_argument('input', nargs='?', default='wiki_1mb.txt')
+    parser.add_argument('--train', type=int, default=500000, help="bytes used to train the models")
+    parser.add_argument('--size', type=int, default=500000, help="bytes checked after the training part")
+    parser.add_argument('--tolerance', type=float, default=0.02, help="allowed |actual/estimated - 1|")
+    parser.add_argument('--estimators', default=','.join(ESTIMATORS))
+    args = parser.parse_args()
+
+    print("=" * 70)
+    print("CODE LENGTH CHECK - estimators vs the real arithmetic coder")
+    print("=" * 70)
+
+    with open(args.input, 'rb') as f:
+        data = f.read(args.train + args.size)
+    train = data[:args.train].decode('utf-8', errors='ignore')
+    test = data[args.train:].decode('utf-8', errors='ignore')
+    print(f"\nInput: {args.input}, train {args.train:,} bytes, check {len(data) - args.train:,} bytes\n")
+
+    checker = CodeLengthChecker(args.tolerance)
+    start = time.perf_counter()
+    for name in args.estimators.split(','):
+        dropped = ESTIMATORS[name](checker, train, test)
+        if dropped:
+            print(f"  {name}: {dropped:,} chars of piped link labels are coded by neither channel")
+    elapsed = time.perf_counter() - start
+
+    print()
+    print(format_results(checker.results))
+    coding = sum(r.encode_seconds + r.decode_seconds for r in checker.results)
+    print(f"\nTime: {elapsed:.1f} s total, {coding:.1f} s coding + decoding")
+
+    problems = checker.failures()
+    if not problems:
+        print("✅ Estimates match the coded streams, round trips verified")
+        print("=" * 70)
+        return 0
+    print("=" * 70)
+    checker.verify()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
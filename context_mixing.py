@@ -0,0 +1,492 @@
+#!/usr/bin/env python3
+"""
+Context mixing engine - bitwise coder for the text channel
+
+Every model hashes its contexts once per byte and predicts each of the
+8 bits from adaptive counters in a hashed table. The stretched
+predictions go to a logistic mixer and the mixed probability drives
+BinaryArithmeticEncoder. Encoder and decoder run the exact same model
+code, so everything here is lossless by construction.
+"""
+import math
+import operator
+import struct
+import sys
+import time
+from array import array
+
+from arithmetic_coder import BinaryArithmeticEncoder, BinaryArithmeticDecoder
+from profiler import active as active_profiler
+
+
+def _build_tables():
+    """stretch(p) = ln(p/(1-p)) and its inverse squash() on 12-bit fixed point"""
+    squash_table = array('H')
+    for x in range(-2048, 2048):
+        v = int(4096 / (1 + math.exp(-x / 256)))
+        squash_table.append(min(max(v, 1), 4095))
+
+    stretch_table = array('h', [0]) * 4096
+    pi = 0
+    for x in range(-2047, 2048):
+        v = squash_table[x + 2048]
+        for j in range(pi, v + 1):
+            stretch_table[j] = x
+        pi = max(pi, v + 1)
+    for j in range(pi, 4096):
+        stretch_table[j] = 2047
+
+    return squash_table, stretch_table
+
+
+SQUASH, STRETCH = _build_tables()
+
+# Adaptation rate per hit count: 1/(n+1.5) in 16-bit fixed point
+RATE = [int(65536 / (n + 1.5)) for n in range(16)]
+
+PHI32 = 0x9E3779B1
+
+
+def squash(x):
+    """Logistic function, x in stretch domain -> 12-bit probability"""
+    if x > 2047:
+        x = 2047
+    elif x < -2047:
+        x = -2047
+    return SQUASH[x + 2048]
+
+
+def _hash32(value, salt):
+    h = (value * PHI32 + salt * 0x85EBCA77) & 0xFFFFFFFF
+    h = ((h ^ (h >> 15)) * 0x2C1B3C6D) & 0xFFFFFFFF
+    return h ^ (h >> 13)
+
+
+def hash_context(value, salt):
+    """
+    32-bit hash of an integer context (salt separates context families)
+
+    Values wider than 32 bits are hashed 32 bits at a time, each piece
+    folded into the hash of the ones below it, so every bit counts.
+    """
+    h = _hash32(value & 0xFFFFFFFF, salt)
+    value >>= 32
+    while value:
+        h = _hash32((value & 0xFFFFFFFF) ^ h, salt)
+        value >>= 32
+    return h
+
+
+class ContextTable:
+    """
+    Hashed table of adaptive bit counters, shared by any number of contexts
+
+    Each slot is 16 bits: 12-bit probability and a 4-bit hit count that
+    sets the adaptation rate (fast while a context is young, slow later).
+    Memory is fixed at 2 bytes * 2^bits no matter how much data is seen.
+    """
+
+    def __init__(self, bits=22, limit=15):
+        self.bits = bits
+        self.mask = (1 << bits) - 1
+        self.limit = limit
+        self.slots = array('H', [2048 << 4]) * (1 << bits)
+
+    def index(self, context_hash, c0):
+        """Slot of bit context c0 (1..255, partial byte) within a byte context"""
+        return (context_hash + c0 * PHI32) & self.mask
+
+    def update(self, indices, bit):
+        """Move the counters at indices towards the coded bit"""
+        slots = self.slots
+        limit = self.limit
+        for i in indices:
+            s = slots[i]
+            p = s >> 4
+            n = s & 15
+            if bit:
+                p += ((4096 - p) * RATE[n]) >> 16
+                if p > 4095:
+                    p = 4095
+            else:
+                p -= (p * RATE[n]) >> 16
+                if p < 1:
+                    p = 1
+            if n < limit:
+                n += 1
+            slots[i] = (p << 4) | n
+
+    def memory_bytes(self):
+        return len(self.slots) * self.slots.itemsize
+
+
+class HashedContextModel:
+    """
+    Base class of the text models fed to the mixer
+
+    Model interface (what ContextMixingCompressor calls):
+        n_inputs             - number of stretched predictions per bit
+        predict(c0, inputs)  - append n_inputs predictions for partial byte c0
+        update(bit)          - learn the coded bit
+        update_byte(byte)    - byte finished, compute the next byte contexts
+
+    Subclasses only have to fill self.hashes in update_byte(); lookups and
+    counter updates in the (possibly shared) ContextTable are done here.
+    """
+
+    name = 'hashed'
+
+    def __init__(self, n_contexts, table=None, table_bits=22):
+        self.table = table if table is not None else ContextTable(table_bits)
+        self.n_inputs = n_contexts
+        self.hashes = [hash_context(0, i) for i in range(n_contexts)]
+        self.indices = []
+        self.bases = []
+        if getattr(self.table, 'bucketed', False):
+            self.predict = self.predict_bucketed
+
+    def predict(self, c0, inputs):
+        slots = self.table.slots
+        mask = self.table.mask
+        offset = c0 * PHI32
+        self.indices = indices = [(h + offset) & mask for h in self.hashes]
+        inputs.extend([STRETCH[slots[i] >> 4] for i in indices])
+
+    def predict_bucketed(self, c0, inputs):
+        """predict() on a bucket_table.BucketedContextTable: slots are located once per nibble"""
+        table = self.table
+        if c0 == 1 or 16 <= c0 < 32:
+            self.bases = table.locate(self, c0)
+        slots = table.slots
+        j = table.nibble_slot[c0]
+        self.indices = indices = [base + j for base in self.bases]
+        inputs.extend([STRETCH[slots[i] >> 4] for i in indices])
+
+    def update(self, bit):
+        self.table.update(self.indices, bit)
+
+    def update_byte(self, byte):
+        raise NotImplementedError()
+
+
+class OrderModel(HashedContextModel):
+    """Direct Order-N contexts (N = 0..8) from a rolling 64-bit history"""
+
+    name = 'order'
+
+    def __init__(self, orders=(0, 1, 2, 3, 4, 6), table=None, table_bits=22):
+        super().__init__(len(orders), table, table_bits)
+        self.orders = tuple(orders)
+        self.masks = [(1 << (8 * k)) - 1 for k in self.orders]
+        self.history = 0
+        self.update_byte_history(0)
+
+    def update_byte_history(self, byte):
+        self.history = ((self.history << 8) | byte) & 0xFFFFFFFFFFFFFFFF
+        h = self.history
+        self.hashes = [hash_context(h & mask, k + 1) for k, mask in zip(self.orders, self.masks)]
+
+    def update_byte(self, byte):
+        self.update_byte_history(byte)
+
+
+class Mixer:
+    """
+    Logistic mixer (single layer neural net over stretched probabilities)
+
+    One weight set per selector context - the partial byte c0 by default.
+    """
+
+    def __init__(self, n_inputs, n_contexts=256, learning_rate=0.000015, init_weight=0.15):
+        self.n_inputs = n_inputs
+        self.learning_rate = learning_rate / 4096  # error in probability units
+        self.weights = [[init_weight] * n_inputs for _ in range(n_contexts)]
+        self.inputs = []
+        self.context = 0
+        self.pr = 2048
+
+    def mix(self, inputs, context):
+        self.inputs = inputs
+        self.context = context
+        dot = sum(map(operator.mul, self.weights[context], inputs))
+        self.pr = squash(int(dot))
+        return self.pr
+
+    @staticmethod
+    def strongest(weights, inputs, bit):
+        """Index of the input that pushed a mix hardest towards bit"""
+        products = list(map(operator.mul, weights, inputs))
+        return products.index(max(products) if bit else min(products))
+
+    def update(self, bit):
+        err = ((bit << 12) - self.pr) * self.learning_rate
+        if err:
+            w = self.weights[self.context]
+            self.weights[self.context] = [wi + err * xi for wi, xi in zip(w, self.inputs)]
+
+
+def default_models(table=None):
+    """Model set of the text channel; table defaults to a direct-mapped 2^24-slot ContextTable"""
+    from word_model import WordModel
+    from sparse_model import SparseModel
+    from run_model import RunModel
+
+    if table is None:
+        table = ContextTable(bits=24)
+    return [OrderModel(table=table), WordModel(table=table), SparseModel(table=table), RunModel()]
+
+
+class ContextMixingCompressor:
+    """
+    Bitwise context mixing compressor
+
+    Args:
+        model_factory: callable returning a fresh list of models; it is
+            called once for compression and once for decompression so
+            both sides start from identical state
+        tracer: optional bit_trace.BitTracer; compress() then records the
+            cost of every byte (the untraced loop is not touched)
+        profiler: optional profiler.Profiler with timers; defaults to the
+            process-wide one (CM_PROFILE / --profile), if any
+    """
+
+    MAGIC = b'CM01'
+
+    def __init__(self, model_factory=None, learning_rate=0.000015, tracer=None, profiler=None):
+        self.model_factory = model_factory or default_models
+        self.learning_rate = learning_rate
+        self.tracer = tracer
+        self.profiler = profiler
+        self.models = []
+        self.mixer = None
+
+    def reset(self):
+        self.models = self.model_factory()
+        n_inputs = sum(m.n_inputs for m in self.models) + 1
+        self.mixer = Mixer(n_inputs, learning_rate=self.learning_rate)
+
+    def predict(self, c0):
+        inputs = [256]  # bias
+        for model in self.models:
+            model.predict(c0, inputs)
+        return self.mixer.mix(inputs, c0)
+
+    def update(self, bit):
+        self.mixer.update(bit)
+        for model in self.models:
+            model.update(bit)
+
+    def update_byte(self, byte):
+        for model in self.models:
+            model.update_byte(byte)
+
+    def compress(self, data):
+        if self.tracer is not None:
+            return self.compress_traced(data)
+        self.reset()
+        encoder = BinaryArithmeticEncoder()
+        self.encode(data, encoder)
+        return self.MAGIC + struct.pack('<I', len(data)) + encoder.flush()
+
+    def _timers(self):
+        profiler = self.profiler or active_profiler()
+        return profiler if profiler is not None and profiler.timers else None
+
+    def encode(self, data, encoder):
+        """Code data with the current model state (compress() minus reset/header/flush)"""
+        profiler = self._timers()
+        if profiler is not None:
+            return self.encode_profiled(data, encoder, profiler)
+        predict = self.predict
+        update = self.update
+
+        for byte in data:
+            c0 = 1
+            for j in range(7, -1, -1):
+                bit = (byte >> j) & 1
+                encoder.encode_bit(bit, predict(c0))
+                update(bit)
+                c0 = (c0 << 1) | bit
+            self.update_byte(byte)
+
+    def encode_profiled(self, data, encoder, profiler):
+        """encode() with predict / mix / code / update timed per bit"""
+        from profiler import PREDICT, MIX, CODE, UPDATE
+
+        ns = time.perf_counter_ns
+        totals = profiler.ns
+        models = self.models
+        mix = self.mixer.mix
+        update = self.update
+        update_byte = self.update_byte
+        encode_bit = encoder.encode_bit
+
+        for byte in data:
+            c0 = 1
+            for j in range(7, -1, -1):
+                bit = (byte >> j) & 1
+                t0 = ns()
+                inputs = [256]
+                for model in models:
+                    model.predict(c0, inputs)
+                t1 = ns()
+                p = mix(inputs, c0)
+                t2 = ns()
+                encode_bit(bit, p)
+                t3 = ns()
+                update(bit)
+                t4 = ns()
+                totals[PREDICT] += t1 - t0
+                totals[MIX] += t2 - t1
+                totals[CODE] += t3 - t2
+                totals[UPDATE] += t4 - t3
+                c0 = (c0 << 1) | bit
+            t0 = ns()
+            update_byte(byte)
+            totals[UPDATE] += ns() - t0
+
+        bits = 8 * len(data)
+        for stage in (PREDICT, MIX, CODE, UPDATE):
+            profiler.calls[stage] += bits
+
+    def compress_traced(self, data, channel='text'):
+        """compress() that reports (cost, dominant mixer input) per byte to the tracer"""
+        from bit_trace import BIT_COST, input_labels
+
+        self.reset()
+        tracer = self.tracer
+        record = tracer.begin(channel, input_labels(self.models), data)
+        encoder = BinaryArithmeticEncoder()
+        predict = self.predict
+        update = self.update
+        mixer = self.mixer
+
+        for byte in data:
+            c0 = 1
+            cost = 0.0
+            worst = -1.0
+            for j in range(7, -1, -1):
+                bit = (byte >> j) & 1
+                p = predict(c0)
+                encoder.encode_bit(bit, p)
+                bit_cost = BIT_COST[p if bit else 4096 - p]
+                cost += bit_cost
+                if bit_cost > worst:
+                    # update() replaces the weight list, so these stay as mixed
+                    worst = bit_cost
+                    weights, inputs, worst_bit = mixer.weights[c0], mixer.inputs, bit
+                update(bit)
+                c0 = (c0 << 1) | bit
+            self.update_byte(byte)
+            record(byte, Mixer.strongest(weights, inputs, worst_bit), cost)
+
+        tracer.end()
+        return self.MAGIC + struct.pack('<I', len(data)) + encoder.flush()
+
+    def decompress(self, blob):
+        if blob[:4] != self.MAGIC:
+            raise ValueError("Not a context mixing stream")
+        length = struct.unpack('<I', blob[4:8])[0]
+
+        self.reset()
+        decoder = BinaryArithmeticDecoder(blob, 8)
+        profiler = self._timers()
+        if profiler is not None:
+            return self.decode_profiled(decoder, length, profiler)
+        predict = self.predict
+        update = self.update
+        out = bytearray()
+
+        for _ in range(length):
+            c0 = 1
+            while c0 < 256:
+                bit = decoder.decode_bit(predict(c0))
+                update(bit)
+                c0 = (c0 << 1) | bit
+            byte = c0 & 0xFF
+            out.append(byte)
+            self.update_byte(byte)
+
+        return bytes(out)
+
+    def decode_profiled(self, decoder, length, profiler):
+        """decompress() loop with predict / mix / decode / update timed per bit"""
+        from profiler import PREDICT, MIX, DECODE, UPDATE
+
+        ns = time.perf_counter_ns
+        totals = profiler.ns
+        models = self.models
+        mix = self.mixer.mix
+        update = self.update
+        decode_bit = decoder.decode_bit
+        out = bytearray()
+
+        for _ in range(length):
+            c0 = 1
+            while c0 < 256:
+                t0 = ns()
+                inputs = [256]
+                for model in models:
+                    model.predict(c0, inputs)
+                t1 = ns()
+                p = mix(inputs, c0)
+                t2 = ns()
+                bit = decode_bit(p)
+                t3 = ns()
+                update(bit)
+                t4 = ns()
+                totals[PREDICT] += t1 - t0
+                totals[MIX] += t2 - t1
+                totals[DECODE] += t3 - t2
+                totals[UPDATE] += t4 - t3
+                c0 = (c0 << 1) | bit
+            byte = c0 & 0xFF
+            out.append(byte)
+            t0 = ns()
+            self.update_byte(byte)
+            totals[UPDATE] += ns() - t0
+
+        bits = 8 * length
+        for stage in (PREDICT, MIX, DECODE, UPDATE):
+            profiler.calls[stage] += bits
+        return bytes(out)
+
+
+def benchmark(data, model_factory, label):
+    """Compress + decompress, verify round trip, return (size, bpc, KB/s)"""
+    compressor = ContextMixingCompressor(model_factory)
+
+    start = time.time()
+    blob = compressor.compress(data)
+    elapsed = time.time() - start
+
+    restored = compressor.decompress(blob)
+    if restored != data:
+        raise RuntimeError(f"{label}: round trip FAILED")
+
+    bpc = (len(blob) * 8) / len(data)
+    speed = len(data) / 1024 / elapsed
+    print(f"  {label:<28} {len(blob):>9,} bytes  {bpc:.3f} bpc  {speed:6.1f} KB/s")
+    return len(blob), bpc, speed
+
+
+def main():
+    size = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+
+    print("=" * 70)
+    print("CONTEXT MIXING - text channel")
+    print("=" * 70)
+
+    with open("wiki_1mb.txt", 'rb') as f:
+        data = f.read(size)
+    print(f"\nInput: wiki_1mb.txt, first {len(data):,} bytes\n")
+
+    benchmark(data, lambda: [OrderModel()], "orders 0-4,6")
+    benchmark(data, default_models, "orders + word model")
+
+    print("\n✅ Round trip verified")
+    print("=" * 70)
+
+
+if __name__ == "__main__":
+    main()
@@ -25,8 +25,14 @@ class ContextModel:
         # Stan dla sekwencyjnego kodowania
         self.current_context = b''
         
-    def train(self, data):
-        """Trenuje model na danych"""
+    def train(self, data, memory=None):
+        """
+        Trenuje model na danych
+
+        Args:
+            memory: opcjonalny memory_budget.MemoryManager - tick() po każdym
+                symbolu, przycina konteksty po przekroczeniu budżetu
+        """
         print(f"    Trening modelu Order-{self.order}...")
         
         # Konwersja do bytes jeśli potrzeba
@@ -46,6 +52,9 @@ class ContextModel:
             # Statystyki globalne
             self.global_counts[symbol] += 1
             self.total_global += 1
+            
+            if memory is not None:
+                memory.tick()
         
         # Statystyki
         num_contexts = len(self.contexts)
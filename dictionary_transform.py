@@ -0,0 +1,399 @@
+#!/usr/bin/env python3
+"""
+Capital conversion + word dictionary transform (HP-2017 / STARLIT style)
+
+Two reversible steps applied together in one streaming pass:
+
+1. Capital escapes: "Paris" -> CAP "paris", "NATO" -> UPPER "nato", so
+   the context models see one spelling per word.
+2. Word dictionary: frequent lowercase words are replaced by 1-3 byte
+   codewords. The dictionary is built from the corpus word frequencies
+   and stored in an array-backed trie (O(word length) lookup).
+
+Codewords and flags live in bytes that (almost) never occur in enwik:
+control bytes and the bytes that are invalid in UTF-8. Any input
+occurrence of a reserved byte is escaped, so every input round trips.
+\x01 and \x02 stay free - simplified_transforms uses them for dashes.
+"""
+import re
+import sys
+import time
+from array import array
+from collections import Counter
+from pathlib import Path
+from typing import List, Tuple
+
+MAGIC = b'WDT1'
+
+CAP = 0x03
+UPPER = 0x04
+ESC = 0x05
+ONE_BYTE_LEADS = bytes([0x00, 0x06, 0x07, 0x08, 0x0B, 0x0C] + list(range(0x0E, 0x20)))  # 24 codes
+TWO_BYTE_LEADS = bytes([0xC0, 0xC1] + list(range(0xF5, 0xFD)))                          # 2,560 codes
+THREE_BYTE_LEADS = bytes([0xFD, 0xFE, 0xFF])                                           # 196,608 codes
+RESERVED = bytes([CAP, UPPER, ESC]) + ONE_BYTE_LEADS + TWO_BYTE_LEADS + THREE_BYTE_LEADS
+
+MAX_WORDS = len(ONE_BYTE_LEADS) + len(TWO_BYTE_LEADS) * 256 + len(THREE_BYTE_LEADS) * 65536
+
+
+def _char_class(values: bytes) -> bytes:
+    return b'[' + b''.join(re.escape(bytes((v,))) for v in values) + b']'
+
+
+WORD_PATTERN = re.compile(rb'[A-Za-z]+')
+ENCODE_PATTERN = re.compile(rb'[A-Za-z]+|' + _char_class(RESERVED))
+_CODE = (_char_class(ONE_BYTE_LEADS) + b'|' + _char_class(TWO_BYTE_LEADS) + b'.|'
+         + _char_class(THREE_BYTE_LEADS) + b'..')
+DECODE_PATTERN = re.compile(
+    re.escape(bytes((ESC,))) + b'(.)'
+    + b'|(' + _char_class(bytes((CAP, UPPER))) + b')(?:(' + _CODE + b')|([a-z]+))'
+    + b'|(' + _CODE + b')',
+    re.S,
+)
+
+
+_LETTERS = frozenset(b'ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz')
+
+
+def _word_boundary(data: bytes, start: int, end: int) -> int:
+    """
+    Last cut in (start, end] that does not split a word - a byte past the
+    end of data counts as a letter - or end if the word fills the range
+    """
+    if end < len(data) and data[end] not in _LETTERS:
+        return end
+    cut = end
+    while cut > start and data[cut - 1] in _LETTERS:
+        cut -= 1
+    return cut if cut > start else end
+
+
+def _write_varint(out: bytearray, n: int):
+    while n >= 0x80:
+        out.append((n & 0x7F) | 0x80)
+        n >>= 7
+    out.append(n)
+
+
+def _read_varint(buf, pos: int) -> Tuple[int, int]:
+    n = 0
+    shift = 0
+    while True:
+        b = buf[pos]
+        pos += 1
+        n |= (b & 0x7F) << shift
+        if b < 0x80:
+            return n, pos
+        shift += 7
+
+
+def codeword(index: int) -> bytes:
+    """Codeword of dictionary entry index (most frequent words get 1 byte)"""
+    if index < len(ONE_BYTE_LEADS):
+        return bytes((ONE_BYTE_LEADS[index],))
+    index -= len(ONE_BYTE_LEADS)
+    if index < len(TWO_BYTE_LEADS) * 256:
+        return bytes((TWO_BYTE_LEADS[index >> 8], index & 0xFF))
+    index -= len(TWO_BYTE_LEADS) * 256
+    return bytes((THREE_BYTE_LEADS[index >> 16], (index >> 8) & 0xFF, index & 0xFF))
+
+
+class WordTrie:
+    """
+    Array-backed trie over a-z
+
+    children[node * 26 + letter] is the child node (0 = none, the root
+    is node 0 and can never be a child), codes[node] the dictionary index
+    of the word ending at node (-1 = none).
+    """
+
+    def __init__(self):
+        self.children = array('i', [0]) * 26
+        self.codes = array('i', [-1])
+
+    def add(self, word: bytes, code: int):
+        children = self.children
+        node = 0
+        for b in word:
+            i = node * 26 + b - 97
+            child = children[i]
+            if child == 0:
+                child = len(self.codes)
+                self.codes.append(-1)
+                children.extend(array('i', [0]) * 26)
+                children[i] = child
+            node = child
+        self.codes[node] = code
+
+    def lookup(self, word: bytes) -> int:
+        """Dictionary index of a lowercase word, -1 if absent - O(len(word))"""
+        children = self.children
+        node = 0
+        for b in word:
+            node = children[node * 26 + b - 97]
+            if not node:
+                return -1
+        return self.codes[node]
+
+    def memory_bytes(self) -> int:
+        return len(self.children) * 4 + len(self.codes) * 4
+
+
+class DictionaryTransform:
+    """
+    Reversible capital + dictionary transform over fixed-size chunks
+
+    Usage:
+        t = DictionaryTransform()
+        t.build(data)                  # or build_file(path)
+        encoded, side = t.encode(data)
+        data == DictionaryTransform.decode(encoded, side)
+    """
+
+    def __init__(self, max_words: int = 50000, min_count: int = 4, chunk_size: int = 1 << 22):
+        self.max_words = min(max_words, MAX_WORDS)
+        self.min_count = min_count
+        self.chunk_size = chunk_size
+        self.words: List[bytes] = []
+        self.trie = WordTrie()
+        self.codewords: List[bytes] = []
+
+    # ---- dictionary -------------------------------------------------
+
+    def count_words(self, chunk: bytes, counts: Counter):
+        """Word frequencies after capital conversion (mixed case is skipped)"""
+        for w in WORD_PATTERN.findall(chunk):
+            if w.islower() or w[1:].islower() or w.isupper():
+                counts[w.lower()] += 1
+
+    def build(self, data: bytes):
+        counts = Counter()
+        for chunk in self.iter_chunks(data):
+            self.count_words(chunk, counts)
+        self.set_words(self.select_words(counts))
+
+    def build_file(self, path: Path):
+        counts = Counter()
+        for chunk in self.iter_file_chunks(path):
+            self.count_words(chunk, counts)
+        self.set_words(self.select_words(counts))
+
+    def select_words(self, counts: Counter) -> List[bytes]:
+        """Most frequent words that are longer than the codeword they get"""
+        words = []
+        for word, count in counts.most_common():
+            if count < self.min_count or len(words) >= self.max_words:
+                break
+            if len(word) > len(codeword(len(words))):
+                words.append(word)
+        return words
+
+    def set_words(self, words: List[bytes]):
+        self.words = list(words)
+        self.trie = WordTrie()
+        for i, w in enumerate(self.words):
+            self.trie.add(w, i)
+        self.codewords = [codeword(i) for i in range(len(self.words))]
+
+    # ---- encoding ---------------------------------------------------
+
+    def _encode_match(self, m) -> bytes:
+        w = m.group()
+        if len(w) == 1 and w[0] in RESERVED:
+            return bytes((ESC, w[0]))
+
+        if w.islower():
+            flag = b''
+            key = w
+        elif w[1:].islower() or len(w) == 1:
+            flag = b'\x03'
+            key = w.lower()
+        elif w.isupper():
+            flag = b'\x04'
+            key = w.lower()
+        else:
+            return w  # mixed case (McDonald) stays as is
+
+        code = self.trie.lookup(key)
+        if code >= 0:
+            return flag + self.codewords[code]
+        return flag + key
+
+    def encode_chunk(self, chunk: bytes) -> bytes:
+        return ENCODE_PATTERN.sub(self._encode_match, chunk)
+
+    def iter_chunks(self, data: bytes):
+        """Chunks of at most chunk_size bytes, cut after a newline, else between words"""
+        pos = 0
+        n = len(data)
+        while pos < n:
+            end = min(pos + self.chunk_size, n)
+            if end < n:
+                cut = data.rfind(b'\n', pos, end)
+                end = cut + 1 if cut > pos else _word_boundary(data, pos, end)
+            yield data[pos:end]
+            pos = end
+
+    def iter_file_chunks(self, path: Path):
+        carry = b''
+        with open(path, 'rb') as f:
+            while True:
+                block = f.read(self.chunk_size)
+                data = carry + block
+                if not block:
+                    if data:
+                        yield data
+                    return
+                cut = data.rfind(b'\n') + 1
+                if cut <= 0:
+                    cut = _word_boundary(data, 0, len(data))
+                yield data[:cut]
+                carry = data[cut:]
+
+    def side_info(self, encoded_lengths: List[int]) -> bytes:
+        """Dictionary + chunk table needed by decode()"""
+        out = bytearray(MAGIC)
+        words = b'\n'.join(self.words)
+        _write_varint(out, len(words))
+        out.extend(words)
+        _write_varint(out, len(encoded_lengths))
+        for n in encoded_lengths:
+            _write_varint(out, n)
+        return bytes(out)
+
+    def encode(self, data: bytes) -> Tuple[bytes, bytes]:
+        """Returns (encoded data, side info)"""
+        pieces = [self.encode_chunk(chunk) for chunk in self.iter_chunks(data)]
+        return b''.join(pieces), self.side_info([len(p) for p in pieces])
+
+    def encode_file(self, input_path: Path, output_path: Path, side_path: Path):
+        """Streaming encode (build_file() first)"""
+        lengths = []
+        with open(output_path, 'wb') as fout:
+            for chunk in self.iter_file_chunks(input_path):
+                encoded = self.encode_chunk(chunk)
+                lengths.append(len(encoded))
+                fout.write(encoded)
+        Path(side_path).write_bytes(self.side_info(lengths))
+
+    # ---- decoding ---------------------------------------------------
+
+    @staticmethod
+    def parse_side_info(side: bytes) -> Tuple[List[bytes], List[int]]:
+        if side[:4] != MAGIC:
+            raise ValueError("Not a dictionary transform side file")
+        n, pos = _read_varint(side, 4)
+        words = side[pos:pos + n].split(b'\n') if n else []
+        pos += n
+        n_chunks, pos = _read_varint(side, pos)
+        lengths = []
+        for _ in range(n_chunks):
+            n, pos = _read_varint(side, pos)
+            lengths.append(n)
+        return words, lengths
+
+    @staticmethod
+    def make_decoder(words: List[bytes]):
+        """Returns decode_chunk(encoded) -> original bytes"""
+        by_code = {codeword(i): w for i, w in enumerate(words)}
+
+        def replace(m):
+            escaped, flag, code, letters, plain = m.groups()
+            if escaped is not None:
+                return escaped
+            if plain is not None:
+                return by_code[plain]
+            word = by_code[code] if code is not None else letters
+            if flag == b'\x03':
+                return word[:1].upper() + word[1:]
+            return word.upper()
+
+        def decode_chunk(encoded: bytes) -> bytes:
+            return DECODE_PATTERN.sub(replace, encoded)
+
+        return decode_chunk
+
+    @staticmethod
+    def decode(encoded: bytes, side: bytes) -> bytes:
+        words, lengths = DictionaryTransform.parse_side_info(side)
+        decode_chunk = DictionaryTransform.make_decoder(words)
+        pieces = []
+        pos = 0
+        for n in lengths:
+            pieces.append(decode_chunk(encoded[pos:pos + n]))
+            pos += n
+        return b''.join(pieces)
+
+    @staticmethod
+    def decode_file(input_path: Path, side_path: Path, output_path: Path):
+        """Streaming decode, one chunk at a time"""
+        words, lengths = DictionaryTransform.parse_side_info(Path(side_path).read_bytes())
+        decode_chunk = DictionaryTransform.make_decoder(words)
+        with open(input_path, 'rb') as fin, open(output_path, 'wb') as fout:
+            for n in lengths:
+                fout.write(decode_chunk(fin.read(n)))
+
+
+def main():
+    size = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+
+    print("=" * 70)
+    print("CAPITAL + DICTIONARY TRANSFORM")
+    print("=" * 70)
+
+    data = Path("wiki_1mb.txt").read_bytes()
+    transform = DictionaryTransform()
+
+    start = time.perf_counter()
+    transform.build(data)
+    build_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    encoded, side = transform.encode(data)
+    encode_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    decoded = DictionaryTransform.decode(encoded, side)
+    decode_time = time.perf_counter() - start
+
+    if decoded != data:
+        raise RuntimeError("Round trip FAILED")
+
+    mb = len(data) / 1e6
+    print(f"\n[1] Transform on wiki_1mb.txt ({len(data):,} bytes)")
+    print(f"    Dictionary:   {len(transform.words):,} words, trie {transform.trie.memory_bytes() / 1024:.0f} KB")
+    print(f"    Encoded:      {len(encoded):,} bytes ({len(encoded) / len(data) * 100:.1f}% of input)")
+    print(f"    Side info:    {len(side):,} bytes")
+    print(f"    Build:        {mb / build_time:.1f} MB/s")
+    print(f"    Encode:       {mb / encode_time:.1f} MB/s")
+    print(f"    Decode:       {mb / decode_time:.1f} MB/s")
+    print("    ✅ Round trip byte-exact")
+
+    # Downstream effect on the context mixing coder
+    from context_mixing import ContextMixingCompressor
+
+    sample = data[:size]
+    sample_encoded = transform.encode_chunk(sample)
+    print(f"\n[2] Context mixing on the first {len(sample):,} input bytes")
+
+    results = {}
+    for label, payload in (("raw", sample), ("transformed", sample_encoded)):
+        compressor = ContextMixingCompressor()
+        start = time.perf_counter()
+        blob = compressor.compress(payload)
+        elapsed = time.perf_counter() - start
+        results[label] = (len(blob), elapsed)
+        print(f"    {label:<12} input {len(payload):>9,}  ->  {len(blob):>9,} bytes  "
+              f"in {elapsed:6.1f} s ({len(sample) / 1024 / elapsed:.1f} KB/s of source)")
+
+    raw_size, raw_time = results["raw"]
+    tr_size, tr_time = results["transformed"]
+    print(f"\n    Model input shrinks by {(1 - len(sample_encoded) / len(sample)) * 100:.1f}%")
+    print(f"    Coder speed-up:        {raw_time / tr_time:.2f}x")
+    print(f"    Compressed size:       {(tr_size - raw_size) / raw_size * 100:+.2f}% "
+          f"(dictionary side info {len(side):,} bytes is shared by the whole file)")
+    print("=" * 70)
+
+
+if __name__ == "__main__":
+    main()
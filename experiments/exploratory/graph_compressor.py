@@ -20,8 +20,14 @@ class LinkGraph:
         self.id_to_link = {}  # ID -> link
         self.next_id = 0
     
-    def train(self, links):
-        """Trenuj graf na sekwencji linków"""
+    def train(self, links, memory=None):
+        """
+        Trenuj graf na sekwencji linków
+
+        Args:
+            memory: opcjonalny memory_budget.MemoryManager - tick() po każdej
+                krawędzi, przycina edges po przekroczeniu budżetu
+        """
         print(f"    Budowanie graph'u z {len(links):,} linków...")
         
         # Buduj słownik
@@ -36,6 +42,8 @@ class LinkGraph:
             current = links[i]
             next_link = links[i + 1]
             self.edges[current][next_link] += 1
+            if memory is not None:
+                memory.tick()
         
         print(f"    Unikalnych linków: {len(self.link_to_id):,}")
         print(f"    Krawędzi: {sum(len(v) for v in self.edges.values()):,}")
@@ -3,13 +3,171 @@
 Wielokanałowy kompresor dla Wikipedia
 Rozbija dane na kanały (linki, nagłówki, tekst) i kompresuje każdy osobno
 """
+import os
+import re
 import struct
-import pickle
 import time
+import zlib
+from itertools import chain
 from typing import List, Tuple
+
+import numpy as np
+
 from arithmetic_coder import ArithmeticEncoder
 from context_model import ContextModel
 
+# Kolejność = numer kanału w sekwencji
+CHANNEL_NAMES = ('link', 'heading', 'template', 'text', 'structure')
+LINK, HEADING, TEMPLATE, TEXT, STRUCTURE = range(len(CHANNEL_NAMES))
+_UNPAINTED = 255
+
+# Konstrukcje wielobajtowe. Każda alternatywa zaczyna się literałem i nie ma
+# grup (tak re szuka szybko); rodzaj konstrukcji wynika z pierwszego bajtu.
+# Nagłówki: poziomy 6..2 po kolei, jak zachłanne (={2,6})[^=\n]+\1
+MARKUP_PATTERN = re.compile(
+    rb'\[\[[^\]]*\]\]'                 # link
+    rb'|\{\{[^}]*\}\}'                  # template
+    + b''.join(b'|' + b'=' * level + rb'[^=\n]+' + b'=' * level for level in range(6, 1, -1))
+    + rb'|<[^<>]*>|&#?\w{1,8};'         # tag XML, encja (całe do structure)
+)
+
+# Pierwszy bajt konstrukcji -> kanał treści
+_MARKUP_CHANNEL = np.full(256, STRUCTURE, dtype=np.uint8)
+_MARKUP_CHANNEL[ord('[')] = LINK
+_MARKUP_CHANNEL[ord('{')] = TEMPLATE
+_MARKUP_CHANNEL[ord('=')] = HEADING
+
+# Pojedyncze bajty struktury, reszta to tekst
+_BYTE_CHANNEL = np.full(256, TEXT, dtype=np.uint8)
+_BYTE_CHANNEL[np.frombuffer(b"\n*#:;'", dtype=np.uint8)] = STRUCTURE
+
+
+def channel_labels(data: bytes) -> np.ndarray:
+    """Numer kanału dla każdego bajtu wejścia (uint8, długość len(data))"""
+    raw = np.frombuffer(data, dtype=np.uint8)
+    label = _BYTE_CHANNEL[raw]
+
+    spans = np.fromiter(chain.from_iterable(m.span() for m in MARKUP_PATTERN.finditer(data)),
+                        dtype=np.int64)
+    if not len(spans):
+        return label
+    starts = spans[0::2]
+    ends = spans[1::2]
+    kinds = _MARKUP_CHANNEL[raw[starts]]
+
+    # Długość otwarcia: 2 dla [[ i {{, liczba "=" dla nagłówka, cała dla reszty
+    opens = np.where(kinds == STRUCTURE, ends, starts + 2)
+    heading = np.flatnonzero(kinds == HEADING)
+    for _ in range(4):
+        more = raw[opens[heading]] == 61  # "="
+        opens[heading[more]] += 1
+        heading = heading[more]
+
+    # Odcinki [przerwa][otwarcie][reszta] dla każdej konstrukcji, malowane np.repeat
+    n = len(starts)
+    bounds = np.empty(3 * n + 2, dtype=np.int64)
+    bounds[0] = 0
+    bounds[1:-1:3] = starts
+    bounds[2:-1:3] = opens
+    bounds[3:-1:3] = ends
+    bounds[-1] = len(raw)
+    values = np.empty(3 * n + 1, dtype=np.uint8)
+    values[0:-1:3] = _UNPAINTED
+    values[1::3] = STRUCTURE
+    values[2::3] = kinds
+    values[-1] = _UNPAINTED
+    paint = np.repeat(values, np.diff(bounds))
+
+    return np.where(paint == _UNPAINTED, label, paint)
+
+
+def iter_reassembled(channels: dict, ids: np.ndarray, lengths: np.ndarray, block_runs: int = 1 << 16):
+    """
+    Skleja kanały w kolejności sekwencji run-length, strumieniowo:
+    zwraca kolejne bloki wyjścia po block_runs odcinków
+    """
+    ids = np.asarray(ids, dtype=np.uint8)
+    lengths = np.asarray(lengths, dtype=np.int64)
+    views = [np.frombuffer(channels.get(name, b''), dtype=np.uint8) for name in CHANNEL_NAMES]
+    positions = [0] * len(CHANNEL_NAMES)
+    
+    for first in range(0, len(ids), block_runs):
+        label = np.repeat(ids[first:first + block_runs], lengths[first:first + block_runs])
+        out = np.empty(len(label), dtype=np.uint8)
+        for channel_id, view in enumerate(views):
+            mask = label == channel_id
+            count = int(np.count_nonzero(mask))
+            if not count:
+                continue
+            pos = positions[channel_id]
+            if pos + count > len(view):
+                raise ValueError(f"Kanał {CHANNEL_NAMES[channel_id]}: za mało danych dla sekwencji")
+            out[mask] = view[pos:pos + count]
+            positions[channel_id] = pos + count
+        yield out.tobytes()
+    
+    for channel_id, view in enumerate(views):
+        if positions[channel_id] != len(view):
+            raise ValueError(f"Kanał {CHANNEL_NAMES[channel_id]}: {len(view) - positions[channel_id]} "
+                             f"bajtów poza sekwencją")
+
+
+def reassemble_channels(channels: dict, ids: np.ndarray, lengths: np.ndarray) -> bytes:
+    """Skleja kanały z powrotem w kolejności zapisanej w sekwencji run-length"""
+    return b''.join(iter_reassembled(channels, ids, lengths, block_runs=max(1, len(ids))))
+
+
+def pack_sequence(ids: np.ndarray, lengths: np.ndarray) -> bytes:
+    """
+    Zwarty zapis sekwencji:
+        uint32 liczba odcinków | uint8 ids[n] | uint8 długości[n] |
+        uint32 długości >= 255 (w kolejności; w długościach stoi 255)
+    """
+    lengths = np.asarray(lengths, dtype=np.int64)
+    small = np.minimum(lengths, 255).astype(np.uint8)
+    big = lengths[lengths >= 255].astype('<u4')
+    return (struct.pack('<I', len(ids)) + np.asarray(ids, dtype=np.uint8).tobytes()
+            + small.tobytes() + big.tobytes())
+
+
+def unpack_sequence(packed: bytes):
+    """Odwrotność pack_sequence -> (ids, lengths)"""
+    n = struct.unpack_from('<I', packed, 0)[0]
+    ids = np.frombuffer(packed, dtype=np.uint8, count=n, offset=4)
+    small = np.frombuffer(packed, dtype=np.uint8, count=n, offset=4 + n)
+    lengths = small.astype(np.int64)
+    escaped = small == 255
+    lengths[escaped] = np.frombuffer(packed, dtype='<u4', count=int(escaped.sum()), offset=4 + 2 * n)
+    return ids, lengths
+
+
+ARCHIVE_MAGIC = b'MCH2'
+ARCHIVE_HEADER = struct.Struct('<4sIQI')
+INDEX_ENTRY = struct.Struct('<20sIQIIII')
+
+
+class SequentialModel:
+    """
+    Wrapper na ContextModel dla ArithmeticEncoder: get_range() przesuwa
+    kontekst, więc ta sama sekwencja wywołań działa w koderze i dekoderze
+    (dekoder woła get_total, get_symbol, potem get_range).
+    """
+    
+    def __init__(self, model):
+        self.model = model
+    
+    def get_range(self, symbol):
+        result = self.model.get_range(symbol)
+        self.model.update_context(symbol)
+        return result
+    
+    def get_total(self):
+        return self.model.get_total()
+    
+    def get_symbol(self, offset):
+        return self.model.get_symbol(offset)
+
+
 class WikiChannel:
     """Pojedynczy kanał z własnym modelem"""
     
@@ -44,23 +202,7 @@ class WikiChannel:
         encoder = ArithmeticEncoder(precision_bits=32)
         self.model.start_encoding()
         
-        # Prosty wrapper
-        class SimpleWrapper:
-            def __init__(self, model):
-                self.model = model
-            
-            def get_range(self, symbol):
-                result = self.model.get_range(symbol)
-                self.model.update_context(symbol)
-                return result
-            
-            def get_total(self):
-                return self.model.get_total()
-            
-            def get_symbol(self, offset):
-                raise NotImplementedError()
-        
-        wrapper = SimpleWrapper(self.model)
+        wrapper = SequentialModel(self.model)
         self.compressed = encoder.encode(list(self.data), wrapper)
         
         elapsed = time.time() - start
@@ -74,6 +216,16 @@ class WikiChannel:
             'bpb': bpb,
             'time': elapsed
         }
+    
+    @staticmethod
+    def decode(model_data: bytes, compressed: bytes, length: int) -> bytes:
+        """Odkodowuje dane kanału (odwrotność compress)"""
+        if length == 0:
+            return b''
+        model = ContextModel.deserialize(model_data)
+        model.start_encoding()
+        decoder = ArithmeticEncoder(precision_bits=32)
+        return bytes(decoder.decode(compressed, SequentialModel(model), length))
 
 class MultiChannelCompressor:
     """Główny kompresor wielokanałowy"""
@@ -88,130 +240,46 @@ class MultiChannelCompressor:
             'structure': WikiChannel('structure', order=1) # Markup - Order-1
         }
         
-        # Metadata: pozycje i długości dla rekonstrukcji
-        self.sequence = []  # Lista (channel_name, length) dla rekonstrukcji kolejności
+        # Metadata: kolejność kanałów dla rekonstrukcji, run-length (ids, lengths)
+        self.sequence = (np.empty(0, dtype=np.uint8), np.empty(0, dtype=np.int64))
     
     def parse_and_split(self, data: bytes):
         """
-        Parsuje dane i dzieli na kanały
-        Prostsza wersja bez regex - szybka i bezpieczna
+        Parsuje dane i dzieli na kanały - bezstratnie, bez pętli po bajtach
+
+        Każdy bajt wejścia trafia do dokładnie jednego kanału:
+            [[cel|tekst]]   "[[" -> structure, "cel|tekst]]" -> link
+            {{...}}         "{{" -> structure, "...}}" -> template
+            ==Nagłówek==    "==" -> structure, "Nagłówek==" -> heading
+            <tag>, &encja;, \n, *#:;'  -> structure
+            reszta          -> text
+        Zamykające nawiasy zostają w kanale jako separator elementów.
+
+        Kolejność kanałów zapisuje self.sequence = (ids, lengths): tablice
+        run-length (numer kanału z CHANNEL_NAMES, długość odcinka).
         """
         print(f"\n[1] Parsowanie i podział na kanały...")
         print(f"    Rozmiar wejścia: {len(data):,} bajtów")
-        
-        i = 0
-        total = len(data)
-        last_report = 0
-        
-        while i < total:
-            # Progress co 100 KB
-            if i - last_report > 100000:
-                pct = (i / total) * 100
-                print(f"    Postęp: {pct:.1f}%", end='\r')
-                last_report = i
-            
-            # Sprawdź linki [[...]]
-            if i < total - 1 and data[i:i+2] == b'[[':
-                end = data.find(b']]', i + 2)
-                if end != -1:
-                    # Zapisz link
-                    link_content = data[i+2:end]
-                    self.channels['link'].add(link_content)
-                    self.channels['link'].add(b'\n')  # Separator
-                    
-                    # Zapisz strukturę (nawiasy)
-                    self.channels['structure'].add(b'[[]]')
-                    
-                    self.sequence.append(('link', len(link_content) + 1))
-                    
-                    i = end + 2
-                    continue
-            
-            # Sprawdź templates {{...}}
-            if i < total - 1 and data[i:i+2] == b'{{':
-                end = data.find(b'}}', i + 2)
-                if end != -1:
-                    template_content = data[i+2:end]
-                    self.channels['template'].add(template_content)
-                    self.channels['template'].add(b'\n')
-                    
-                    self.channels['structure'].add(b'{{}}')
-                    
-                    self.sequence.append(('template', len(template_content) + 1))
-                    
-                    i = end + 2
-                    continue
-            
-            # Sprawdź nagłówki ==...==
-            if i < total - 1 and data[i:i+2] == b'==':
-                # Zlicz =
-                j = i
-                while j < total and data[j:j+1] == b'=':
-                    j += 1
-                
-                level = j - i
-                
-                # Znajdź koniec nagłówka
-                end = data.find(b'=' * level, j)
-                if end != -1 and end > j:
-                    heading_content = data[j:end].strip()
-                    self.channels['heading'].add(heading_content)
-                    self.channels['heading'].add(b'\n')
-                    
-                    self.channels['structure'].add(b'=' * level + b'=')
-                    
-                    self.sequence.append(('heading', len(heading_content) + 1))
-                    
-                    i = end + level
-                    continue
-            
-            # XML tag <...>
-            if data[i:i+1] == b'<':
-                end = data.find(b'>', i + 1)
-                if end != -1:
-                    self.channels['structure'].add(data[i:end+1])
-                    self.sequence.append(('structure', end - i + 1))
-                    i = end + 1
-                    continue
-            
-            # Entity &...;
-            if data[i:i+1] == b'&':
-                end = data.find(b';', i + 1)
-                if end != -1 and end - i < 10:  # Rozsądna długość entity
-                    self.channels['structure'].add(data[i:end+1])
-                    self.sequence.append(('structure', end - i + 1))
-                    i = end + 1
-                    continue
-            
-            # Newline
-            if data[i:i+1] == b'\n':
-                self.channels['structure'].add(b'\n')
-                self.sequence.append(('structure', 1))
-                i += 1
-                continue
-            
-            # Specjalne znaki markup
-            if data[i:i+1] in b"*#:;'":
-                self.channels['structure'].add(data[i:i+1])
-                self.sequence.append(('structure', 1))
-                i += 1
-                continue
-            
-            # Plain text - zbieraj do następnego specjalnego
-            start = i
-            while i < total:
-                ch = data[i:i+1]
-                if ch in b'\n*#:;\'<&=' or (i < total - 1 and data[i:i+2] in [b'[[', b'{{', b'==']):
-                    break
-                i += 1
-            
-            if i > start:
-                chunk = data[start:i]
-                self.channels['text'].add(chunk)
-                self.sequence.append(('text', len(chunk)))
-        
-        print(f"    Postęp: 100.0%")
-        
+        start_time = time.time()
+
+        label = channel_labels(data)
+
+        # Run-length: granice, na których zmienia się kanał
+        run_starts = np.flatnonzero(label[1:] != label[:-1]) + 1
+        run_starts = np.concatenate([[0], run_starts]) if len(label) else run_starts
+        ids = label[run_starts]
+        lengths = np.diff(np.append(run_starts, len(label)))
+        self.sequence = (ids, lengths)
+
+        # Zbiorcze zebranie bajtów każdego kanału
+        raw = np.frombuffer(data, dtype=np.uint8)
+        for channel_id, name in enumerate(CHANNEL_NAMES):
+            self.channels[name].add(raw[label == channel_id].tobytes())
+
+        elapsed = time.time() - start_time
+        print(f"    Odcinki: {len(ids):,}, czas {elapsed:.2f} s "
+              f"({len(data) / (1024 * 1024) / max(elapsed, 1e-9):.1f} MB/s)")
+
         # Statystyki
         print(f"\n    Rozkład kanałów:")
         total_bytes = sum(len(ch.data) for ch in self.channels.values())
@@ -219,7 +287,12 @@ class MultiChannelCompressor:
             if len(channel.data) > 0:
                 pct = (len(channel.data) / total_bytes) * 100
                 print(f"      {name:<12}: {len(channel.data):>10,} bajtów ({pct:>5.1f}%)")
-    
+
+    def reassemble(self) -> bytes:
+        """Odtwarza wejście z kanałów i self.sequence (odwrotność parse_and_split)"""
+        return reassemble_channels({name: bytes(ch.data) for name, ch in self.channels.items()},
+                                   *self.sequence)
+
     def compress(self):
         """Kompresuje wszystkie kanały"""
         print(f"\n[2] Trening modeli...")
@@ -232,41 +305,41 @@ class MultiChannelCompressor:
             channel.compress()
     
     def save(self, output_path: str):
-        """Zapisuje skompresowane archiwum"""
+        """
+        Zapisuje skompresowane archiwum
+
+        Format (little endian):
+            'MCH2' | uint32 liczba kanałów | uint64 offset sekwencji | uint32 długość sekwencji
+            indeks, po jednym wpisie na kanał (INDEX_ENTRY):
+                nazwa (20 B) | order | offset | długość modelu | długość danych |
+                oryginalna długość | CRC32 oryginału
+            dla każdego kanału: model | skompresowane dane
+            sekwencja (pack_sequence)
+
+        Indeks pozwala czytelnikowi przeskoczyć do dowolnego kanału.
+        """
         print(f"\n[4] Zapis archiwum: {output_path}")
         
+        blobs = []
+        for name, channel in self.channels.items():
+            model_data = channel.model.serialize() if len(channel.data) > 0 else b''
+            blobs.append((name, channel, model_data, channel.compressed or b''))
+        sequence_data = pack_sequence(*self.sequence)
+        
+        offset = ARCHIVE_HEADER.size + INDEX_ENTRY.size * len(blobs)
+        index = []
+        for name, channel, model_data, compressed in blobs:
+            index.append(INDEX_ENTRY.pack(
+                name.encode('utf-8')[:20].ljust(20, b'\x00'), channel.order, offset,
+                len(model_data), len(compressed), len(channel.data), zlib.crc32(channel.data)))
+            offset += len(model_data) + len(compressed)
+        
         with open(output_path, 'wb') as f:
-            # Header: liczba kanałów
-            f.write(struct.pack('<I', len(self.channels)))
-            
-            # Dla każdego kanału: name, order, model, compressed_data
-            for name, channel in self.channels.items():
-                # Nazwa kanału (max 20 bajtów)
-                name_bytes = name.encode('utf-8')[:20].ljust(20, b'\x00')
-                f.write(name_bytes)
-                
-                # Order
-                f.write(struct.pack('<I', channel.order))
-                
-                # Model (serializowany)
-                if len(channel.data) > 0:
-                    model_data = channel.model.serialize()
-                else:
-                    model_data = b''
-                
-                f.write(struct.pack('<I', len(model_data)))
+            f.write(ARCHIVE_HEADER.pack(ARCHIVE_MAGIC, len(blobs), offset, len(sequence_data)))
+            f.write(b''.join(index))
+            for _, _, model_data, compressed in blobs:
                 f.write(model_data)
-                
-                # Skompresowane dane
-                f.write(struct.pack('<I', len(channel.compressed)))
-                f.write(channel.compressed)
-                
-                # Oryginalna długość (dla dekompresji)
-                f.write(struct.pack('<I', len(channel.data)))
-            
-            # Sequence (dla rekonstrukcji)
-            sequence_data = pickle.dumps(self.sequence)
-            f.write(struct.pack('<I', len(sequence_data)))
+                f.write(compressed)
             f.write(sequence_data)
     
     def print_stats(self):
@@ -295,13 +368,155 @@ class MultiChannelCompressor:
         
         return total_original, total_compressed, overall_bpb
 
+class MultiChannelArchive:
+    """
+    Czytnik archiwum zapisanego przez MultiChannelCompressor.save
+
+    Usage:
+        archive = MultiChannelArchive(path)
+        data = archive.decompress(workers=4)       # wszystkie kanały równolegle
+        links = archive.decode_channel('link')     # jeden kanał, reszta pominięta
+    """
+    
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, 'rb') as f:
+            magic, count, sequence_offset, sequence_length = ARCHIVE_HEADER.unpack(f.read(ARCHIVE_HEADER.size))
+            if magic != ARCHIVE_MAGIC:
+                raise ValueError(f"{path}: to nie jest archiwum wielokanałowe {ARCHIVE_MAGIC!r}")
+            
+            self.index = {}
+            for _ in range(count):
+                name, order, offset, model_len, comp_len, orig_len, crc = \
+                    INDEX_ENTRY.unpack(f.read(INDEX_ENTRY.size))
+                self.index[name.rstrip(b'\x00').decode('utf-8')] = {
+                    'order': order, 'offset': offset, 'model_len': model_len,
+                    'comp_len': comp_len, 'orig_len': orig_len, 'crc32': crc,
+                }
+            
+            f.seek(sequence_offset)
+            self.sequence = unpack_sequence(f.read(sequence_length))
+        self.stats = {}
+    
+    @property
+    def channel_names(self) -> List[str]:
+        return list(self.index)
+    
+    def read_channel(self, name: str) -> Tuple[bytes, bytes]:
+        """(model, skompresowane dane) kanału - seek wprost z indeksu"""
+        entry = self.index[name]
+        with open(self.path, 'rb') as f:
+            f.seek(entry['offset'])
+            model_data = f.read(entry['model_len'])
+            compressed = f.read(entry['comp_len'])
+        return model_data, compressed
+    
+    def decode_channel(self, name: str) -> bytes:
+        """Odkodowuje jeden kanał i sprawdza jego CRC32"""
+        entry = self.index[name]
+        model_data, compressed = self.read_channel(name)
+        data = WikiChannel.decode(model_data, compressed, entry['orig_len'])
+        if zlib.crc32(data) != entry['crc32']:
+            raise ValueError(f"Kanał {name}: niezgodna suma kontrolna CRC32")
+        return data
+    
+    def decode_channels(self, workers: int = None) -> dict:
+        """Wszystkie kanały, każdy w osobnym procesie (workers=1: sekwencyjnie)"""
+        from concurrent.futures import ProcessPoolExecutor
+        
+        names = [name for name, entry in self.index.items() if entry['orig_len']]
+        workers = min(workers or os.cpu_count() or 1, max(1, len(names)))
+        start = time.time()
+        
+        if workers == 1:
+            results = [_decode_channel_worker((self.path, name)) for name in names]
+        else:
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                results = list(pool.map(_decode_channel_worker, [(self.path, name) for name in names]))
+        
+        channels = {name: b'' for name in self.index}
+        self.stats['channel_time'] = {}
+        for name, data, elapsed in results:
+            channels[name] = data
+            self.stats['channel_time'][name] = elapsed
+        self.stats['workers'] = workers
+        self.stats['decode_wall'] = time.time() - start
+        return channels
+    
+    def iter_decompressed(self, workers: int = None, block_runs: int = 1 << 16):
+        """Odkodowane wejście strumieniowo, blokami (zob. iter_reassembled)"""
+        channels = self.decode_channels(workers)
+        yield from iter_reassembled(channels, *self.sequence, block_runs=block_runs)
+    
+    def decompress(self, workers: int = None) -> bytes:
+        return b''.join(self.iter_decompressed(workers))
+    
+    def decompress_to(self, output_path: str, workers: int = None):
+        with open(output_path, 'wb') as f:
+            for block in self.iter_decompressed(workers):
+                f.write(block)
+
+
+def _decode_channel_worker(args) -> Tuple[str, bytes, float]:
+    """Proces roboczy: otwiera archiwum sam i odkodowuje jeden kanał"""
+    path, name = args
+    start = time.time()
+    data = MultiChannelArchive(path).decode_channel(name)
+    return name, data, time.time() - start
+
+
+def benchmark_decompression(archive_path: str, original: bytes = None):
+    """Czas dekompresji w zależności od liczby procesów (1 .. liczba rdzeni)"""
+    archive = MultiChannelArchive(archive_path)
+    active = [name for name, entry in archive.index.items() if entry['orig_len']]
+    cores = os.cpu_count() or 1
+    
+    print(f"\n{'=' * 70}")
+    print(f"DEKOMPRESJA RÓWNOLEGŁA - {len(active)} kanałów, {cores} rdzeni")
+    print(f"{'=' * 70}")
+    print(f"\n{'Procesy':<10} {'Czas [s]':<12} {'Przyspieszenie':<15}")
+    print("-" * 70)
+    
+    baseline = None
+    for workers in sorted({1, min(cores, len(active)), len(active)}):
+        start = time.time()
+        data = archive.decompress(workers=workers)
+        elapsed = time.time() - start
+        baseline = baseline or elapsed
+        print(f"{workers:<10} {elapsed:<12.2f} {baseline / elapsed:.2f}x")
+        if original is not None and data != original:
+            raise RuntimeError("Dekompresja nie zgadza się z oryginałem!")
+    
+    slowest = max(archive.stats['channel_time'].items(), key=lambda x: x[1])
+    print("-" * 70)
+    print(f"Najwolniejszy kanał: {slowest[0]} ({slowest[1]:.2f} s) - dolna granica czasu ściany")
+    if cores < len(active):
+        print(f"⚠ Tylko {cores} rdzeni na {len(active)} kanałów - procesy czekają na CPU")
+    if original is not None:
+        print("✅ Dekompresja zgodna z oryginałem")
+
+
 def main():
+    """
+    Usage:
+        python multichannel_compressor.py [INPUT [ARCHIVE]]
+        python multichannel_compressor.py decompress ARCHIVE OUTPUT
+    """
+    import sys
+    
+    if len(sys.argv) == 4 and sys.argv[1] == 'decompress':
+        archive = MultiChannelArchive(sys.argv[2])
+        archive.decompress_to(sys.argv[3])
+        print(f"Odkodowano {sys.argv[3]} w {archive.stats['decode_wall']:.1f} s "
+              f"({archive.stats['workers']} procesów)")
+        return
+    
     print("=" * 70)
     print("WIELOKANAŁOWY KOMPRESOR - Test")
     print("=" * 70)
     
-    input_file = "data/enwik_10mb"
-    output_file = "data/enwik_10mb_multichannel.mch"
+    input_file = sys.argv[1] if len(sys.argv) > 1 else "data/enwik_10mb"
+    output_file = sys.argv[2] if len(sys.argv) > 2 else "data/enwik_10mb_multichannel.mch"
     
     # Wczytaj dane
     print(f"\n[0] Czytanie: {input_file}")
@@ -315,6 +530,9 @@ def main():
     
     compressor = MultiChannelCompressor()
     compressor.parse_and_split(data)
+    if compressor.reassemble() != data:
+        raise RuntimeError("Podział na kanały nie jest bezstratny!")
+    print("    ✅ Podział bezstratny (reassemble == wejście)")
     compressor.compress()
     compressor.save(output_file)
     
@@ -330,7 +548,6 @@ def main():
     
     # Baseline Order-3
     baseline_file = "data/enwik_10mb_order3.ctx"
-    import os
     if os.path.exists(baseline_file):
         baseline_size = os.path.getsize(baseline_file) - 8  # Odejmij header
         # Odczytaj rozmiar modelu
@@ -362,6 +579,8 @@ def main():
     print(f"\nCałkowity czas: {total_time:.1f} s")
     print(f"Prędkość: {len(data) / (1024*1024*total_time):.2f} MB/s")
     print("=" * 70)
+    
+    benchmark_decompression(output_file, data)
 
 if __name__ == "__main__":
     main()
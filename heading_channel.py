@@ -0,0 +1,325 @@
+#!/usr/bin/env python3
+"""
+Section-heading channel: next heading predicted from the previous one and the article type
+
+SectionGraph (full_structure/ultra compressors) and SmartSectionGraph
+only estimated heading costs from parent->child counts. This channel
+codes every "== Heading ==" line with the binary arithmetic coder:
+
+    position   lines since the previous heading
+    level      number of "=" (context: previous level)
+    spacing    spaces inside the "=" runs (context: previous spacing)
+    title      rank in the first candidate list that has it:
+                 1. (article type, previous heading)
+                 2. previous heading
+                 3. all headings seen so far
+               each list ranked by frequency (RankedDictionary); a miss
+               is an escape bit, the last resort an order-1 literal
+
+The article type is the infobox name ({{Infobox X}}, {{Taxobox}}) or the
+last word of the first category ("births", "countries"), read from the
+main stream - the decoder has the main stream before the headings, so
+both sides see the same context. The heading line content is cut from
+the main stream, its newline stays.
+"""
+import math
+import re
+import sys
+import time
+from collections import defaultdict
+from pathlib import Path
+from typing import Dict, Tuple
+
+import numpy as np
+
+from arithmetic_coder import BinaryArithmeticEncoder, BinaryArithmeticDecoder
+from starlit_reorder import ArticleExtractor
+from template_channel import RankedDictionary
+
+MAGIC = b'HDG1'
+
+HEADING_PATTERN = re.compile(rb'^(={2,6})([^=\n]+)\1$', re.M)
+INFOBOX_PATTERN = re.compile(rb'\{\{\s*(?:[Ii]nfobox[ _]*([^|}\n<]*)|([A-Za-z]+box)\b)')
+CATEGORY_PATTERN = re.compile(rb'\[\[Category:([^\]|\n]+)')
+
+MAX_CONTEXT_RANK = 32   # deeper ranks in the context lists count as a miss
+RATE_LIMIT = 30         # contexts seen this often adapt at the fixed rate
+START = b'\x00'          # "previous heading" at the start of an article
+
+
+def article_type(text: bytes) -> bytes:
+    """Infobox name, or the last word of the first category, or b''"""
+    m = INFOBOX_PATTERN.search(text)
+    if m:
+        name = m.group(1) if m.group(1) is not None else m.group(2)
+        return b'box:' + b' '.join(name.lower().split()[:2])
+    m = CATEGORY_PATTERN.search(text)
+    if m:
+        words = m.group(1).lower().split()
+        return b'cat:' + (words[-1] if words else b'')
+    return b''
+
+
+class _ArticleTypes:
+    """Article type for any main-stream position (cached per article)"""
+
+    def __init__(self, main: bytes):
+        self.main = main
+        self.starts, self.ends = ArticleExtractor().article_spans(main)
+        self.cache: Dict[int, bytes] = {}
+
+    def article(self, pos: int) -> int:
+        return int(np.searchsorted(self.starts, pos, side='right')) - 1
+
+    def type_of(self, article: int) -> bytes:
+        if article not in self.cache:
+            if article < 0:
+                self.cache[article] = b''
+            else:
+                self.cache[article] = article_type(self.main[self.starts[article]:self.ends[article]])
+        return self.cache[article]
+
+
+class _AdaptiveBits:
+    """
+    Adaptive binary contexts on top of the arithmetic coder. The same code
+    path encodes (encoder given) or decodes (decoder given): bit() returns
+    the bit that was coded. cost accumulates -log2 p of every coded bit.
+    Each context keeps (p, count) so rare contexts learn quickly.
+    """
+
+    def __init__(self, encoder=None, decoder=None):
+        self.encoder = encoder
+        self.decoder = decoder
+        self.probs: Dict[tuple, Tuple[int, int]] = {}
+        self.cost = 0.0
+
+    def bit(self, ctx: tuple, bit: int = 0) -> int:
+        p, n = self.probs.get(ctx, (2048, 0))
+        if self.encoder is not None:
+            self.encoder.encode_bit(bit, p)
+        else:
+            bit = self.decoder.decode_bit(p)
+        self.cost -= math.log2(p / 4096 if bit else 1 - p / 4096)
+        # Rate 1/(n+2) while the context is young, then fixed 1/32
+        target = 4095 if bit else 1
+        p += (target - p) // (n + 2) if n < RATE_LIMIT else (target - p) >> 5
+        self.probs[ctx] = (min(4095, max(1, p)), n + 1)
+        return bit
+
+    def number(self, ctx, n: int = 0) -> int:
+        """n >= 0, Elias-gamma shape with adaptive bits"""
+        v = n + 1
+        length = v.bit_length() if self.encoder is not None else 0
+        size = 1
+        while self.bit((ctx, 'len', size), 1 if size < length else 0):
+            size += 1
+        v = 1
+        for k in range(size - 2, -1, -1):
+            v = (v << 1) | self.bit((ctx, size, k), ((n + 1) >> k) & 1)
+        return v - 1
+
+    def literal(self, text: bytes = b'') -> bytes:
+        """Order-1 coded bytes terminated by \\n (text has no \\n)"""
+        out = bytearray()
+        prev = 0
+        i = 0
+        while True:
+            byte = (text[i] if i < len(text) else 10) if self.encoder is not None else 0
+            c0 = 1
+            for k in range(7, -1, -1):
+                c0 = (c0 << 1) | self.bit(('lit', prev, c0), (byte >> k) & 1)
+            byte = c0 & 0xFF
+            if byte == 10:
+                return bytes(out)
+            out.append(byte)
+            prev = byte
+            i += 1
+
+
+class HeadingModel:
+    """Heading coder shared by encoder and decoder (bits decides the direction)"""
+
+    STAGES = ('type+previous', 'previous', 'global', 'literal')
+
+    def __init__(self, bits: _AdaptiveBits):
+        self.bits = bits
+        self.by_type_previous: Dict[Tuple[bytes, bytes], RankedDictionary] = defaultdict(RankedDictionary)
+        self.by_previous: Dict[bytes, RankedDictionary] = defaultdict(RankedDictionary)
+        self.all = RankedDictionary()
+        self.previous = START
+        self.article = None
+        self.level = 2
+        self.lead = 0
+
+    def code(self, article: int, kind: bytes, heading: Tuple[int, int, int, bytes] = None):
+        """Codes heading = (level, lead, trail, title); returns (heading, stage)"""
+        bits = self.bits
+        encoding = heading is not None
+        level, lead, trail, title = heading if encoding else (0, 0, 0, b'')
+
+        if article != self.article:
+            self.article = article
+            self.previous = START
+
+        level = bits.number(('level', self.level), level - 2) + 2
+        lead = bits.number(('lead', self.lead), lead)
+        trail = bits.number(('trail', lead), trail)
+
+        stage = 3
+        lists = (self.by_type_previous.get((kind, self.previous)), self.by_previous.get(self.previous), self.all)
+        for s, candidates in enumerate(lists):
+            if not candidates:
+                continue
+            limit = MAX_CONTEXT_RANK if s < 2 else len(candidates)
+            rank = candidates.rank(title) if encoding else -1
+            hit = bits.bit(('hit', s, level), 1 if 0 <= rank < limit else 0)
+            if hit:
+                rank = bits.number(('rank', s), rank)
+                title = candidates.items[rank]
+                stage = s
+                break
+        if stage == 3:
+            title = bits.literal(title)
+
+        for candidates in (self.by_type_previous[(kind, self.previous)], self.by_previous[self.previous], self.all):
+            rank = candidates.rank(title)
+            if rank < 0:
+                candidates.add(title)
+                rank = len(candidates) - 1
+            candidates.touch(rank)
+
+        self.previous = title
+        self.level = level
+        self.lead = lead
+        return (level, lead, trail, title), stage
+
+
+def format_heading(level: int, lead: int, trail: int, title: bytes) -> bytes:
+    marks = b'=' * level
+    return marks + b' ' * lead + title + b' ' * trail + marks
+
+
+def split_heading(m) -> Tuple[int, int, int, bytes]:
+    inner = m.group(2)
+    title = inner.strip(b' ')
+    if not title:
+        return len(m.group(1)), len(inner), 0, b''
+    lead = len(inner) - len(inner.lstrip(b' '))
+    trail = len(inner) - len(inner.rstrip(b' '))
+    return len(m.group(1)), lead, trail, title
+
+
+class HeadingChannelEncoder:
+    def __init__(self):
+        self.stats = {'headings': 0, 'heading_bytes': 0, 'bits': 0.0,
+                      'stage_count': [0] * 4, 'stage_bits': [0.0] * 4, 'position_bits': 0.0}
+
+    def encode(self, data: bytes) -> Tuple[bytes, bytes]:
+        """Returns (main stream, channel)"""
+        matches = list(HEADING_PATTERN.finditer(data))
+        pieces = []
+        positions = []
+        pos = 0
+        removed = 0
+        for m in matches:
+            pieces.append(data[pos:m.start()])
+            positions.append(m.start() - removed)
+            removed += m.end() - m.start()
+            pos = m.end()
+        pieces.append(data[pos:])
+        main = b''.join(pieces)
+
+        coder = BinaryArithmeticEncoder()
+        bits = _AdaptiveBits(encoder=coder)
+        model = HeadingModel(bits)
+        types = _ArticleTypes(main)
+        stats = self.stats
+
+        previous_pos = 0
+        for m, pos in zip(matches, positions):
+            before = bits.cost
+            bits.number('lines', main.count(b'\n', previous_pos, pos))
+            previous_pos = pos
+            stats['position_bits'] += bits.cost - before
+
+            article = types.article(pos)
+            heading = split_heading(m)
+            start_cost = bits.cost
+            _, stage = model.code(article, types.type_of(article), heading)
+            stats['stage_count'][stage] += 1
+            stats['stage_bits'][stage] += bits.cost - start_cost
+            stats['heading_bytes'] += m.end() - m.start()
+
+        stats['headings'] = len(matches)
+        stats['bits'] = bits.cost
+        out = bytearray(MAGIC)
+        out += len(matches).to_bytes(4, 'little')
+        out += coder.flush()
+        return main, bytes(out)
+
+
+def decode_headings(main: bytes, channel: bytes) -> bytes:
+    if channel[:4] != MAGIC:
+        raise ValueError("Not a heading channel")
+    count = int.from_bytes(channel[4:8], 'little')
+    bits = _AdaptiveBits(decoder=BinaryArithmeticDecoder(channel, 8))
+    model = HeadingModel(bits)
+    types = _ArticleTypes(main)
+
+    out = []
+    pos = 0
+    cursor = 0
+    for _ in range(count):
+        for _ in range(bits.number('lines')):
+            pos = main.index(b'\n', pos) + 1
+        article = types.article(pos)
+        (level, lead, trail, title), _ = model.code(article, types.type_of(article))
+        out.append(main[cursor:pos])
+        out.append(format_heading(level, lead, trail, title))
+        cursor = pos
+    out.append(main[cursor:])
+    return b''.join(out)
+
+
+def main():
+    input_file = Path(sys.argv[1]) if len(sys.argv) > 1 else Path("wiki_1mb.txt")
+
+    print("=" * 70)
+    print("SECTION HEADING CHANNEL - ranked candidates per (article type, previous heading)")
+    print("=" * 70)
+
+    data = input_file.read_bytes()
+    encoder = HeadingChannelEncoder()
+    start = time.perf_counter()
+    main_stream, channel = encoder.encode(data)
+    encode_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    restored = decode_headings(main_stream, channel)
+    decode_time = time.perf_counter() - start
+    if restored != data:
+        raise RuntimeError("Round trip FAILED")
+
+    stats = encoder.stats
+    n = max(1, stats['headings'])
+    print(f"\nInput:      {input_file} ({len(data):,} bytes)")
+    print(f"Headings:   {stats['headings']:,} lines, {stats['heading_bytes']:,} bytes")
+    print(f"Channel:    {len(channel):,} bytes ({len(channel) * 8 / n:.1f} bits/heading, "
+          f"{len(channel) * 8 / max(1, stats['heading_bytes']):.3f} bits/byte)")
+    print(f"Positions:  {stats['position_bits'] / n:.1f} bits/heading")
+    print(f"Time:       encode {encode_time:.2f} s, decode {decode_time:.2f} s")
+
+    print(f"\n{'Coded as':<16} {'Headings':>9} {'Share':>7} {'Bits/heading':>13}")
+    print("-" * 50)
+    for stage, name in enumerate(HeadingModel.STAGES):
+        count = stats['stage_count'][stage]
+        if count:
+            print(f"{name:<16} {count:>9,} {count / n * 100:>6.1f}% {stats['stage_bits'][stage] / count:>13.1f}")
+    print("-" * 50)
+    print("✅ Round trip verified")
+    print("=" * 70)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+"""
+Indirect (history-of-successors) context model
+
+Direct Order-N models predict from "what followed this context". The
+indirect model asks "what followed this 1-2 byte context the last two
+times it appeared" and uses that successor history as a context of its
+own. Cheap (128 KB of history) and strong on Wikipedia text, where the
+same short contexts keep being followed by the same few bytes.
+"""
+import sys
+from array import array
+
+from context_mixing import HashedContextModel, hash_context, benchmark, default_models
+
+
+class IndirectModel(HashedContextModel):
+    """
+    Successor histories (first table):
+        history1[c1]       last two bytes that followed order-1 context c1
+        history2[c2 c1]    same for the order-2 context
+
+    Contexts hashed into the ContextTable (one mixer input each):
+        1. history1 + c1
+        2. history2 + c1
+        3. last successor of both histories
+        4. history2 + c2 c1
+    """
+
+    name = 'indirect'
+
+    def __init__(self, table=None, table_bits=22):
+        super().__init__(4, table, table_bits)
+        self.history1 = array('H', [0]) * 256
+        self.history2 = array('H', [0]) * 65536
+        self.c2 = 0  # last two bytes, c2 = (older << 8) | newest
+        self.update_byte(0)
+
+    def update_byte(self, byte):
+        c2 = self.c2
+        c1 = c2 & 0xFF
+        history1 = self.history1
+        history2 = self.history2
+
+        # The byte just coded is a successor of the previous contexts
+        history1[c1] = ((history1[c1] << 8) | byte) & 0xFFFF
+        history2[c2] = ((history2[c2] << 8) | byte) & 0xFFFF
+
+        self.c2 = c2 = ((c2 << 8) | byte) & 0xFFFF
+        t1 = history1[byte]
+        t2 = history2[c2]
+
+        self.hashes = [
+            hash_context((t1 << 8) | byte, 401),
+            hash_context((t2 << 8) | byte, 402),
+            hash_context(((t1 & 0xFF) << 8) | (t2 & 0xFF), 403),
+            hash_context((t2 << 16) | c2, 404),
+        ]
+
+
+def main():
+    size = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+
+    print("=" * 70)
+    print("INDIRECT MODEL - history-of-successors contexts")
+    print("=" * 70)
+
+    with open("wiki_1mb.txt", 'rb') as f:
+        data = f.read(size)
+    print(f"\nInput: wiki_1mb.txt, first {len(data):,} bytes\n")
+
+    def with_indirect():
+        models = default_models()
+        return models + [IndirectModel(table=models[0].table)]
+
+    base, _, _ = benchmark(data, default_models, "default models")
+    indirect, _, _ = benchmark(data, with_indirect, "+ indirect model")
+
+    print(f"\n  Indirect model saves {base - indirect:,} bytes ({(base - indirect) / base * 100:.2f}%)")
+    print("=" * 70)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,411 @@
+#!/usr/bin/env python3
+"""
+NumPy LSTM byte predictor - online training with truncated BPTT
+
+PHASE4_LSTM_PLAN.md aims at an LSTM model and test_lstm.cpp exercises
+paq8px's LstmMixer, but nothing in Python could run one. ByteLSTM is a
+CPU NumPy LSTM over bytes that trains while it predicts (every `bptt`
+steps it backpropagates through the last window and takes an Adam step).
+
+Batching: B independent slices ("lanes") of the input advance in
+lockstep, so every matrix op is a (B, H) x (H, 4H) GEMM instead of a
+vector op. LSTMMixingCompressor codes the lanes interleaved, which lets
+the decoder reproduce exactly the same batched forward passes.
+
+Encoder and decoder must run the same NumPy/BLAS build - the model is
+floating point and has to be bit-for-bit reproducible on both sides.
+"""
+import math
+import struct
+import sys
+import time
+
+import numpy as np
+
+from arithmetic_coder import BinaryArithmeticEncoder, BinaryArithmeticDecoder
+from context_mixing import ContextTable, Mixer, OrderModel, STRETCH
+from word_model import WordModel
+from sparse_model import SparseModel
+
+
+class ByteLSTM:
+    """
+    Single layer LSTM: previous byte -> embedding -> LSTM(H) -> softmax(256)
+
+    Args:
+        hidden: LSTM cell count H
+        batch: number of lanes B advanced in lockstep
+        bptt: truncated BPTT window (steps)
+        learning_rate: Adam step size
+    """
+
+    def __init__(self, hidden=32, batch=1, bptt=10, learning_rate=0.01, seed=1):
+        self.hidden = hidden
+        self.batch = batch
+        self.bptt = bptt
+        self.learning_rate = learning_rate
+
+        rng = np.random.default_rng(seed)
+        scale = 1 / math.sqrt(hidden)
+        H = hidden
+        self.params = {
+            'Wx': rng.uniform(-scale, scale, (256, 4 * H)).astype(np.float32),
+            'Wh': rng.uniform(-scale, scale, (H, 4 * H)).astype(np.float32),
+            'b': np.zeros(4 * H, dtype=np.float32),
+            'Wy': rng.uniform(-scale, scale, (H, 256)).astype(np.float32),
+            'by': np.zeros(256, dtype=np.float32),
+        }
+        self.params['b'][H:2 * H] = 1.0  # forget gate bias
+        self.adam_m = {k: np.zeros_like(v) for k, v in self.params.items()}
+        self.adam_v = {k: np.zeros_like(v) for k, v in self.params.items()}
+        self.adam_t = 0
+
+        self.h = np.zeros((batch, H), dtype=np.float32)
+        self.c = np.zeros((batch, H), dtype=np.float32)
+        self.window = []   # cached steps of the current BPTT window
+        self.targets = np.zeros(batch, dtype=np.int64)
+        self.active = np.ones(batch, dtype=bool)
+        self.observed = 0
+        self._cum = None   # per lane cumulative distribution (lists), lazy
+
+        self.forward(np.zeros(batch, dtype=np.int64))
+
+    def forward(self, x):
+        """One lockstep step: x = previous byte of every lane, (B,)"""
+        p = self.params
+        H = self.hidden
+        h_prev = self.h
+        c_prev = self.c
+
+        z = p['Wx'][x] + h_prev @ p['Wh'] + p['b']
+        ifo = 1 / (1 + np.exp(-z[:, :3 * H]))
+        i = ifo[:, :H]
+        f = ifo[:, H:2 * H]
+        o = ifo[:, 2 * H:]
+        g = np.tanh(z[:, 3 * H:])
+        c = f * c_prev + i * g
+        tc = np.tanh(c)
+        h = o * tc
+
+        logits = h @ p['Wy'] + p['by']
+        logits -= logits.max(axis=1, keepdims=True)
+        e = np.exp(logits)
+        probs = e / e.sum(axis=1, keepdims=True)
+
+        self.h = h
+        self.c = c
+        self.probs = probs
+        self.cache = (x, h_prev, c_prev, i, f, o, g, c, tc, h, probs)
+        self._cum = None
+
+    @property
+    def cum(self):
+        """Cumulative distribution per lane, cum[lane][k] = P(byte < k)"""
+        if self._cum is None:
+            cum = np.zeros((self.batch, 257))
+            np.cumsum(self.probs, axis=1, out=cum[:, 1:])
+            self._cum = cum.tolist()
+        return self._cum
+
+    def observe_lane(self, lane, byte, active=True):
+        """Record the actual byte of a lane; steps once every lane reported"""
+        self.targets[lane] = byte
+        self.active[lane] = active
+        self.observed += 1
+        if self.observed == self.batch:
+            self.observed = 0
+            self.observe(self.targets.copy(), self.active.copy())
+
+    def observe(self, targets, active=None):
+        """Train on the actual bytes of all lanes, then predict the next step"""
+        if active is None:
+            active = np.ones(self.batch, dtype=bool)
+        self.window.append(self.cache + (targets, active))
+        if len(self.window) >= self.bptt:
+            self.backward()
+        self.forward(targets)
+
+    def backward(self):
+        """Truncated BPTT through the cached window, then one Adam step"""
+        p = self.params
+        H = self.hidden
+        B = self.batch
+        window = self.window
+        self.window = []
+
+        # Output layer gradients do not depend on the recurrence:
+        # one GEMM over the whole window instead of one per step
+        T = len(window)
+        hs = np.concatenate([step[9] for step in window])
+        dlogits = np.concatenate([step[10] for step in window])
+        targets = np.concatenate([step[11] for step in window])
+        active = np.concatenate([step[12] for step in window])
+        dlogits[np.arange(T * B), targets] -= 1
+        dlogits[~active] = 0
+        count = int(active.sum())
+        if count == 0:
+            return
+
+        grads = {
+            'Wy': hs.T @ dlogits,
+            'by': dlogits.sum(axis=0),
+        }
+        dh_out = (dlogits @ p['Wy'].T).reshape(T, B, H)
+
+        dz_all = np.empty((T, B, 4 * H), dtype=np.float32)
+        dh_next = np.zeros((B, H), dtype=np.float32)
+        dc_next = np.zeros((B, H), dtype=np.float32)
+        Wh_T = p['Wh'].T
+        for t in range(T - 1, -1, -1):
+            x, h_prev, c_prev, i, f, o, g, c, tc, h, probs, y, act = window[t]
+            dh = dh_out[t] + dh_next
+            dc = dh * o * (1 - tc * tc) + dc_next
+
+            dz = dz_all[t]
+            dz[:, :H] = dc * g * i * (1 - i)
+            dz[:, H:2 * H] = dc * c_prev * f * (1 - f)
+            dz[:, 2 * H:3 * H] = dh * tc * o * (1 - o)
+            dz[:, 3 * H:] = dc * i * (1 - g * g)
+
+            dh_next = dz @ Wh_T
+            dc_next = dc * f
+
+        dz_flat = dz_all.reshape(T * B, 4 * H)
+        xs = np.concatenate([step[0] for step in window])
+        h_prevs = np.concatenate([step[1] for step in window])
+        onehot = np.zeros((T * B, 256), dtype=np.float32)
+        onehot[np.arange(T * B), xs] = 1
+        grads['Wx'] = onehot.T @ dz_flat
+        grads['Wh'] = h_prevs.T @ dz_flat
+        grads['b'] = dz_flat.sum(axis=0)
+
+        self.adam_t += 1
+        lr = self.learning_rate * math.sqrt(1 - 0.999 ** self.adam_t) / (1 - 0.9 ** self.adam_t)
+        for k, grad in grads.items():
+            grad /= count
+            np.clip(grad, -5, 5, out=grad)
+            m = self.adam_m[k]
+            v = self.adam_v[k]
+            m *= 0.9
+            m += 0.1 * grad
+            v *= 0.999
+            v += 0.001 * grad * grad
+            p[k] -= lr * m / (np.sqrt(v) + 1e-8)
+
+    def memory_bytes(self):
+        return sum(v.nbytes for v in self.params.values()) * 3
+
+
+class LSTMModel:
+    """
+    Mixer input from one lane of a ByteLSTM
+
+    The byte distribution is turned into P(bit=1 | partial byte c0) from
+    the cumulative distribution, i.e. the mass of the 1-subtree over the
+    mass of the subtree selected by the bits seen so far.
+    """
+
+    name = 'lstm'
+    n_inputs = 1
+
+    def __init__(self, lstm=None, lane=0, hidden=32):
+        self.lstm = lstm if lstm is not None else ByteLSTM(hidden, batch=1)
+        self.lane = lane
+
+    def predict(self, c0, inputs):
+        k = c0.bit_length() - 1
+        shift = 8 - k
+        lo = (c0 - (1 << k)) << shift
+        hi = lo + (1 << shift)
+        mid = (lo + hi) >> 1
+        cum = self.lstm.cum[self.lane]
+        total = cum[hi] - cum[lo]
+        pr = int((cum[hi] - cum[mid]) / total * 4096) if total > 0 else 2048
+        if pr < 1:
+            pr = 1
+        elif pr > 4095:
+            pr = 4095
+        inputs.append(STRETCH[pr])
+
+    def update(self, bit):
+        pass
+
+    def update_byte(self, byte):
+        self.lstm.observe_lane(self.lane, byte)
+
+
+def lane_models(table):
+    """Hashed models of one lane (the ContextTable is shared by all lanes)"""
+    return [OrderModel(table=table), WordModel(table=table), SparseModel(table=table)]
+
+
+class LSTMMixingCompressor:
+    """
+    Context mixing over B input slices coded in lockstep
+
+    Slice b holds bytes [b*L, (b+1)*L). Step t codes byte t of every slice
+    in lane order. Each lane has its own hashed models (histories), while
+    the ContextTable, the mixer and one ByteLSTM running all lanes as a
+    batch are shared. hidden=0 codes the same lanes without the LSTM.
+    """
+
+    MAGIC = b'CML1'
+
+    def __init__(self, lanes=8, hidden=32, bptt=10, learning_rate=0.01,
+                 lane_factory=None, mixer_learning_rate=0.000015):
+        self.lanes = lanes
+        self.hidden = hidden
+        self.bptt = bptt
+        self.learning_rate = learning_rate
+        self.lane_factory = lane_factory or lane_models
+        self.mixer_learning_rate = mixer_learning_rate
+
+    def reset(self):
+        self.lstm = ByteLSTM(self.hidden, self.lanes, self.bptt, self.learning_rate) if self.hidden else None
+        table = ContextTable(bits=22)
+        self.lane_models = []
+        for lane in range(self.lanes):
+            models = self.lane_factory(table)
+            if self.lstm is not None:
+                models.append(LSTMModel(self.lstm, lane))
+            self.lane_models.append(models)
+        n_inputs = sum(m.n_inputs for m in self.lane_models[0]) + 1
+        self.mixer = Mixer(n_inputs, learning_rate=self.mixer_learning_rate)
+
+    def _skip_lane(self, lane):
+        if self.lstm is not None:
+            self.lstm.observe_lane(lane, 0, False)
+
+    def slice_length(self, length):
+        return -(-length // self.lanes)
+
+    def _predict(self, models, mixer, c0):
+        inputs = [256]
+        for model in models:
+            model.predict(c0, inputs)
+        return mixer.mix(inputs, c0)
+
+    def _update(self, models, mixer, bit):
+        mixer.update(bit)
+        for model in models:
+            model.update(bit)
+
+    def compress(self, data):
+        self.reset()
+        encoder = BinaryArithmeticEncoder()
+        L = self.slice_length(len(data))
+
+        for t in range(L):
+            for lane in range(self.lanes):
+                models = self.lane_models[lane]
+                pos = lane * L + t
+                if pos >= len(data):
+                    self._skip_lane(lane)
+                    continue
+                mixer = self.mixer
+                byte = data[pos]
+                c0 = 1
+                for j in range(7, -1, -1):
+                    bit = (byte >> j) & 1
+                    encoder.encode_bit(bit, self._predict(models, mixer, c0))
+                    self._update(models, mixer, bit)
+                    c0 = (c0 << 1) | bit
+                for model in models:
+                    model.update_byte(byte)
+
+        header = struct.pack('<IHHH', len(data), self.lanes, self.hidden, self.bptt)
+        return self.MAGIC + header + encoder.flush()
+
+    def decompress(self, blob):
+        if blob[:4] != self.MAGIC:
+            raise ValueError("Not an LSTM mixing stream")
+        length, self.lanes, self.hidden, self.bptt = struct.unpack('<IHHH', blob[4:14])
+
+        self.reset()
+        decoder = BinaryArithmeticDecoder(blob, 14)
+        L = self.slice_length(length)
+        out = bytearray(length)
+
+        for t in range(L):
+            for lane in range(self.lanes):
+                models = self.lane_models[lane]
+                pos = lane * L + t
+                if pos >= length:
+                    self._skip_lane(lane)
+                    continue
+                mixer = self.mixer
+                c0 = 1
+                while c0 < 256:
+                    bit = decoder.decode_bit(self._predict(models, mixer, c0))
+                    self._update(models, mixer, bit)
+                    c0 = (c0 << 1) | bit
+                byte = c0 & 0xFF
+                out[pos] = byte
+                for model in models:
+                    model.update_byte(byte)
+
+        return bytes(out)
+
+
+def measure_lstm(data, hidden, batch, bptt=10):
+    """
+    Run ByteLSTM alone over data split into `batch` slices
+
+    Returns (bpc, KB/s). bpc is the exact ideal code length -log2 p(byte)
+    of the online predictions (what an arithmetic coder would spend).
+    """
+    L = len(data) // batch
+    lanes = np.frombuffer(data[:L * batch], dtype=np.uint8).reshape(batch, L).astype(np.int64)
+    lstm = ByteLSTM(hidden, batch, bptt)
+    rows = np.arange(batch)
+    bits = 0.0
+
+    start = time.time()
+    for t in range(L):
+        y = lanes[:, t]
+        bits -= np.log2(np.maximum(lstm.probs[rows, y], 1e-12)).sum()
+        lstm.observe(y)
+    elapsed = time.time() - start
+
+    return bits / (L * batch), L * batch / 1024 / elapsed
+
+
+def main():
+    size = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+
+    print("=" * 70)
+    print("NUMPY LSTM BYTE PREDICTOR")
+    print("=" * 70)
+
+    with open("wiki_1mb.txt", 'rb') as f:
+        data = f.read(size)
+    print(f"\nInput: wiki_1mb.txt, {len(data):,} bytes")
+
+    print(f"\n[1] LSTM alone (online, truncated BPTT = 10)\n")
+    print(f"  {'hidden':>6} {'batch':>6} {'bpc':>8} {'KB/s':>9}")
+    print("  " + "-" * 32)
+    for hidden in (32, 64, 128):
+        for batch in (1, 16, 64, 256):
+            bpc, speed = measure_lstm(data, hidden, batch)
+            print(f"  {hidden:>6} {batch:>6} {bpc:>8.3f} {speed:>9.1f}")
+
+    sample = data[:100000]
+    print(f"\n[2] LSTM as a mixer input ({len(sample):,} bytes, 4 lanes)\n")
+
+    for hidden in (0, 32, 64):
+        label = f"+ LSTM H={hidden}" if hidden else "context mixing, no LSTM"
+        compressor = LSTMMixingCompressor(lanes=4, hidden=hidden)
+        start = time.time()
+        blob = compressor.compress(sample)
+        elapsed = time.time() - start
+        if compressor.decompress(blob) != sample:
+            raise RuntimeError(f"{label}: round trip FAILED")
+        print(f"  {label:<28} {len(blob):>9,} bytes  "
+              f"{len(blob) * 8 / len(sample):.3f} bpc  {len(sample) / 1024 / elapsed:6.1f} KB/s")
+
+    print("\n✅ Round trip verified")
+    print("=" * 70)
+
+
+if __name__ == "__main__":
+    main()
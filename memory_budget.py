@@ -0,0 +1,319 @@
+#!/usr/bin/env python3
+"""
+Memory accounting and budgets for the count models
+
+ContextModel.contexts, the text_model / link_order6 tables of the hybrid
+compressors and LinkGraph.edges are dicts that grow with the input until
+the OOM killer steps in. Here every model gets an account that reports
+its live footprint and can shrink it, and a MemoryManager splits a total
+byte budget between the accounts:
+
+    CountTableAccount   {context: Counter / dict} tables. Footprint is
+                        structure-aware: the outer dict plus deep sizes of
+                        a stride sample of entries, scaled to the table.
+                        Over its share it keeps as many contexts as fit
+                        LOW_WATER x share at the measured mean entry size
+                        - the largest total counts, newest among equals -
+                        and re-measures; if the protected contexts alone
+                        do not fit it resets the table.
+    FixedAccount        anything with memory_bytes() (ContextTable,
+                        RunModel, ...): fixed size, reserved first.
+
+Training loops call manager.tick() per item; every check_every items
+the manager measures all accounts and logs each decision (prune / reset /
+over budget) with the sizes before and after. Between checks a table
+can outgrow its share by what check_every items add.
+
+Link tables share their target strings with the vocabulary, so the
+sampled deep size counts those strings once per referencing entry and is
+an upper bound there.
+"""
+import sys
+import time
+from collections import defaultdict
+from dataclasses import dataclass
+from itertools import islice
+from typing import Callable, Dict, List, Optional
+
+LOW_WATER = 0.75            # prune down to this fraction of the share
+SAMPLE_ENTRIES = 512
+FIT_MARGIN = 0.98           # prune passes aim this far below the target
+_ATOMS = (str, bytes, int, float, bool, type(None))
+
+
+@dataclass
+class MemoryUsage:
+    entries: int
+    bytes: int
+
+
+@dataclass
+class BudgetDecision:
+    seconds: float          # since the manager started
+    account: str
+    action: str             # 'prune', 'reset', 'over budget (fixed)'
+    share: int
+    bytes_before: int
+    bytes_after: int
+    entries_before: int
+    entries_after: int
+
+    def __str__(self):
+        return (f"[memory {self.seconds:7.1f}s] {self.account}: {self.action}, "
+                f"{self.bytes_before / 2**20:,.1f} -> {self.bytes_after / 2**20:,.1f} MB "
+                f"(share {self.share / 2**20:,.1f} MB), "
+                f"{self.entries_before:,} -> {self.entries_after:,} entries")
+
+
+def deep_size(obj, seen=None) -> int:
+    """Bytes of obj and everything it holds; cached small ints and 1-char strings cost nothing"""
+    if seen is None:
+        seen = set()
+    if id(obj) in seen:
+        return 0
+    if isinstance(obj, _ATOMS):
+        if obj is None or isinstance(obj, bool) or (type(obj) is int and -5 <= obj <= 256):
+            return 0
+        if type(obj) is str and len(obj) == 1 and ord(obj) < 256:
+            return 0
+        return sys.getsizeof(obj)
+    seen.add(id(obj))
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        for k, v in obj.items():
+            size += deep_size(k, seen) + deep_size(v, seen)
+    elif isinstance(obj, (list, tuple, set, frozenset)):
+        for v in obj:
+            size += deep_size(v, seen)
+    return size
+
+
+def table_usage(table: dict, sample: int = SAMPLE_ENTRIES) -> MemoryUsage:
+    """Footprint of a {context: container} table from a stride sample of its entries"""
+    n = len(table)
+    outer = sys.getsizeof(table)
+    if not n:
+        return MemoryUsage(0, outer)
+    step = max(1, n // sample)
+    total = sampled = 0
+    for key, value in islice(table.items(), 0, None, step):
+        total += deep_size(key) + deep_size(value)
+        sampled += 1
+    return MemoryUsage(n, int(outer + total * n / sampled))
+
+
+class CountTableAccount:
+    """
+    A {context: Counter / dict of counts} table
+
+    Args:
+        keep: contexts never pruned (e.g. short backoff contexts)
+    """
+
+    growable = True
+
+    def __init__(self, table: dict, keep: Callable[[object], bool] = None):
+        self.table = table
+        self.keep = keep
+
+    def usage(self) -> MemoryUsage:
+        return table_usage(self.table)
+
+    def shrink(self, target: int) -> str:
+        """Keeps the most used contexts that fit target bytes, else clears the table; returns the action"""
+        table, keep = self.table, self.keep
+        usage = self.usage()
+        protected = sum(1 for ctx in table if keep and keep(ctx)) if keep else 0
+        removed, threshold = 0, 0
+        for _ in range(8):  # sizes are sampled estimates, kept contexts run larger than the mean
+            if usage.bytes <= target or not usage.entries:
+                break
+            # How many entries fit at the measured mean size, protected ones included,
+            # aiming a little low so the re-measurements converge
+            fit = int(target * FIT_MARGIN * usage.entries / usage.bytes) - protected
+            if fit <= 0:
+                break
+            # Largest total count first, newest first among equals (older ones go first)
+            ranked = sorted(((sum(counts.values()), age, ctx) for age, (ctx, counts) in enumerate(table.items())
+                             if not (keep and keep(ctx))), key=lambda c: (c[0], c[1]), reverse=True)
+            if len(ranked) <= fit:
+                break
+            for total, _, ctx in ranked[fit:]:
+                del table[ctx]
+                threshold = max(threshold, total)
+            removed += len(ranked) - fit
+            _compact(table)
+            usage = self.usage()
+        if usage.bytes <= target:
+            return f'prune {removed:,} contexts (total count <= {threshold})' if removed else 'none'
+        kept = {ctx: table[ctx] for ctx in table if keep and keep(ctx)}
+        table.clear()
+        table.update(kept)
+        return 'reset'
+
+
+def _compact(table: dict):
+    """dicts keep their hash table after deletions; rebuilding in place releases it"""
+    items = list(table.items())
+    table.clear()
+    table.update(items)
+
+
+class FixedAccount:
+    """A model of fixed size reporting memory_bytes() (hashed counter tables)"""
+
+    growable = False
+
+    def __init__(self, model, entries: Callable[[], int] = None):
+        self.model = model
+        self.entries = entries
+
+    def usage(self) -> MemoryUsage:
+        entries = self.entries() if self.entries else len(getattr(self.model, 'slots', ()))
+        return MemoryUsage(entries, self.model.memory_bytes())
+
+    def shrink(self, target: int) -> str:
+        return 'over budget (fixed)'
+
+
+class MemoryManager:
+    """
+    Splits total_bytes between registered accounts and enforces the shares
+
+    Fixed accounts are reserved first; the rest is split between the
+    growable accounts by weight.
+
+    Usage:
+        memory = MemoryManager(512 * 2**20)
+        memory.register('order5', CountTableAccount(model.contexts))
+        for ...:
+            ...
+            memory.tick()
+        print(memory.report())
+    """
+
+    def __init__(self, total_bytes: int, check_every: int = 100000, log: Optional[Callable[[str], None]] = print):
+        self.total_bytes = total_bytes
+        self.check_every = check_every
+        self.log = log
+        self.accounts: Dict[str, object] = {}
+        self.weights: Dict[str, float] = {}
+        self.decisions: List[BudgetDecision] = []
+        self.peak: Dict[str, int] = defaultdict(int)
+        self.started = time.perf_counter()
+        self._countdown = check_every
+
+    def register(self, name: str, account, weight: float = 1.0):
+        self.accounts[name] = account
+        self.weights[name] = weight
+
+    def shares(self) -> Dict[str, int]:
+        fixed = {name: a.usage().bytes for name, a in self.accounts.items() if not a.growable}
+        left = max(0, self.total_bytes - sum(fixed.values()))
+        weight = sum(w for name, w in self.weights.items() if name not in fixed) or 1.0
+        return {name: fixed[name] if name in fixed else int(left * self.weights[name] / weight)
+                for name in self.accounts}
+
+    def tick(self, n: int = 1):
+        self._countdown -= n
+        if self._countdown <= 0:
+            self._countdown = self.check_every
+            self.check()
+
+    def check(self) -> List[BudgetDecision]:
+        """Measures every account and shrinks the ones over their share"""
+        shares = self.shares()
+        decisions = []
+        fixed_total = sum(a.usage().bytes for a in self.accounts.values() if not a.growable)
+        for name, account in self.accounts.items():
+            before = account.usage()
+            self.peak[name] = max(self.peak[name], before.bytes)
+            over = before.bytes > shares[name] if account.growable else fixed_total > self.total_bytes
+            if not over:
+                continue
+            action = account.shrink(int(shares[name] * LOW_WATER))
+            after = account.usage()
+            decision = BudgetDecision(time.perf_counter() - self.started, name, action, shares[name],
+                                      before.bytes, after.bytes, before.entries, after.entries)
+            decisions.append(decision)
+            if self.log:
+                self.log(str(decision))
+        self.decisions += decisions
+        return decisions
+
+    def report(self) -> str:
+        shares = self.shares()
+        lines = [f"{'model':<16} {'entries':>11} {'MB':>9} {'peak MB':>9} {'share MB':>9} {'actions':>8}",
+                 "-" * 67]
+        total = 0
+        for name, account in self.accounts.items():
+            usage = account.usage()
+            total += usage.bytes
+            actions = sum(1 for d in self.decisions if d.account == name)
+            lines.append(f"{name:<16} {usage.entries:>11,} {usage.bytes / 2**20:>9.1f} "
+                         f"{max(self.peak[name], usage.bytes) / 2**20:>9.1f} {shares[name] / 2**20:>9.1f} "
+                         f"{actions:>8}")
+        lines.append(f"{'total':<16} {'':>11} {total / 2**20:>9.1f} {'':>9} {self.total_bytes / 2**20:>9.1f}")
+        return "\n".join(lines)
+
+
+def main():
+    from context_mixing import ContextTable
+    from context_model import ContextModel
+    from experiments.exploratory.graph_compressor import LinkGraph
+    from production_hybrid_compressor import ProductionHybridCompressor
+
+    budget_mb = float(sys.argv[1]) if len(sys.argv) > 1 else 24
+    size = int(sys.argv[2]) if len(sys.argv) > 2 else 1000000
+
+    print("=" * 70)
+    print(f"MEMORY BUDGET - {budget_mb:g} MB across the count models")
+    print("=" * 70)
+
+    with open("wiki_1mb.txt", 'rb') as f:
+        data = f.read(size)
+    text = data.decode('utf-8', errors='ignore')
+
+    print("\nUnbounded:")
+    start = time.perf_counter()
+    free = ContextModel(order=4)
+    free.train(data)
+    free_hybrid = ProductionHybridCompressor()
+    free_hybrid.train(text, train_size=len(text))
+    print(f"  ContextModel order-4: {table_usage(free.contexts).bytes / 2**20:.1f} MB, "
+          f"hybrid text_model: {table_usage(free_hybrid.text_model).bytes / 2**20:.1f} MB "
+          f"({time.perf_counter() - start:.1f}s)")
+
+    print(f"\nBudget {budget_mb:g} MB:")
+    memory = MemoryManager(int(budget_mb * 2**20), check_every=50000)
+    model = ContextModel(order=4)
+    hybrid = ProductionHybridCompressor()
+    graph = LinkGraph()
+    memory.register('cm table', FixedAccount(ContextTable(bits=20)))
+    memory.register('order4 contexts', CountTableAccount(model.contexts, keep=lambda ctx: len(ctx) < 2))
+    memory.register('text_model', CountTableAccount(hybrid.text_model), weight=2)
+    memory.register('link_order6', CountTableAccount(hybrid.link_order6), weight=0.5)
+    memory.register('link_order2', CountTableAccount(hybrid.link_order2), weight=0.5)
+    memory.register('link graph', CountTableAccount(graph.edges), weight=0.5)
+    start = time.perf_counter()
+    model.train(data, memory=memory)
+    hybrid.train(text, train_size=len(text), memory=memory)
+    graph.train(hybrid.extract_links(text), memory=memory)
+    memory.check()
+    print(f"  ({time.perf_counter() - start:.1f}s)\n")
+    print(memory.report())
+
+    over = [d for d in memory.decisions if d.bytes_after > d.share]
+    if over:
+        raise RuntimeError(f"{len(over)} decisions left a model over its share")
+    # Pruning aims at LOW_WATER x share; far below that it threw away contexts that fit
+    wiped = [d for d in memory.decisions if d.action != 'over budget (fixed)'
+             and d.bytes_after < d.share * LOW_WATER / 2]
+    if wiped:
+        raise RuntimeError(f"{len(wiped)} prunes left a model under half its target: {wiped[0]}")
+    print(f"\n✅ {len(memory.decisions)} budget decisions, every model within its share and not over-pruned")
+    print("=" * 70)
+
+
+if __name__ == "__main__":
+    main()
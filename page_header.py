@@ -0,0 +1,417 @@
+#!/usr/bin/env python3
+"""
+Page-header metadata channel for enwik (ids, timestamps, contributors)
+
+Every <page> starts with the same XML boilerplate:
+
+      <page>
+        <title>...</title>
+        <id>842</id>
+        <revision>
+          <id>42041031</id>
+          <timestamp>2006-03-03T11:32:24Z</timestamp>
+          <contributor>
+            <username>Garion96</username>    (or <ip>...</ip>)
+            <id>397881</id>
+          </contributor>
+          <minor />
+          <comment>...</comment>
+          <text xml:space="preserve">
+
+The text models learn all of it byte by byte. This module lifts the
+headers out of the main stream into typed columns:
+
+    template      skeleton variant (optional restrictions/minor/comment, user/ip)
+    position      where the header was, as a delta in main-stream bytes
+    page_id       delta from the previous page id
+    revision_id   delta from the previous revision id
+    timestamp     seconds since the previous revision
+    contributor   recent-user MTF position, dictionary id, or 0 = new name
+    strings       titles, comments, new names, ips, restrictions
+
+Headers that do not match the skeleton exactly stay in the main stream,
+so the split is lossless for any input. Both directions stream.
+"""
+import calendar
+import lzma
+import re
+import sys
+import time
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+MAGIC = b'PHD1'
+
+HEADER_PATTERN = re.compile(
+    rb'  <page>\n'
+    rb'    <title>([^<\n]*)</title>\n'
+    rb'    <id>([1-9][0-9]*)</id>\n'
+    rb'(?:    <restrictions>([^<\n]*)</restrictions>\n)?'
+    rb'    <revision>\n'
+    rb'      <id>([1-9][0-9]*)</id>\n'
+    rb'      <timestamp>(\d{4}-\d\d-\d\dT\d\d:\d\d:\d\dZ)</timestamp>\n'
+    rb'      <contributor>\n'
+    rb'(?:        <username>([^<\n]*)</username>\n'
+    rb'        <id>([1-9][0-9]*|0)</id>\n'
+    rb'|        <ip>([^<\n]*)</ip>\n)'
+    rb'      </contributor>\n'
+    rb'(      <minor />\n)?'
+    rb'(?:      <comment>([^<\n]*)</comment>\n)?'
+    rb'      <text xml:space="preserve">'
+)
+
+# Template id bits (skeleton variant)
+HAS_RESTRICTIONS = 1
+IS_IP = 2
+IS_MINOR = 4
+HAS_COMMENT = 8
+
+TIMESTAMP_FORMAT = '%Y-%m-%dT%H:%M:%SZ'
+
+# Contributor codes: 0 = new name, 1..RECENT = MTF position + 1,
+# RECENT + 1 + id = dictionary id of an older name
+RECENT = 64
+
+STREAMS = ('template', 'position', 'page_id', 'revision_id', 'timestamp',
+           'contributor', 'user_id', 'title', 'comment', 'name', 'restrictions')
+
+
+def _write_varint(out: bytearray, n: int):
+    while n >= 0x80:
+        out.append((n & 0x7F) | 0x80)
+        n >>= 7
+    out.append(n)
+
+
+def _read_varint(buf, pos: int) -> Tuple[int, int]:
+    n = 0
+    shift = 0
+    while True:
+        b = buf[pos]
+        pos += 1
+        n |= (b & 0x7F) << shift
+        if b < 0x80:
+            return n, pos
+        shift += 7
+
+
+def _zigzag(n: int) -> int:
+    return (n << 1) if n >= 0 else ((-n << 1) - 1)
+
+
+def _unzigzag(z: int) -> int:
+    return (z >> 1) if not z & 1 else -((z + 1) >> 1)
+
+
+def parse_timestamp(ts: bytes) -> int:
+    """Seconds since the epoch, or -1 if ts is not a canonical timestamp"""
+    try:
+        seconds = calendar.timegm(time.strptime(ts.decode('ascii'), TIMESTAMP_FORMAT))
+    except ValueError:
+        return -1
+    return seconds if format_timestamp(seconds) == ts else -1
+
+
+def format_timestamp(seconds: int) -> bytes:
+    return time.strftime(TIMESTAMP_FORMAT, time.gmtime(seconds)).encode('ascii')
+
+
+def format_header(template: int, title: bytes, page_id: int, restrictions: bytes, revision_id: int,
+                  timestamp: int, name: bytes, user_id: int, comment: bytes) -> bytes:
+    """The exact header bytes for one set of field values"""
+    parts = [b'  <page>\n    <title>', title, b'</title>\n    <id>', b'%d' % page_id, b'</id>\n']
+    if template & HAS_RESTRICTIONS:
+        parts += [b'    <restrictions>', restrictions, b'</restrictions>\n']
+    parts += [b'    <revision>\n      <id>', b'%d' % revision_id, b'</id>\n      <timestamp>',
+              format_timestamp(timestamp), b'</timestamp>\n      <contributor>\n']
+    if template & IS_IP:
+        parts += [b'        <ip>', name, b'</ip>\n']
+    else:
+        parts += [b'        <username>', name, b'</username>\n        <id>', b'%d' % user_id, b'</id>\n']
+    parts.append(b'      </contributor>\n')
+    if template & IS_MINOR:
+        parts.append(b'      <minor />\n')
+    if template & HAS_COMMENT:
+        parts += [b'      <comment>', comment, b'</comment>\n']
+    parts.append(b'      <text xml:space="preserve">')
+    return b''.join(parts)
+
+
+class ContributorCoder:
+    """
+    Contributor (name, user id) -> integer code, MTF over the RECENT most
+    recent contributors, a dictionary id for everyone older. Encoder and
+    decoder run the same update, so the decoder needs no side table.
+    """
+
+    def __init__(self):
+        self.recent: List[Tuple[bytes, int]] = []
+        self.ids: Dict[Tuple[bytes, int], int] = {}
+        self.entries: List[Tuple[bytes, int]] = []
+
+    def _touch(self, key: Tuple[bytes, int], position: int):
+        if position >= 0:
+            del self.recent[position]
+        elif len(self.recent) >= RECENT:
+            self.recent.pop()
+        self.recent.insert(0, key)
+
+    def encode(self, key: Tuple[bytes, int]) -> int:
+        try:
+            position = self.recent.index(key)
+            code = position + 1
+        except ValueError:
+            position = -1
+            entry = self.ids.get(key)
+            if entry is None:
+                self.ids[key] = len(self.entries)
+                self.entries.append(key)
+                code = 0
+            else:
+                code = RECENT + 1 + entry
+        self._touch(key, position)
+        return code
+
+    def decode(self, code: int, new_key: Tuple[bytes, int] = None) -> Tuple[bytes, int]:
+        """new_key supplies the literal when code == 0"""
+        if code == 0:
+            key = new_key
+            self.ids[key] = len(self.entries)
+            self.entries.append(key)
+            position = -1
+        elif code <= RECENT:
+            position = code - 1
+            key = self.recent[position]
+        else:
+            key = self.entries[code - RECENT - 1]
+            position = self.recent.index(key) if key in self.recent else -1
+        self._touch(key, position)
+        return key
+
+
+class PageHeaderEncoder:
+    """
+    Streaming split: feed() input chunks, get main-stream bytes back,
+    finish() flushes; metadata() returns the serialized columns.
+    """
+
+    def __init__(self):
+        self.streams = {name: bytearray() for name in STREAMS}
+        self.contributors = ContributorCoder()
+        self.page_id = 0
+        self.revision_id = 0
+        self.timestamp = 0
+        self.main_pos = 0        # bytes of main stream emitted so far
+        self.last_header = 0     # main-stream position of the previous header
+        self.carry = b''
+        self.headers = 0
+        self.header_bytes = 0
+
+    def _encode_header(self, m) -> bool:
+        title, page_id, restrictions, revision_id, ts, username, user_id, ip, minor, comment = m.groups()
+        timestamp = parse_timestamp(ts)
+        if timestamp < 0:
+            return False
+
+        streams = self.streams
+        template = ((HAS_RESTRICTIONS if restrictions is not None else 0) | (IS_IP if ip is not None else 0)
+                    | (IS_MINOR if minor is not None else 0) | (HAS_COMMENT if comment is not None else 0))
+        streams['template'].append(template)
+        _write_varint(streams['position'], self.main_pos - self.last_header)
+        self.last_header = self.main_pos
+
+        page_id, revision_id = int(page_id), int(revision_id)
+        _write_varint(streams['page_id'], _zigzag(page_id - self.page_id))
+        _write_varint(streams['revision_id'], _zigzag(revision_id - self.revision_id))
+        _write_varint(streams['timestamp'], _zigzag(timestamp - self.timestamp))
+        self.page_id, self.revision_id, self.timestamp = page_id, revision_id, timestamp
+
+        key = (ip, 0) if ip is not None else (username, int(user_id))
+        code = self.contributors.encode(key)
+        _write_varint(streams['contributor'], code)
+        if code == 0:
+            streams['name'] += key[0] + b'\n'
+            if ip is None:
+                _write_varint(streams['user_id'], key[1])
+
+        streams['title'] += title + b'\n'
+        if comment is not None:
+            streams['comment'] += comment + b'\n'
+        if restrictions is not None:
+            streams['restrictions'] += restrictions + b'\n'
+
+        self.headers += 1
+        self.header_bytes += m.end() - m.start()
+        return True
+
+    def _split(self, data: bytes) -> bytes:
+        out = []
+        pos = 0
+        for m in HEADER_PATTERN.finditer(data):
+            out.append(data[pos:m.start()])
+            self.main_pos += m.start() - pos
+            if self._encode_header(m):
+                pos = m.end()
+            else:
+                pos = m.start()
+        out.append(data[pos:])
+        self.main_pos += len(data) - pos
+        return b''.join(out)
+
+    def feed(self, chunk: bytes) -> bytes:
+        data = self.carry + chunk
+        # A header never straddles the cut: keep everything from the last "<page>" on
+        cut = data.rfind(b'  <page>\n')
+        if cut < 0:
+            cut = max(0, len(data) - 8)
+        self.carry = data[cut:]
+        return self._split(data[:cut])
+
+    def finish(self) -> bytes:
+        data, self.carry = self.carry, b''
+        return self._split(data)
+
+    def metadata(self) -> bytes:
+        out = bytearray(MAGIC)
+        _write_varint(out, self.headers)
+        for name in STREAMS:
+            _write_varint(out, len(self.streams[name]))
+            out += self.streams[name]
+        return bytes(out)
+
+
+class PageHeaderDecoder:
+    """Streaming inverse: feed() main-stream chunks, get the original back"""
+
+    def __init__(self, metadata: bytes):
+        if metadata[:4] != MAGIC:
+            raise ValueError("Not a page-header metadata block")
+        self.remaining, pos = _read_varint(metadata, 4)
+        self.streams = {}
+        for name in STREAMS:
+            n, pos = _read_varint(metadata, pos)
+            self.streams[name] = metadata[pos:pos + n]
+            pos += n
+        self.cursor = dict.fromkeys(STREAMS, 0)
+        self.strings = {name: iter(self.streams[name].split(b'\n'))
+                        for name in ('title', 'comment', 'name', 'restrictions')}
+        self.contributors = ContributorCoder()
+        self.page_id = 0
+        self.revision_id = 0
+        self.timestamp = 0
+        self.main_pos = 0
+        self.next_header = self._next_position(0) if self.remaining else -1
+
+    def _varint(self, name: str) -> int:
+        n, self.cursor[name] = _read_varint(self.streams[name], self.cursor[name])
+        return n
+
+    def _next_position(self, base: int) -> int:
+        return base + self._varint('position')
+
+    def _header(self) -> bytes:
+        template = self.streams['template'][self.cursor['template']]
+        self.cursor['template'] += 1
+        self.page_id += _unzigzag(self._varint('page_id'))
+        self.revision_id += _unzigzag(self._varint('revision_id'))
+        self.timestamp += _unzigzag(self._varint('timestamp'))
+
+        code = self._varint('contributor')
+        new_key = None
+        if code == 0:
+            name = next(self.strings['name'])
+            new_key = (name, 0) if template & IS_IP else (name, self._varint('user_id'))
+        name, user_id = self.contributors.decode(code, new_key)
+
+        title = next(self.strings['title'])
+        comment = next(self.strings['comment']) if template & HAS_COMMENT else b''
+        restrictions = next(self.strings['restrictions']) if template & HAS_RESTRICTIONS else b''
+        return format_header(template, title, self.page_id, restrictions, self.revision_id,
+                             self.timestamp, name, user_id, comment)
+
+    def feed(self, chunk: bytes) -> bytes:
+        out = []
+        pos = 0
+        end = self.main_pos + len(chunk)
+        while 0 <= self.next_header <= end:
+            take = self.next_header - self.main_pos
+            out.append(chunk[pos:pos + take])
+            pos += take
+            self.main_pos += take
+            out.append(self._header())
+            self.remaining -= 1
+            self.next_header = self._next_position(self.main_pos) if self.remaining else -1
+        out.append(chunk[pos:])
+        self.main_pos += len(chunk) - pos
+        return b''.join(out)
+
+    def finish(self) -> bytes:
+        out = []
+        while self.remaining and self.next_header == self.main_pos:
+            out.append(self._header())
+            self.remaining -= 1
+            self.next_header = self._next_position(self.main_pos) if self.remaining else -1
+        if self.remaining:
+            raise ValueError("Main stream ended before all page headers were placed")
+        return b''.join(out)
+
+
+def split_headers(data: bytes, chunk_size: int = 1 << 22) -> Tuple[bytes, bytes]:
+    """(main stream, metadata) for a whole buffer"""
+    encoder = PageHeaderEncoder()
+    main = [encoder.feed(data[i:i + chunk_size]) for i in range(0, len(data), chunk_size)]
+    main.append(encoder.finish())
+    return b''.join(main), encoder.metadata()
+
+
+def join_headers(main: bytes, metadata: bytes, chunk_size: int = 1 << 22) -> bytes:
+    decoder = PageHeaderDecoder(metadata)
+    out = [decoder.feed(main[i:i + chunk_size]) for i in range(0, len(main), chunk_size)]
+    out.append(decoder.finish())
+    return b''.join(out)
+
+
+def main():
+    input_file = Path(sys.argv[1]) if len(sys.argv) > 1 else Path("wiki_1mb.txt")
+
+    print("=" * 70)
+    print("PAGE HEADER METADATA CHANNEL")
+    print("=" * 70)
+
+    data = input_file.read_bytes()
+    encoder = PageHeaderEncoder()
+    start = time.perf_counter()
+    main_stream = b''.join([encoder.feed(data[i:i + 65536]) for i in range(0, len(data), 65536)]
+                           + [encoder.finish()])
+    metadata = encoder.metadata()
+    split_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    restored = join_headers(main_stream, metadata, chunk_size=65536)
+    join_time = time.perf_counter() - start
+    if restored != data:
+        raise RuntimeError("Round trip FAILED")
+
+    print(f"\nInput:         {input_file} ({len(data):,} bytes)")
+    print(f"Headers:       {encoder.headers:,} ({encoder.header_bytes:,} bytes, "
+          f"{encoder.header_bytes / len(data) * 100:.1f}% of input)")
+    print(f"Main stream:   {len(main_stream):,} bytes")
+    print(f"Metadata:      {len(metadata):,} bytes raw")
+    print(f"Split / join:  {len(data) / 1e6 / split_time:.1f} / {len(data) / 1e6 / join_time:.1f} MB/s")
+
+    print("\nColumns (raw bytes):")
+    for name in STREAMS:
+        if encoder.streams[name]:
+            print(f"  {name:<13} {len(encoder.streams[name]):>8,}")
+
+    # Headers coded as columns vs left in the text (xz as a stand-in for the text coder)
+    whole = len(lzma.compress(data, preset=9))
+    split = len(lzma.compress(main_stream, preset=9)) + len(lzma.compress(metadata, preset=9))
+    print(f"\nxz -9, headers in text:      {whole:,} bytes")
+    print(f"xz -9, main + metadata:      {split:,} bytes ({(split - whole) / whole * 100:+.2f}%)")
+    print("✅ Round trip verified")
+    print("=" * 70)
+
+
+if __name__ == "__main__":
+    main()
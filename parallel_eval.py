@@ -0,0 +1,400 @@
+#!/usr/bin/env python3
+"""
+Parallel multi-offset evaluation
+
+EnwikNineVerification.test_on_enwik9 trains once and then scores 1 MB
+sections at 20..900 MB one after another, reopening the file for each.
+Here the sections are fanned out to a process pool instead:
+
+    1. the models are trained once (or loaded from ModelCache),
+    2. their compact arrays are copied into one multiprocessing.shared_memory
+       block; every worker maps it read-only and rebuilds the CompactTables
+       as views and looks contexts up by binary search in place, so N
+       workers share one copy of the model,
+    3. every worker mmaps the input file once and decodes only its sections,
+    4. per-section results come back to the parent, which reports mean and
+       95% confidence intervals (Student t) over the sections.
+
+The scoring is EnwikNineVerification.compress_baseline / compress_combined,
+unchanged; sections are independent, so the speedup is close to linear in
+the number of workers up to the number of sections.
+"""
+import math
+import mmap
+import multiprocessing as mp
+import os
+import sys
+import time
+from dataclasses import dataclass, field
+from multiprocessing import shared_memory
+from pathlib import Path
+from typing import Dict, List, Sequence, Tuple
+
+import numpy as np
+
+from model_cache import KINDS, ModelCache
+
+ALIGNMENT = 64
+MB = 1024 * 1024
+
+# Two-sided 95% Student t quantiles; between entries the smaller df is used
+T_95 = {1: 12.706, 2: 4.303, 3: 3.182, 4: 2.776, 5: 2.571, 6: 2.447, 7: 2.365, 8: 2.306, 9: 2.262,
+        10: 2.228, 12: 2.179, 15: 2.131, 20: 2.086, 30: 2.042, 60: 2.000, 120: 1.980}
+
+
+# ---- shared arrays ----------------------------------------------------------
+
+class SharedArrays:
+    """
+    A dict of NumPy arrays packed into one shared memory block
+
+    The creating process owns the block (close() unlinks it); workers call
+    SharedArrays.attach(manifest) and get read-only views without copying.
+    """
+
+    def __init__(self, arrays: Dict[str, np.ndarray]):
+        layout = []
+        size = 0
+        for name, array in arrays.items():
+            size = -(-size // ALIGNMENT) * ALIGNMENT
+            layout.append((name, array.dtype.str, array.shape, size))
+            size += array.nbytes
+        self.shm = shared_memory.SharedMemory(create=True, size=max(size, 1))
+        for (name, dtype, shape, offset), array in zip(layout, arrays.values()):
+            view = np.ndarray(shape, dtype=dtype, buffer=self.shm.buf, offset=offset)
+            view[...] = array
+        self.manifest = {'name': self.shm.name, 'layout': layout}
+        self.nbytes = size
+
+    @staticmethod
+    def attach(manifest) -> Tuple[shared_memory.SharedMemory, Dict[str, np.ndarray]]:
+        """(block, read-only views); keep the block referenced while the views are used"""
+        shm = shared_memory.SharedMemory(name=manifest['name'])
+        arrays = {}
+        for name, dtype, shape, offset in manifest['layout']:
+            view = np.ndarray(shape, dtype=dtype, buffer=shm.buf, offset=offset)
+            view.flags.writeable = False
+            arrays[name] = view
+        return shm, arrays
+
+    def close(self):
+        if self.shm is not None:
+            self.shm.close()
+            self.shm.unlink()
+            self.shm = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+# ---- results ----------------------------------------------------------------
+
+@dataclass
+class Section:
+    name: str
+    offset: int
+    size: int
+
+
+@dataclass
+class SectionResult:
+    name: str
+    offset: int
+    chars: int
+    baseline_bits: float
+    combined_bits: float
+    seconds: float
+    worker: int = 0
+    private_mb: float = 0.0
+    shared_mb: float = 0.0
+
+    @property
+    def savings(self) -> float:
+        return self.baseline_bits - self.combined_bits
+
+    @property
+    def percent(self) -> float:
+        return self.savings / self.baseline_bits * 100 if self.baseline_bits > 0 else 0.0
+
+    @property
+    def combined_bpc(self) -> float:
+        return self.combined_bits / self.chars if self.chars else 0.0
+
+
+@dataclass
+class Interval:
+    mean: float
+    low: float
+    high: float
+    n: int
+
+    def __str__(self):
+        return f"{self.mean:.2f} (95% CI {self.low:.2f} .. {self.high:.2f}, n={self.n})"
+
+
+@dataclass
+class Evaluation:
+    results: List[SectionResult]
+    skipped: List[Section] = field(default_factory=list)
+    workers: int = 1
+    wall_seconds: float = 0.0
+
+    @property
+    def cpu_seconds(self) -> float:
+        return sum(r.seconds for r in self.results)
+
+    @property
+    def percent(self) -> Interval:
+        return confidence_interval([r.percent for r in self.results])
+
+    @property
+    def combined_bpc(self) -> Interval:
+        return confidence_interval([r.combined_bpc for r in self.results])
+
+
+def confidence_interval(values: Sequence[float]) -> Interval:
+    """Mean with a two-sided 95% Student t interval (zero width for fewer than two values)"""
+    n = len(values)
+    if not n:
+        return Interval(0.0, 0.0, 0.0, 0)
+    mean = sum(values) / n
+    if n < 2:
+        return Interval(mean, mean, mean, n)
+    variance = sum((v - mean) ** 2 for v in values) / (n - 1)
+    df = n - 1
+    t = T_95[max(k for k in T_95 if k <= df)] if df < 120 else 1.960
+    half = t * math.sqrt(variance / n)
+    return Interval(mean, mean - half, mean + half, n)
+
+
+def spread_sections(filesize: int, count: int, size: int = MB, start: int = 0) -> List[Section]:
+    """count sections of size bytes spread evenly over [start, filesize)"""
+    span = filesize - start - size
+    if count < 1 or span < 0:
+        return []
+    step = span // max(1, count - 1) if count > 1 else 0
+    return [Section(f"{(start + i * step) / MB:.1f} MB offset", start + i * step, size) for i in range(count)]
+
+
+ENWIK9_SECTIONS = [Section(f"{mb} MB offset", mb * MB, MB) for mb in (20, 100, 300, 500, 700, 900)]
+
+
+# ---- workers ----------------------------------------------------------------
+
+_WORKER = {}
+
+
+def _init_worker(path: str, manifests: Dict[str, dict], params: Dict[str, dict]):
+    """Per worker: attach the shared models, mmap the input once
+
+    Tables look contexts up by binary search over the shared arrays with a
+    small LRU of decoded successors, so a worker's private memory does not
+    grow with the model.
+    """
+    from test_full_enwik9 import EnwikNineVerification
+
+    blocks = []
+    models = {}
+    for kind, manifest in manifests.items():
+        shm, arrays = SharedArrays.attach(manifest)
+        blocks.append(shm)
+        models[kind] = KINDS[kind][1](arrays, params[kind])
+
+    verifier = EnwikNineVerification()
+    text_orders, link_orders = models['text_orders'], models['link_orders']
+    for table in [*text_orders.tables.values(), *link_orders.tables.values()]:
+        table.shared_lookups()
+    verifier.text_models = dict(text_orders.tables)
+    verifier.text_models[1] = text_orders.order0
+    verifier.char_freq = text_orders.order0
+    verifier.link_vocab = link_orders.vocab
+    verifier.link_order6 = link_orders.tables[6]
+    verifier.models_trained = True
+
+    f = open(path, 'rb')
+    _WORKER.update(verifier=verifier, blocks=blocks, file=f,
+                   data=mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+
+
+def _evaluate(section: Section) -> SectionResult:
+    verifier = _WORKER['verifier']
+    start = time.perf_counter()
+    text = _WORKER['data'][section.offset:section.offset + section.size].decode('utf-8', errors='ignore')
+    baseline = verifier.compress_baseline(text)
+    combined = verifier.compress_combined(text)
+    seconds = time.perf_counter() - start
+    private, shared = worker_memory()
+    return SectionResult(section.name, section.offset, len(text), baseline, combined,
+                         seconds, os.getpid(), private / MB, shared / MB)
+
+
+def worker_memory() -> Tuple[int, int]:
+    """Resident bytes of this process: (private RssAnon, shared-memory RssShmem); zeros off Linux"""
+    fields = {}
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('Rss'):
+                    name, value = line.split(':')
+                    fields[name] = int(value.split()[0]) * 1024
+    except OSError:
+        pass
+    return fields.get('RssAnon', 0), fields.get('RssShmem', 0)
+
+
+def _release_worker():
+    data = _WORKER.pop('data', None)
+    if data is not None:
+        data.close()
+        _WORKER.pop('file').close()
+    _WORKER.pop('verifier', None)
+    for shm in _WORKER.pop('blocks', []):
+        shm.close()
+
+
+# ---- the harness ------------------------------------------------------------
+
+class ParallelEvaluator:
+    """
+    Train once, evaluate many sections of path in parallel
+
+    Usage:
+        with ParallelEvaluator('data/enwik9') as evaluator:
+            evaluator.train(10 * MB)
+            evaluation = evaluator.evaluate(ENWIK9_SECTIONS, workers=6)
+    """
+
+    def __init__(self, path, cache: ModelCache = None):
+        self.path = Path(path)
+        self.filesize = self.path.stat().st_size
+        self.cache = cache if cache is not None else ModelCache()
+        self.shared: Dict[str, SharedArrays] = {}
+        self.params: Dict[str, dict] = {}
+        self.train_seconds = 0.0
+
+    def train(self, train_bytes: int = 10 * MB):
+        """Models on the first train_bytes of the file (ModelCache), copied into shared memory"""
+        start = time.perf_counter()
+        with open(self.path, 'rb') as f:
+            text = f.read(train_bytes).decode('utf-8', errors='ignore')
+        self.close()
+        for kind, params in (('text_orders', {'orders': [5, 4, 3, 2]}), ('link_orders', {'orders': [6, 2]})):
+            arrays, self.params[kind] = self.cache.get_arrays(text, kind, **params)
+            self.shared[kind] = SharedArrays(arrays)
+        self.train_seconds = time.perf_counter() - start
+
+    @property
+    def shared_bytes(self) -> int:
+        return sum(s.nbytes for s in self.shared.values())
+
+    def evaluate(self, sections: Sequence[Section], workers: int = None, progress=None) -> Evaluation:
+        """
+        Scores every section that fits in the file; workers=1 runs in this process.
+        progress(result) is called as results arrive.
+        """
+        if not self.shared:
+            raise RuntimeError("train() first")
+        todo = [s for s in sections if s.offset + s.size <= self.filesize]
+        skipped = [s for s in sections if s.offset + s.size > self.filesize]
+        workers = max(1, min(workers or os.cpu_count() or 1, len(todo) or 1))
+        manifests = {kind: shared.manifest for kind, shared in self.shared.items()}
+        init_args = (str(self.path), manifests, self.params)
+
+        results = []
+        start = time.perf_counter()
+        if workers == 1:
+            _init_worker(*init_args)
+            try:
+                for section in todo:
+                    results.append(_evaluate(section))
+                    if progress:
+                        progress(results[-1])
+            finally:
+                _release_worker()
+        else:
+            with mp.get_context().Pool(workers, initializer=_init_worker, initargs=init_args) as pool:
+                for result in pool.imap_unordered(_evaluate, todo):
+                    results.append(result)
+                    if progress:
+                        progress(result)
+        wall = time.perf_counter() - start
+        results.sort(key=lambda r: r.offset)
+        return Evaluation(results, skipped, workers, wall)
+
+    def close(self):
+        for shared in self.shared.values():
+            shared.close()
+        self.shared = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def format_evaluation(evaluation: Evaluation) -> str:
+    lines = [f"{'section':<18} {'chars':>10} {'baseline':>12} {'combined':>12} {'savings':>8} {'bpc':>6} {'time':>7}",
+             "-" * 79]
+    for r in evaluation.results:
+        lines.append(f"{r.name:<18} {r.chars:>10,} {r.baseline_bits:>12,.0f} {r.combined_bits:>12,.0f} "
+                     f"{r.percent:>7.2f}% {r.combined_bpc:>6.3f} {r.seconds:>6.1f}s")
+    for s in evaluation.skipped:
+        lines.append(f"{s.name:<18} skipped - beyond file size")
+    lines.append("-" * 79)
+    lines.append(f"Savings:      {evaluation.percent} %")
+    lines.append(f"Combined bpc: {evaluation.combined_bpc}")
+    return "\n".join(lines)
+
+
+def main():
+    path = Path(sys.argv[1]) if len(sys.argv) > 1 else Path("wiki_1mb.txt")
+    count = int(sys.argv[2]) if len(sys.argv) > 2 else 8
+    workers = int(sys.argv[3]) if len(sys.argv) > 3 else (os.cpu_count() or 1)
+    filesize = path.stat().st_size
+    train_bytes = min(10 * MB, filesize // 4)
+    section_size = min(MB, (filesize - train_bytes) // (2 * count))
+
+    print("=" * 70)
+    print("PARALLEL MULTI-OFFSET EVALUATION")
+    print("=" * 70)
+
+    with ParallelEvaluator(path) as evaluator:
+        evaluator.train(train_bytes)
+        shared_bytes = evaluator.shared_bytes
+        print(f"\nInput:    {path} ({filesize:,} bytes)")
+        print(f"Models:   first {train_bytes:,} bytes, {evaluator.train_seconds:.1f}s "
+              f"({'cache hit' if evaluator.cache.stats['hits'] else 'trained'}), "
+              f"{shared_bytes / MB:.1f} MB in shared memory")
+        sections = spread_sections(filesize, count, section_size, start=train_bytes)
+        print(f"Sections: {len(sections)} x {section_size:,} bytes\n")
+
+        serial = evaluator.evaluate(sections, workers=1)
+        parallel = evaluator.evaluate(sections, workers=workers)
+
+    print(format_evaluation(parallel))
+    if [(r.baseline_bits, r.combined_bits) for r in serial.results] != \
+            [(r.baseline_bits, r.combined_bits) for r in parallel.results]:
+        raise RuntimeError("Parallel results differ from the serial run")
+
+    speedup = serial.wall_seconds / parallel.wall_seconds
+    print(f"\nSerial:   {serial.wall_seconds:.2f}s")
+    print(f"Parallel: {parallel.wall_seconds:.2f}s with {parallel.workers} workers "
+          f"({len({r.worker for r in parallel.results})} used), "
+          f"speedup {speedup:.2f}x, efficiency {speedup / parallel.workers * 100:.0f}% "
+          f"({os.cpu_count()} CPUs)")
+    memory = {}
+    for r in parallel.results:
+        memory[r.worker] = max(memory.get(r.worker, (0.0, 0.0)), (r.private_mb, r.shared_mb))
+    for pid, (private, shared) in sorted(memory.items()):
+        print(f"Worker {pid}: {private:.1f} MB private, {shared:.1f} MB shared "
+              f"(model block {shared_bytes / MB:.1f} MB)")
+    print("\n✅ Parallel results identical to the serial run")
+    print("=" * 70)
+
+
+if __name__ == "__main__":
+    main()
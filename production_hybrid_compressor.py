@@ -40,8 +40,13 @@ class ProductionHybridCompressor:
         pattern = re.compile(r'\[\[([^\]|]+)(?:\|[^\]]+)?\]\]')
         return pattern.findall(text)
     
-    def train(self, text, train_size=3000000):
-        """Train both models on text"""
+    def train(self, text, train_size=3000000, memory=None):
+        """
+        Train both models on text
+
+        memory: optional memory_budget.MemoryManager, ticked per character
+        and per link; prunes the tables when they outgrow their share
+        """
         print("=" * 70)
         print("🔨 TRAINING HYBRID COMPRESSOR")
         print("=" * 70)
@@ -57,6 +62,8 @@ class ProductionHybridCompressor:
             next_char = sample[i]
             self.text_model[context][next_char] += 1
             self.char_vocab.add(next_char)
+            if memory is not None:
+                memory.tick()
             
             if (i + 1) % 500000 == 0:
                 print(f"   Progress: {i+1:,} / {len(sample):,}")
@@ -75,12 +82,16 @@ class ProductionHybridCompressor:
             context = tuple(links[i-6:i])
             target = links[i]
             self.link_order6[context][target] += 1
+            if memory is not None:
+                memory.tick()
         
         # Order-2 fallback
         for i in range(2, len(links)):
             context = tuple(links[i-2:i])
             target = links[i]
             self.link_order2[context][target] += 1
+            if memory is not None:
+                memory.tick()
         
         print(f"   ✅ Links found: {len(links):,}")
         print(f"   ✅ Unique links: {len(self.link_vocab):,}")
@@ -0,0 +1,299 @@
+#!/usr/bin/env python3
+"""
+Hot-path profiler hooks - stage timers and a statistical sampler
+
+Two independent switches:
+
+    timers   ContextMixingCompressor runs an instrumented copy of its bit
+             loop that adds perf_counter_ns() deltas for the stages
+             predict / mix / code (decode) / update into preallocated
+             array('q') counters. Coarser stages ('parse', ...) are timed
+             with `with profiler.stage(name):`.
+    sample   a daemon thread snapshots the main thread's stack every
+             interval seconds (sys._current_frames) and counts the stacks.
+
+Both produce a summary table and a collapsed-stack file ("frame;frame N"
+per line) for flamegraph.pl / speedscope: sampled stacks when sampling,
+else one line per timed stage in microseconds.
+
+Switched on by environment (inherited by worker processes):
+    CM_PROFILE=timers|sample|all   CM_PROFILE_OUT=path prefix (default profile)
+    CM_PROFILE_INTERVAL=seconds between samples (default 0.005)
+or by the --profile / --profile-out flags of scripts that call
+add_arguments() and from_args(). The report is written at exit.
+
+When it is off, active() returns None and the coder runs its untouched
+loop: the cost is one attribute check per compress() call.
+"""
+import atexit
+import os
+import sys
+import threading
+import time
+from array import array
+from collections import Counter
+from contextlib import contextmanager, nullcontext
+from typing import Callable, Dict, List, Optional
+
+MODES = ('timers', 'sample', 'all')
+STAGES = ('parse', 'predict', 'mix', 'code', 'decode', 'update')
+PARSE, PREDICT, MIX, CODE, DECODE, UPDATE = range(len(STAGES))
+MAX_STAGES = 64
+DEFAULT_INTERVAL = 0.005
+
+
+class Sampler:
+    """Counts the stacks of one thread, sampled from a daemon thread"""
+
+    def __init__(self, thread_id: int, interval: float = DEFAULT_INTERVAL):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks: Counter = Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='profiler-sampler', daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread.is_alive():
+            self._thread.join()
+
+    def _run(self):
+        frames = sys._current_frames
+        while not self._stop.wait(self.interval):
+            frame = frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                frame = frame.f_back
+            if stack:
+                self.stacks[';'.join(reversed(stack))] += 1
+                self.samples += 1
+
+
+class Profiler:
+    """
+    Stage timers (ns, calls) in preallocated counters, plus an optional Sampler
+
+    Hot loops index self.ns / self.calls directly with the STAGES
+    constants; other code uses stage(name).
+    """
+
+    def __init__(self, timers: bool = True, sample: bool = False, interval: float = DEFAULT_INTERVAL,
+                 output: Optional[str] = None):
+        self.timers = timers
+        self.names: List[str] = list(STAGES)
+        self.index: Dict[str, int] = {name: i for i, name in enumerate(STAGES)}
+        self.ns = array('q', [0]) * MAX_STAGES
+        self.calls = array('q', [0]) * MAX_STAGES
+        self.output = output
+        self.reports: Dict[str, Callable[[], str]] = {}
+        self.started = time.perf_counter_ns()
+        self.sampler = Sampler(threading.main_thread().ident, interval) if sample else None
+        if self.sampler is not None:
+            self.sampler.start()
+
+    def stage_id(self, name: str) -> int:
+        i = self.index.get(name)
+        if i is None:
+            if len(self.names) == MAX_STAGES:
+                raise ValueError(f"More than {MAX_STAGES} profiler stages")
+            i = self.index[name] = len(self.names)
+            self.names.append(name)
+        return i
+
+    @contextmanager
+    def stage(self, name: str):
+        i = self.stage_id(name)
+        start = time.perf_counter_ns()
+        try:
+            yield
+        finally:
+            self.ns[i] += time.perf_counter_ns() - start
+            self.calls[i] += 1
+
+    def add(self, stage: int, ns: int, calls: int = 1):
+        self.ns[stage] += ns
+        self.calls[stage] += calls
+
+    def add_report(self, title: str, report: Callable[[], str]):
+        """Extra section of the summary (counters kept by the models themselves); replaces one of the same title"""
+        self.reports[title] = report
+
+    def stop(self):
+        if self.sampler is not None:
+            self.sampler.stop()
+
+    # ---- reports ----
+
+    def rows(self):
+        """(stage, calls, ns) of every stage that ran, in STAGES order"""
+        return [(name, self.calls[i], self.ns[i]) for i, name in enumerate(self.names) if self.calls[i]]
+
+    def summary(self) -> str:
+        wall = time.perf_counter_ns() - self.started
+        lines = []
+        rows = self.rows()
+        if rows:
+            timed = sum(ns for _, _, ns in rows) or 1
+            lines += [f"{'stage':<12} {'calls':>12} {'total ms':>11} {'ns/call':>9} {'share':>7}", "-" * 55]
+            for name, calls, ns in rows:
+                lines.append(f"{name:<12} {calls:>12,} {ns / 1e6:>11,.1f} {ns / calls:>9,.0f} "
+                             f"{ns / timed * 100:>6.1f}%")
+            lines.append(f"{'timed':<12} {'':>12} {timed / 1e6:>11,.1f}   of {wall / 1e6:,.1f} ms wall")
+        if self.sampler is not None and self.sampler.samples:
+            if lines:
+                lines.append("")
+            leaves = Counter()
+            for stack, n in self.sampler.stacks.items():
+                leaves[stack.rsplit(';', 1)[-1]] += n
+            total = self.sampler.samples
+            lines += [f"{'hottest frames (self)':<56} {'samples':>8} {'share':>7}", "-" * 73]
+            for frame, n in leaves.most_common(12):
+                lines.append(f"{frame[:56]:<56} {n:>8,} {n / total * 100:>6.1f}%")
+        for title, report in self.reports.items():
+            if lines:
+                lines.append("")
+            lines += [title, report()]
+        return "\n".join(lines) if lines else "(nothing profiled)"
+
+    def collapsed(self) -> List[str]:
+        """Collapsed-stack lines: sampled stacks, or the timed stages in microseconds"""
+        if self.sampler is not None and self.sampler.samples:
+            return [f"{stack} {n}" for stack, n in sorted(self.sampler.stacks.items())]
+        return [f"cm;{name} {ns // 1000}" for name, _, ns in self.rows() if ns >= 1000]
+
+    def write_collapsed(self, path: str):
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write("\n".join(self.collapsed()) + "\n")
+
+    def report(self, stream=None):
+        """Stops sampling, prints the summary, writes OUTPUT.collapsed if an output prefix is set"""
+        self.stop()
+        stream = stream or sys.stderr
+        print("\n" + "=" * 70, file=stream)
+        print(f"PROFILE (pid {os.getpid()})", file=stream)
+        print("=" * 70, file=stream)
+        print(self.summary(), file=stream)
+        if self.output:
+            path = f"{self.output}-{os.getpid()}.collapsed"
+            self.write_collapsed(path)
+            print(f"\nCollapsed stacks: {path}", file=stream)
+
+
+_ACTIVE: Optional[Profiler] = None
+
+
+def active() -> Optional[Profiler]:
+    return _ACTIVE
+
+
+def enable(mode: str = 'timers', interval: float = DEFAULT_INTERVAL, output: Optional[str] = 'profile',
+           report_at_exit: bool = True) -> Profiler:
+    """Starts the process-wide profiler; mode is timers, sample or all"""
+    global _ACTIVE
+    if mode not in MODES:
+        raise ValueError(f"Profiler mode {mode!r} (expected one of {', '.join(MODES)})")
+    disable()
+    _ACTIVE = Profiler(timers=mode in ('timers', 'all'), sample=mode in ('sample', 'all'),
+                       interval=interval, output=output)
+    if report_at_exit:
+        atexit.register(_report_at_exit, _ACTIVE)
+    return _ACTIVE
+
+
+def disable() -> Optional[Profiler]:
+    global _ACTIVE
+    profiler, _ACTIVE = _ACTIVE, None
+    if profiler is not None:
+        profiler.stop()
+    return profiler
+
+
+def _report_at_exit(profiler: Profiler):
+    profiler.stop()
+    if profiler is _ACTIVE and (profiler.rows() or profiler.reports
+                                or (profiler.sampler and profiler.sampler.samples)):
+        profiler.report()
+
+
+def from_env() -> Optional[Profiler]:
+    mode = os.environ.get('CM_PROFILE', '').strip().lower()
+    if not mode or mode in ('0', 'off'):
+        return None
+    if mode in ('1', 'on'):
+        mode = 'timers'
+    interval = float(os.environ.get('CM_PROFILE_INTERVAL', DEFAULT_INTERVAL))
+    return enable(mode, interval, os.environ.get('CM_PROFILE_OUT', 'profile'))
+
+
+def stage(name: str):
+    """`with stage('parse'):` - timed if the process-wide profiler has timers, else a no-op"""
+    profiler = _ACTIVE
+    if profiler is None or not profiler.timers:
+        return nullcontext()
+    return profiler.stage(name)
+
+
+def add_report(title: str, report: Callable[[], str]):
+    """Adds a summary section to the process-wide profiler, if one is running"""
+    if _ACTIVE is not None:
+        _ACTIVE.add_report(title, report)
+
+
+def add_arguments(parser):
+    parser.add_argument('--profile', choices=MODES, help="stage timers and/or stack sampling (also CM_PROFILE)")
+    parser.add_argument('--profile-out', default='profile', help="collapsed-stack file prefix")
+
+
+def from_args(args) -> Optional[Profiler]:
+    """Enables profiling for --profile; exported to CM_PROFILE so worker processes follow"""
+    if not getattr(args, 'profile', None):
+        return None
+    os.environ['CM_PROFILE'] = args.profile
+    os.environ['CM_PROFILE_OUT'] = args.profile_out
+    return enable(args.profile, output=args.profile_out)
+
+
+from_env()
+
+
+def main():
+    import profiler as hooks  # the module instance context_mixing sees, not __main__
+    from context_mixing import ContextMixingCompressor
+
+    size = int(sys.argv[1]) if len(sys.argv) > 1 else 30000
+    with open("wiki_1mb.txt", 'rb') as f:
+        data = f.read(size)
+
+    print("=" * 70)
+    print("PROFILER HOOKS - context mixing coder")
+    print("=" * 70)
+    print(f"\nInput: wiki_1mb.txt, first {len(data):,} bytes\n")
+
+    hooks.disable()
+    start = time.perf_counter()
+    plain = ContextMixingCompressor().compress(data)
+    off = time.perf_counter() - start
+
+    profiler = hooks.enable('all', output=None, report_at_exit=False)
+    start = time.perf_counter()
+    profiled = ContextMixingCompressor().compress(data)
+    on = time.perf_counter() - start
+    restored = ContextMixingCompressor().decompress(profiled)
+    hooks.disable()
+
+    if profiled != plain or restored != data:
+        raise RuntimeError("Profiling changed the coded stream")
+    print(f"Off: {off:.2f}s   timers + sampler: {on:.2f}s ({(on / off - 1) * 100:+.1f}%)\n")
+    print(profiler.summary())
+    print("\n✅ Profiled stream identical to the unprofiled one")
+    print("=" * 70)
+
+
+if __name__ == "__main__":
+    main()
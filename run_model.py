@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+"""
+Deterministic-context / run model for long contexts (orders 6-12)
+
+Most high order contexts have seen only one successor so far. Keeping a
+Counter per context (ProductionHybridCompressor.text_model) is far too
+expensive at orders 6-12, so this model keeps a single 2-byte slot per
+hashed context:
+
+    bits 15..8  last byte seen in the context
+    bits  7..4  run count (how many times in a row it followed), max 15
+    bits  3..0  hash check (rejects most collisions)
+
+While the bits coded so far agree with the remembered byte, the model
+predicts its next bit with a confidence learned per (order, run count).
+"""
+import sys
+from array import array
+
+from context_mixing import (STRETCH, RATE, hash_context, benchmark, OrderModel,
+                            ContextTable)
+from word_model import WordModel
+from sparse_model import SparseModel
+
+RUN_ORDERS = (6, 8, 12)
+
+
+class RunModel:
+    """
+    One mixer input per order: +/-confidence that the next bit repeats the
+    byte remembered for the context, 0 when there is no usable prediction.
+
+    Memory: 2 bytes * 2^bits for all orders together, plus a tiny map of
+    confidences per (order, run count).
+    """
+
+    name = 'run'
+
+    def __init__(self, orders=RUN_ORDERS, bits=22):
+        self.orders = tuple(orders)
+        self.n_inputs = len(self.orders)
+        self.masks = [(1 << (8 * k)) - 1 for k in self.orders]
+        self.mask = (1 << bits) - 1
+        self.slots = array('H', [0]) * (1 << bits)
+        # P(predicted bit is right) per (order, run count), 12-bit + 4-bit count
+        self.confidence = array('H', [3072 << 4]) * (16 * len(self.orders))
+        self.history = 0
+        self.lookups = []  # (slot index, check) per order
+        self.expected = [-1] * len(self.orders)  # predicted byte or -1
+        self.runs = [0] * len(self.orders)
+        self.used = []  # (order index, expected bit) of the current bit
+        self.update_byte(0)
+
+    def predict(self, c0, inputs):
+        k = c0.bit_length() - 1
+        shift = 7 - k
+        used = []
+        confidence = self.confidence
+        for i, expected in enumerate(self.expected):
+            if expected >= 0 and ((expected | 256) >> (shift + 1)) == c0:
+                bit = (expected >> shift) & 1
+                st = STRETCH[confidence[(i << 4) | self.runs[i]] >> 4]
+                inputs.append(st if bit else -st)
+                used.append((i, bit))
+            else:
+                inputs.append(0)
+        self.used = used
+
+    def update(self, bit):
+        confidence = self.confidence
+        for i, expected_bit in self.used:
+            j = (i << 4) | self.runs[i]
+            s = confidence[j]
+            p = s >> 4
+            n = s & 15
+            if bit == expected_bit:
+                p += ((4096 - p) * RATE[n]) >> 16
+                if p > 4095:
+                    p = 4095
+            else:
+                p -= (p * RATE[n]) >> 16
+                if p < 1:
+                    p = 1
+            if n < 15:
+                n += 1
+            confidence[j] = (p << 4) | n
+
+    def update_byte(self, byte):
+        slots = self.slots
+
+        # Learn the byte in the contexts it followed
+        for index, check in self.lookups:
+            s = slots[index]
+            if (s & 15) == check and (s >> 8) == byte and s & 0xF0:
+                run = (s >> 4) & 15
+                if run < 15:
+                    run += 1
+            else:
+                run = 1
+            slots[index] = (byte << 8) | (run << 4) | check
+
+        # Look up the new contexts
+        self.history = h = ((self.history << 8) | byte) & 0xFFFFFFFFFFFFFFFFFFFFFFFF
+        lookups = []
+        for i, mask in enumerate(self.masks):
+            ctx = hash_context(h & mask, 301 + i)
+            index = ctx & self.mask
+            check = ctx >> 28
+            lookups.append((index, check))
+            s = slots[index]
+            if (s & 15) == check and s & 0xF0:
+                self.expected[i] = s >> 8
+                self.runs[i] = (s >> 4) & 15
+            else:
+                self.expected[i] = -1
+                self.runs[i] = 0
+        self.lookups = lookups
+
+    def memory_bytes(self):
+        return len(self.slots) * 2 + len(self.confidence) * 2
+
+
+def main():
+    size = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+
+    print("=" * 70)
+    print("RUN MODEL - deterministic contexts of orders 6-12")
+    print("=" * 70)
+
+    with open("wiki_1mb.txt", 'rb') as f:
+        data = f.read(size)
+    print(f"\nInput: wiki_1mb.txt, first {len(data):,} bytes\n")
+
+    def without_runs():
+        table = ContextTable(bits=22)
+        return [OrderModel(table=table), WordModel(table=table), SparseModel(table=table)]
+
+    def with_runs():
+        return without_runs() + [RunModel()]
+
+    # Histories that share only their last 4 bytes must not share long contexts
+    a, b = RunModel(), RunModel()
+    for x, y in zip(b'XXXXXXXXabcd', b'YYYYYYYYabcd'):
+        a.update_byte(x)
+        b.update_byte(y)
+    if any(p == q for p, q in zip(a.lookups, b.lookups)):
+        raise RuntimeError("Orders 6-12 collapse to a shorter context")
+
+    base, _, _ = benchmark(data, without_runs, "orders + word + sparse")
+    runs, _, _ = benchmark(data, with_runs, "+ run model")
+
+    print(f"\n  Run model saves {base - runs:,} bytes ({(base - runs) / base * 100:.2f}%)")
+    print(f"  Memory: {RunModel().memory_bytes() / 1024 / 1024:.1f} MB for orders {RUN_ORDERS}")
+    print("=" * 70)
+
+
+if __name__ == "__main__":
+    main()
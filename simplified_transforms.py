@@ -10,161 +10,451 @@ KEY TRANSFORMATIONS (from HP-2017):
 3. Quote normalization
 4. Whitespace normalization
 
-These are REVERSIBLE and provide significant compression gains.
+All rules run in ONE pass (TransformEngine) and are EXACTLY reversible:
+whatever a rule drops goes to a small exception stream.
 """
 
 import re
+import sys
+import time
 from pathlib import Path
 from typing import Dict, Tuple
 
 
+MAGIC = b'WTX1'
+
+# Entity -> single byte (order matters: it is the bit order of the defaults mask)
+ENTITIES = [
+    (b'&lt;', b'<'),
+    (b'&gt;', b'>'),
+    (b'&amp;', b'&'),
+    (b'&quot;', b'"'),
+    (b'&apos;', b"'"),
+    (b'&nbsp;', b' '),
+    (b'&ndash;', b'\x01'),  # En dash -> special marker
+    (b'&mdash;', b'\x02'),  # Em dash -> special marker
+]
+
+# Targets whose literal occurrences are rare enough to be matched in the
+# forward pass; their default origin (entity or literal) is chosen per
+# chunk. "'" and " " are far too common as literals - for them the
+# default is always literal and only the entity occurrences are recorded.
+ADAPTIVE_TARGETS = b'<>&"\x01\x02'
+
+WHITESPACE = b' \t\n\r\x0b\x0c'
+
+
+def _build_rules():
+    """
+    One alternation for all rules. Every branch starts with a literal
+    byte so the regex engine can skip straight to candidate bytes
+    (\s-led rules are expanded per whitespace byte for that reason).
+    Lookbehind conditions are checked by the caller.
+    """
+    branches = [
+        rb'&(?:lt|gt|amp|quot|apos|nbsp|ndash|mdash);',  # entity
+        rb'&', rb'<', rb'>', rb'"', rb'\x01', rb'\x02',  # literal targets
+        rb'\[\[\s+',                                      # [[  x  -> [[x
+        rb'\[\s+(?=\w)', rb'\]\s+(?=\w)',                 # a[  b  -> a[b
+    ]
+    for c in WHITESPACE:
+        tail = [
+            rb'\s*(?=\]\])',              # x  ]]  -> x]]
+            rb'\s*[\[\]]\s*(?=\w)',       # a  [ b -> a[b
+        ]
+        if c == 32:
+            tail.append(rb' *(?=\n)')     # trailing spaces
+            tail.append(rb' +')            # multiple spaces -> one
+        branches.append(re.escape(bytes((c,))) + b'(?:' + b'|'.join(tail) + b')')
+    return re.compile(b'|'.join(branches))
+
+
+RULES = _build_rules()
+
+WORD_BYTES = frozenset(b'abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789_')
+
+
+def _write_varint(out: bytearray, n: int):
+    while n >= 0x80:
+        out.append((n & 0x7F) | 0x80)
+        n >>= 7
+    out.append(n)
+
+
+def _read_varint(buf, pos: int) -> Tuple[int, int]:
+    n = 0
+    shift = 0
+    while True:
+        b = buf[pos]
+        pos += 1
+        n |= (b & 0x7F) << shift
+        if b < 0x80:
+            return n, pos
+        shift += 7
+
+
+class TransformEngine:
+    """
+    Single-pass, exactly invertible Wikipedia transform engine.
+
+    All rules (entities, bracket spacing, whitespace) are one compiled
+    alternation applied in a single pass per fixed-size chunk. Whatever
+    a rule drops is written to an exception stream, so the inverse
+    restores the input byte for byte:
+
+      - entity targets: per chunk and target byte, the more frequent
+        origin (entity or literal) is the default and only the positions
+        of the other origin are stored
+      - removed whitespace: (output position, removed bytes) insertions
+
+    Exception stream: MAGIC, then per chunk
+        varint input_len, varint output_len, byte defaults mask,
+        per target: varint count + delta coded positions,
+        varint inserts + (delta position, length, bytes) each.
+    """
+
+    def __init__(self, chunk_size: int = 1 << 22):
+        self.chunk_size = chunk_size
+        self.entity_of = {t[0]: e for e, t in ENTITIES}
+        self.target_of = {e: t[0] for e, t in ENTITIES}
+        self._inverse_patterns = {}
+        self.reset_stats()
+
+    def reset_stats(self):
+        self.stats = {'saved_entities': 0, 'saved_brackets': 0, 'saved_whitespace': 0}
+
+    def forward_chunk(self, chunk: bytes, exceptions: bytearray) -> bytes:
+        """Transform one chunk, appending its exception record"""
+        pieces = []
+        entity_pos = {t[0]: [] for _, t in ENTITIES}
+        literal_pos = {t: [] for t in ADAPTIVE_TARGETS}
+        inserts = []  # (output position, removed bytes)
+        target_of = self.target_of
+        stats = self.stats
+
+        last = 0
+        out_len = 0
+        for m in RULES.finditer(chunk):
+            start, end = m.span()
+            text = m.group()
+            first = text[0]
+
+            if first == 38 and len(text) > 1:  # &entity;
+                pieces.append(chunk[last:start])
+                out_len += start - last
+                t = target_of[text]
+                entity_pos[t].append(out_len)
+                pieces.append(bytes((t,)))
+                out_len += 1
+                stats['saved_entities'] += len(text) - 1
+            elif first in ADAPTIVE_TARGETS:
+                pieces.append(chunk[last:end])
+                out_len += end - last
+                literal_pos[first].append(out_len - 1)
+            elif first in WHITESPACE and not text.strip():
+                pieces.append(chunk[last:start])
+                out_len += start - last
+                if chunk[end:end + 2] == b']]':
+                    inserts.append((out_len, text))
+                    stats['saved_brackets'] += len(text)
+                elif chunk[end:end + 1] == b'\n' and text.count(b' ') == len(text):
+                    inserts.append((out_len, text))
+                    stats['saved_whitespace'] += len(text)
+                else:
+                    pieces.append(b' ')
+                    out_len += 1
+                    inserts.append((out_len, text[1:]))
+                    stats['saved_whitespace'] += len(text) - 1
+            elif text[:2] == b'[[':
+                pieces.append(chunk[last:start + 2])
+                out_len += start + 2 - last
+                inserts.append((out_len, text[2:]))
+                stats['saved_brackets'] += len(text) - 2
+            elif start > 0 and chunk[start - 1] in WORD_BYTES:
+                # a [ b -> a[b (the regex cannot check the word byte before)
+                pieces.append(chunk[last:start])
+                out_len += start - last
+                i = text.find(b'[')
+                if i < 0:
+                    i = text.find(b']')
+                if i > 0:
+                    inserts.append((out_len, text[:i]))
+                pieces.append(text[i:i + 1])
+                out_len += 1
+                if i + 1 < len(text):
+                    inserts.append((out_len, text[i + 1:]))
+                stats['saved_brackets'] += len(text) - 1
+            else:
+                pieces.append(chunk[last:end])
+                out_len += end - last
+            last = end
+
+        pieces.append(chunk[last:])
+        out_len += len(chunk) - last
+
+        # Exception record
+        _write_varint(exceptions, len(chunk))
+        _write_varint(exceptions, out_len)
+        defaults = 0
+        records = []
+        for bit, (_, target) in enumerate(ENTITIES):
+            t = target[0]
+            entities = entity_pos[t]
+            literals = literal_pos.get(t)
+            if literals is not None and len(entities) >= len(literals) and entities:
+                defaults |= 1 << bit
+                records.append(literals)
+            else:
+                records.append(entities)
+        exceptions.append(defaults)
+        for positions in records:
+            _write_varint(exceptions, len(positions))
+            prev = 0
+            for pos in positions:
+                _write_varint(exceptions, pos - prev)
+                prev = pos
+        _write_varint(exceptions, len(inserts))
+        prev = 0
+        for pos, removed in inserts:
+            _write_varint(exceptions, pos - prev)
+            _write_varint(exceptions, len(removed))
+            exceptions.extend(removed)
+            prev = pos
+
+        return b''.join(pieces)
+
+    def inverse_chunk(self, buf, exceptions, pos: int) -> Tuple[bytes, int]:
+        """Restore one chunk; returns (original bytes, next exception position)"""
+        in_len, pos = _read_varint(exceptions, pos)
+        out_len, pos = _read_varint(exceptions, pos)
+        defaults = exceptions[pos]
+        pos += 1
+
+        events = []  # (output position, order, replacement)
+        default_targets = bytearray()
+        swapped = set()
+        for bit, (entity, target) in enumerate(ENTITIES):
+            count, pos = _read_varint(exceptions, pos)
+            p = 0
+            is_default = defaults >> bit & 1
+            if is_default:
+                default_targets.extend(target)
+            for _ in range(count):
+                delta, pos = _read_varint(exceptions, pos)
+                p += delta
+                if is_default:
+                    swapped.add(p)  # literal where the entity is the default
+                else:
+                    events.append((p, 1, entity))
+
+        count, pos = _read_varint(exceptions, pos)
+        p = 0
+        for seq in range(count):
+            delta, pos = _read_varint(exceptions, pos)
+            p += delta
+            length, pos = _read_varint(exceptions, pos)
+            events.append((p, 0, bytes(exceptions[pos:pos + length])))
+            pos += length
+
+        if default_targets:
+            key = bytes(default_targets)
+            pattern = self._inverse_patterns.get(key)
+            if pattern is None:
+                pattern = re.compile(b'[' + re.escape(key) + b']')
+                self._inverse_patterns[key] = pattern
+            entity_of = self.entity_of
+            for m in pattern.finditer(buf):
+                p = m.start()
+                if p not in swapped:
+                    events.append((p, 1, entity_of[buf[p]]))
+
+        # Stable sort: inserts (order 0) go before the byte at the same position
+        events.sort(key=lambda e: (e[0], e[1]))
+        pieces = []
+        last = 0
+        for p, order, data in events:
+            pieces.append(buf[last:p])
+            pieces.append(data)
+            last = p + order
+        pieces.append(buf[last:])
+
+        result = b''.join(pieces)
+        if len(result) != in_len:
+            raise ValueError(f"Inverse transform length mismatch: {len(result)} != {in_len}")
+        return result, pos
+
+    def iter_chunks(self, data: bytes):
+        """Fixed-size chunks, cut after the last newline when there is one"""
+        pos = 0
+        n = len(data)
+        while pos < n:
+            end = min(pos + self.chunk_size, n)
+            if end < n:
+                cut = data.rfind(b'\n', pos, end)
+                if cut > pos:
+                    end = cut + 1
+            yield data[pos:end]
+            pos = end
+
+    def forward(self, data: bytes) -> Tuple[bytes, bytes]:
+        """Transform data, returns (transformed, exceptions)"""
+        exceptions = bytearray(MAGIC)
+        out = [self.forward_chunk(chunk, exceptions) for chunk in self.iter_chunks(data)]
+        return b''.join(out), bytes(exceptions)
+
+    def inverse(self, data: bytes, exceptions: bytes) -> bytes:
+        """Exact inverse of forward()"""
+        if exceptions[:4] != MAGIC:
+            raise ValueError("Not a transform exception stream")
+        view = memoryview(data)
+        pos = 4
+        start = 0
+        out = []
+        while pos < len(exceptions):
+            _, p = _read_varint(exceptions, pos)
+            out_len, _ = _read_varint(exceptions, p)
+            chunk = bytes(view[start:start + out_len])
+            restored, pos = self.inverse_chunk(chunk, exceptions, pos)
+            out.append(restored)
+            start += out_len
+        return b''.join(out)
+
+    def forward_file(self, input_path: Path, output_path: Path, exceptions_path: Path):
+        """Streaming forward transform: chunks in, chunks out"""
+        carry = b''
+        with open(input_path, 'rb') as fin, open(output_path, 'wb') as fout, \
+                open(exceptions_path, 'wb') as fexc:
+            fexc.write(MAGIC)
+            while True:
+                block = fin.read(self.chunk_size)
+                data = carry + block
+                if not data:
+                    break
+                cut = data.rfind(b'\n') + 1 if block else len(data)
+                if cut <= 0:
+                    cut = len(data)
+                chunk, carry = data[:cut], data[cut:]
+                exceptions = bytearray()
+                fout.write(self.forward_chunk(chunk, exceptions))
+                fexc.write(exceptions)
+
+    def inverse_file(self, input_path: Path, exceptions_path: Path, output_path: Path):
+        """Streaming inverse transform (exception stream is small, read whole)"""
+        exceptions = Path(exceptions_path).read_bytes()
+        if exceptions[:4] != MAGIC:
+            raise ValueError("Not a transform exception stream")
+        pos = 4
+        with open(input_path, 'rb') as fin, open(output_path, 'wb') as fout:
+            while pos < len(exceptions):
+                _, p = _read_varint(exceptions, pos)
+                out_len, _ = _read_varint(exceptions, p)
+                restored, pos = self.inverse_chunk(fin.read(out_len), exceptions, pos)
+                fout.write(restored)
+
+
 class WikipediaTransforms:
     """Simplified Wikipedia-specific transformations for better compression."""
     
-    def __init__(self):
+    def __init__(self, chunk_size: int = 1 << 22):
         # HTML entity mappings (most common ones)
-        self.html_entities = {
-            b'&lt;': b'<',
-            b'&gt;': b'>',
-            b'&amp;': b'&',
-            b'&quot;': b'"',
-            b'&apos;': b"'",
-            b'&nbsp;': b' ',
-            b'&ndash;': b'\x01',  # En dash → special marker
-            b'&mdash;': b'\x02',  # Em dash → special marker
-        }
+        self.html_entities = dict(ENTITIES)
         
         # Reverse mapping for decompression
         self.reverse_entities = {v: k for k, v in self.html_entities.items()}
-    
-    def transform_html_entities(self, data: bytes) -> bytes:
-        """
-        Transform common HTML entities to single bytes.
-        
-        Example: &lt; (4 bytes) → < (1 byte) = 3 bytes saved per occurrence
-        On enwik9: Millions of occurrences = millions of bytes saved!
-        """
-        result = data
-        for entity, replacement in self.html_entities.items():
-            result = result.replace(entity, replacement)
-        return result
-    
-    def normalize_brackets(self, data: bytes) -> bytes:
-        """
-        Normalize bracket patterns.
-        
-        Wikipedia uses [[ ]] for links, but sometimes spacing varies.
-        Normalize to consistent format = better compression.
-        """
-        # Normalize [[  ]] (with spaces) to [[]] (no spaces)
-        result = data
-        result = re.sub(rb'\[\[\s+', rb'[[', result)
-        result = re.sub(rb'\s+\]\]', rb']]', result)
-        
-        # Normalize single [ ] surrounded by text
-        # This helps compressor see patterns
-        result = re.sub(rb'(\w)\s*\[\s*(\w)', rb'\1[\2', result)
-        result = re.sub(rb'(\w)\s*\]\s*(\w)', rb'\1]\2', result)
-        
-        return result
-    
-    def normalize_whitespace(self, data: bytes) -> bytes:
-        """
-        Normalize redundant whitespace.
-        
-        Multiple spaces → single space
-        Trailing spaces → removed
-        But preserve meaningful structure (line breaks, etc.)
-        """
-        result = data
-        
-        # Multiple spaces → single space (but not across lines)
-        result = re.sub(rb'  +', rb' ', result)
-        
-        # Trailing spaces before newline
-        result = re.sub(rb' +\n', rb'\n', result)
         
-        return result
+        self.engine = TransformEngine(chunk_size)
     
     def apply_transforms(self, data: bytes) -> Tuple[bytes, Dict]:
         """
-        Apply all transformations.
+        Apply all transformations in one pass (see TransformEngine).
         
         Returns:
-            (transformed_data, stats_dict)
+            (transformed_data, stats_dict) - stats_dict['exceptions'] holds
+            the exception stream needed by reverse_transforms()
         """
         original_size = len(data)
         
-        print("Applying Wikipedia transforms...")
-        
-        # Transform 1: HTML entities
-        print("  1/3: HTML entities...")
-        data = self.transform_html_entities(data)
-        after_entities = len(data)
-        
-        # Transform 2: Bracket normalization
-        print("  2/3: Bracket normalization...")
-        data = self.normalize_brackets(data)
-        after_brackets = len(data)
-        
-        # Transform 3: Whitespace normalization
-        print("  3/3: Whitespace normalization...")
-        data = self.normalize_whitespace(data)
+        print("Applying Wikipedia transforms (single pass)...")
+        self.engine.reset_stats()
+        data, exceptions = self.engine.forward(data)
         final_size = len(data)
         
-        stats = {
+        stats = dict(self.engine.stats)
+        stats.update({
             'original': original_size,
-            'after_entities': after_entities,
-            'after_brackets': after_brackets,
             'final': final_size,
-            'saved_entities': original_size - after_entities,
-            'saved_brackets': after_entities - after_brackets,
-            'saved_whitespace': after_brackets - final_size,
             'total_saved': original_size - final_size,
-        }
+            'exceptions': exceptions,
+        })
         
         print(f"\nTransform statistics:")
         print(f"  HTML entities:  {stats['saved_entities']:,} bytes saved")
         print(f"  Brackets:       {stats['saved_brackets']:,} bytes saved")
         print(f"  Whitespace:     {stats['saved_whitespace']:,} bytes saved")
+        print(f"  Exceptions:     {len(exceptions):,} bytes")
         print(f"  ━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━")
-        print(f"  Total saved:    {stats['total_saved']:,} bytes ({100*stats['total_saved']/original_size:.2f}%)")
+        print(f"  Total saved:    {stats['total_saved']:,} bytes ({100*stats['total_saved']/max(original_size, 1):.2f}%)")
         
         return data, stats
     
-    def reverse_transforms(self, data: bytes) -> bytes:
+    def reverse_transforms(self, data: bytes, exceptions: bytes) -> bytes:
         """
-        Reverse all transformations for decompression.
-        
-        Must be applied in REVERSE order!
+        Reverse all transformations for decompression (byte exact).
         """
-        # Reverse whitespace normalization (not needed, compression is lossy here)
-        # Reverse bracket normalization (not needed, normalized is valid)
-        
-        # Reverse HTML entities
-        result = data
-        for original, entity in self.reverse_entities.items():
-            result = result.replace(original, entity)
-        
-        return result
+        return self.engine.inverse(data, exceptions)
     
     def transform_file(self, input_path: Path, output_path: Path) -> Dict:
         """
         Transform a file and write result to output.
         
+        The exception stream goes to output_path + '.exc'.
         Returns statistics dictionary.
         """
-        print(f"Reading {input_path}...")
-        with open(input_path, 'rb') as f:
-            data = f.read()
-        
-        transformed, stats = self.apply_transforms(data)
-        
-        print(f"Writing {output_path}...")
-        with open(output_path, 'wb') as f:
-            f.write(transformed)
+        exceptions_path = Path(str(output_path) + '.exc')
+        print(f"Transforming {input_path} (streaming, {self.engine.chunk_size:,} byte chunks)...")
+        self.engine.reset_stats()
+        self.engine.forward_file(input_path, output_path, exceptions_path)
+        
+        original = Path(input_path).stat().st_size
+        final = Path(output_path).stat().st_size
+        stats = dict(self.engine.stats)
+        stats.update({
+            'original': original,
+            'final': final,
+            'total_saved': original - final,
+            'exceptions_size': exceptions_path.stat().st_size,
+        })
+        print(f"Exceptions: {exceptions_path} ({stats['exceptions_size']:,} bytes)")
         
         return stats
+    
+    def restore_file(self, input_path: Path, output_path: Path):
+        """Inverse of transform_file()"""
+        exceptions_path = Path(str(input_path) + '.exc')
+        self.engine.inverse_file(input_path, exceptions_path, output_path)
+
+
+def verify_roundtrip(path: Path, chunk_size: int = 1 << 22):
+    """Forward + inverse on a file: throughput and byte-exact check"""
+    data = Path(path).read_bytes()
+    engine = TransformEngine(chunk_size)
+    
+    start = time.perf_counter()
+    transformed, exceptions = engine.forward(data)
+    forward_time = time.perf_counter() - start
+    
+    start = time.perf_counter()
+    restored = engine.inverse(transformed, exceptions)
+    inverse_time = time.perf_counter() - start
+    
+    mb = len(data) / 1e6
+    print(f"Input:       {len(data):,} bytes")
+    print(f"Transformed: {len(transformed):,} bytes + {len(exceptions):,} bytes exceptions")
+    print(f"Forward:     {mb / forward_time:.1f} MB/s")
+    print(f"Inverse:     {mb / inverse_time:.1f} MB/s")
+    if restored != data:
+        raise RuntimeError("Round trip FAILED")
+    print("✅ Round trip byte-exact")
 
 
 class CombinedPreprocessor:
@@ -205,6 +495,8 @@ class CombinedPreprocessor:
         
         with open(output_path, 'wb') as f:
             f.write(transformed)
+        with open(str(output_path) + '.exc', 'wb') as f:
+            f.write(stats['exceptions'])
         
         print(f"\n{'='*60}")
         print("COMBINED PREPROCESSING COMPLETE!")
@@ -221,6 +513,10 @@ class CombinedPreprocessor:
 def main():
     """Apply transforms to enwik9_reordered."""
     
+    if len(sys.argv) > 2 and sys.argv[1] == '--verify':
+        verify_roundtrip(Path(sys.argv[2]))
+        return 0
+    
     # Just apply transforms to already-reordered file
     input_file = Path("data/enwik9_reordered")
     output_file = Path("data/enwik9_reordered_transformed")
@@ -255,5 +551,4 @@ def main():
 
 
 if __name__ == "__main__":
-    import sys
     sys.exit(main())
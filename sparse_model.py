@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+"""
+Sparse, column and structure contexts for wiki markup
+
+Wiki markup is full of non-contiguous structure: table rows ({| |- ||),
+bulleted lists, infobox "| key = value" lines. WikiParser.tokenize
+recognises the markup but no compressor used it as a context. These
+contexts do, and every one of them is computed from O(1) state updated
+once per byte, then hashed into the shared ContextTable.
+"""
+import sys
+
+from context_mixing import HashedContextModel, hash_context, benchmark, OrderModel, ContextTable
+from word_model import WordModel
+
+# Skip contexts: bytes of the 32-bit history that are kept (the rest skipped)
+SKIP_MASKS = (0xFF00, 0xFF0000, 0xFFFF00)
+
+MAX_COLUMN = 255
+
+
+class SparseModel(HashedContextModel):
+    """
+    Contexts (one mixer input each):
+        1-3. skip contexts over the last 4 bytes (SKIP_MASKS)
+        4.   byte above in the previous line + last byte
+        5.   byte above + first byte of the line + column
+        6.   column + first byte of the line (list/table/infobox lines)
+        7.   bracket depth ([[ {{ {| <) + "=" seen on the line + last byte
+    """
+
+    name = 'sparse'
+
+    def __init__(self, table=None, table_bits=22):
+        super().__init__(len(SKIP_MASKS) + 4, table, table_bits)
+        self.history = 0
+        self.line = bytearray()       # current line so far, first MAX_COLUMN + 1 bytes
+        self.prev_line = bytearray()  # previous line (for the byte above), same limit
+        self.column = 0
+        self.square = 0               # [ ] depth
+        self.curly = 0                # { } depth
+        self.angle = 0                # inside <tag>
+        self.equals = 0               # "=" seen on this line
+        self.update_byte(ord('\n'))
+
+    def update_byte(self, byte):
+        self.history = ((self.history << 8) | byte) & 0xFFFFFFFF
+
+        if byte == 10:
+            self.prev_line, self.line = self.line, self.prev_line
+            del self.line[:]
+            self.column = 0
+            self.equals = 0
+        else:
+            if self.column <= MAX_COLUMN:
+                self.line.append(byte)
+            self.column += 1
+            if byte == 61:  # =
+                self.equals = 1
+            elif byte == 91:  # [
+                self.square += 1
+            elif byte == 93:  # ]
+                if self.square:
+                    self.square -= 1
+            elif byte == 123:  # {
+                self.curly += 1
+            elif byte == 125:  # }
+                if self.curly:
+                    self.curly -= 1
+            elif byte == 60:  # <
+                self.angle = 1
+            elif byte == 62:  # >
+                self.angle = 0
+
+        line = self.line
+        col = self.column
+        prev_line = self.prev_line
+        above = prev_line[col] if col < len(prev_line) else 0
+        first = line[0] if col else 0
+        if col > MAX_COLUMN:
+            col = MAX_COLUMN
+
+        h = self.history
+        hashes = [hash_context(h & mask, 201 + i) for i, mask in enumerate(SKIP_MASKS)]
+        hashes.append(hash_context((above << 8) | byte, 211))
+        hashes.append(hash_context((above << 16) | (first << 8) | col, 212))
+        hashes.append(hash_context((first << 8) | col, 213))
+        depth = (min(self.square, 3) << 4) | (min(self.curly, 3) << 2) | (self.angle << 1) | self.equals
+        hashes.append(hash_context((depth << 8) | byte, 214))
+        self.hashes = hashes
+
+
+def main():
+    size = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+
+    print("=" * 70)
+    print("SPARSE / COLUMN CONTEXTS - contribution to the context mixing coder")
+    print("=" * 70)
+
+    with open("wiki_1mb.txt", 'rb') as f:
+        data = f.read(size)
+    print(f"\nInput: wiki_1mb.txt, first {len(data):,} bytes\n")
+
+    def without_sparse():
+        table = ContextTable(bits=22)
+        return [OrderModel(table=table), WordModel(table=table)]
+
+    def with_sparse():
+        table = ContextTable(bits=22)
+        return [OrderModel(table=table), WordModel(table=table), SparseModel(table=table)]
+
+    base, _, _ = benchmark(data, without_sparse, "orders + word")
+    sparse, _, _ = benchmark(data, with_sparse, "orders + word + sparse")
+
+    print(f"\n  Sparse contexts save {base - sparse:,} bytes ({(base - sparse) / base * 100:.2f}%)")
+    print("=" * 70)
+
+
+if __name__ == "__main__":
+    main()
@@ -9,11 +9,16 @@ Similar articles near each other = better compression context = 20 MB saved!
 Based on STARLIT algorithm (Hutter Prize 2021 winner)
 """
 
+import errno
+import mmap
+import os
 import re
 import sys
 from pathlib import Path
 from typing import List, Tuple
 
+import numpy as np
+
 
 class ArticleExtractor:
     """Extract Wikipedia articles from enwik9 format."""
@@ -52,6 +57,36 @@ class ArticleExtractor:
         
         return articles
     
+    def article_spans(self, data, window: int = 64 << 20) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        (starts, ends) of all articles as int64 arrays - the spans of
+        extract_articles() without the list of titles.
+        
+        Works on bytes or an mmap. The mmap is scanned window by window and
+        the pages of finished windows are dropped again (MADV_DONTNEED),
+        so the scan does not pull the whole file into RSS.
+        """
+        size = len(data)
+        parts = []
+        pos = 0
+        while pos < size:
+            end = min(pos + window, size)
+            # Matches may start before the window end and run past it
+            found = [m.start() for m in self.article_pattern.finditer(data, pos, min(size, end + 65536))
+                     if m.start() < end]
+            parts.append(np.array(found, dtype=np.int64))
+            if isinstance(data, mmap.mmap) and hasattr(mmap, 'MADV_DONTNEED'):
+                done = pos - pos % mmap.PAGESIZE
+                data.madvise(mmap.MADV_DONTNEED, done, end - done)
+            pos = end
+        
+        starts = np.concatenate(parts) if parts else np.empty(0, dtype=np.int64)
+        ends = np.empty_like(starts)
+        if len(starts):
+            ends[:-1] = starts[1:]
+            ends[-1] = size
+        return starts, ends
+    
     def get_article_content(self, data: bytes, start: int, end: int) -> bytes:
         """Extract article content between positions."""
         return data[start:end]
@@ -65,102 +100,100 @@ class STARLITReorder:
         Load STARLIT article ordering.
         
         Args:
-            order_file: Path to new_article_order file from STARLIT
+            order_file: Path to new_article_order file from STARLIT, or a
+                        binary order file from article_order.py
         """
         self.new_order = []
         
         print(f"Loading STARLIT article order from {order_file}...")
-        with open(order_file, 'r') as f:
-            for line in f:
-                line = line.strip()
-                if line:
-                    self.new_order.append(int(line))
+        with open(order_file, 'rb') as f:
+            binary = f.read(4) == b'AORD'
+        
+        if binary:
+            # Binary order written by article_order.save_order()
+            from article_order import load_order
+            order, _ = load_order(order_file)
+            self.new_order = order.tolist()
+        else:
+            with open(order_file, 'r') as f:
+                for line in f:
+                    line = line.strip()
+                    if line:
+                        self.new_order.append(int(line))
         
         print(f"Loaded ordering for {len(self.new_order)} articles")
     
-    def reorder_articles(self, input_path: Path, output_path: Path):
+    def complete_order(self, n_articles: int) -> np.ndarray:
+        """
+        Full permutation of range(n_articles): the STARLIT order without
+        out-of-range and repeated indices, then every article it misses in
+        original order (articles added after STARLIT was computed).
+        """
+        order = np.asarray(self.new_order, dtype=np.int64)
+        order = order[(order >= 0) & (order < n_articles)]
+        _, first = np.unique(order, return_index=True)
+        order = order[np.sort(first)]
+        placed = np.zeros(n_articles, dtype=bool)
+        placed[order] = True
+        return np.concatenate([order, np.flatnonzero(~placed)])
+    
+    def reorder_articles(self, input_path: Path, output_path: Path) -> np.ndarray:
         """
         Reorder articles according to STARLIT algorithm.
         
+        The input is mmapped and copied span by span straight into the
+        output (sendfile/writev), so memory use does not grow with the file.
+        Everything before the first article (the XML header) stays first.
+        The permutation used is written to <output_path>.order.
+        
         Args:
             input_path: Original enwik file
             output_path: Reordered output file
+        
+        Returns:
+            The permutation (new position -> original article index)
         """
+        from article_order import save_order
+        
         print(f"\n{'='*60}")
         print("STARLIT ARTICLE REORDERING")
         print(f"{'='*60}\n")
         
-        # Read input file
-        print(f"Reading {input_path}...")
-        with open(input_path, 'rb') as f:
-            data = f.read()
-        
-        original_size = len(data)
-        print(f"Original size: {original_size:,} bytes")
-        
-        # Extract articles
-        print("\nExtracting articles...")
-        extractor = ArticleExtractor()
-        articles = extractor.extract_articles(data)
-        
-        print(f"Found {len(articles)} articles")
-        print(f"STARLIT order has {len(self.new_order)} entries")
-        
-        # Reorder articles
-        print("\nReordering articles by similarity...")
-        reordered_data = bytearray()
-        
-        # Track which articles we've placed
-        used_articles = set()
-        
-        # First: Place articles according to STARLIT order
-        placed_count = 0
-        for new_position, original_index in enumerate(self.new_order):
-            if new_position % 10000 == 0:
-                print(f"  Processing article {new_position:,}/{len(self.new_order):,}...")
+        with open(input_path, 'rb') as fin:
+            original_size = os.fstat(fin.fileno()).st_size
+            print(f"Original size: {original_size:,} bytes")
+            with mmap.mmap(fin.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                starts, ends = ArticleExtractor().article_spans(mm)
+            
+            print(f"Found {len(starts):,} articles")
+            print(f"STARLIT order has {len(self.new_order):,} entries")
+            order = self.complete_order(len(starts))
+            appended = len(order) - min(len(self.new_order), len(order))
+            if appended > 0:
+                print(f"Appending {appended:,} articles missing from the STARLIT order")
+            
+            header_end = int(starts[0]) if len(starts) else original_size
+            span_starts = np.concatenate([[0], starts[order]])
+            span_ends = np.concatenate([[header_end], ends[order]])
             
-            # STARLIT indices are 0-based
-            if original_index < len(articles):
-                start, end, title = articles[original_index]
-                article_content = extractor.get_article_content(data, start, end)
-                reordered_data.extend(article_content)
-                used_articles.add(original_index)
-                placed_count += 1
-        
-        print(f"Placed {placed_count:,} articles according to STARLIT order")
-        
-        # Second: Append any remaining articles (not in STARLIT order)
-        # This handles articles added after STARLIT was computed
-        remaining_count = 0
-        for i, (start, end, title) in enumerate(articles):
-            if i not in used_articles:
-                article_content = extractor.get_article_content(data, start, end)
-                reordered_data.extend(article_content)
-                remaining_count += 1
-        
-        if remaining_count > 0:
-            print(f"Appended {remaining_count:,} remaining articles")
-        
-        # Write reordered data
-        print(f"\nWriting reordered data to {output_path}...")
-        with open(output_path, 'wb') as f:
-            f.write(reordered_data)
-        
-        reordered_size = len(reordered_data)
+            print(f"\nWriting reordered data to {output_path}...")
+            with open(output_path, 'wb') as fout:
+                copy_spans(fin, fout, span_starts, span_ends)
+        
+        save_order(Path(str(output_path) + '.order'), order)
+        reordered_size = Path(output_path).stat().st_size
         
         print(f"\n{'='*60}")
         print("REORDERING COMPLETE!")
         print(f"{'='*60}")
         print(f"Original size:   {original_size:,} bytes")
         print(f"Reordered size:  {reordered_size:,} bytes")
-        print(f"Difference:      {reordered_size - original_size:,} bytes")
+        print(f"Permutation:     {output_path}.order")
         
         if reordered_size == original_size:
             print("✅ Perfect! No data lost or added.")
-        elif abs(reordered_size - original_size) < 100:
-            print("✅ Nearly perfect! Minimal difference (likely trailing bytes).")
         else:
-            print("⚠️  Size differs significantly - check implementation!")
+            print("⚠️  Size differs - check implementation!")
         
         print(f"\n{'='*60}")
         print("NEXT STEPS:")
@@ -169,12 +202,126 @@ class STARLITReorder:
         print(f"   paq8px-wiki.exe -5 {input_path} original.paq8")
         print("2. Compress reordered with PAQ8:")
         print(f"   paq8px-wiki.exe -5 {output_path} reordered.paq8")
-        print("3. Compare sizes - expect 15-20 MB improvement!")
+        print("3. After decompression restore the original order:")
+        print(f"   python starlit_reorder.py restore {output_path} restored {output_path}.order")
         print(f"{'='*60}\n")
+        
+        return order
+
+
+def copy_spans(fin, fout, starts: np.ndarray, ends: np.ndarray,
+               max_batch_bytes: int = 64 << 20):
+    """
+    Copy the byte ranges [starts[i], ends[i]) of fin to fout, in order.
+    
+    Adjacent ranges are coalesced first. Uses os.sendfile (kernel copy,
+    nothing passes through user space) where available, otherwise
+    os.writev of memoryviews into an mmap of the input, in batches of at
+    most IOV_MAX buffers / max_batch_bytes.
+    """
+    starts = np.asarray(starts, dtype=np.int64)
+    ends = np.asarray(ends, dtype=np.int64)
+    keep = ends > starts
+    starts, ends = starts[keep], ends[keep]
+    if len(starts) == 0:
+        return
+    
+    # Coalesce: a span that starts where the previous one ended extends it
+    breaks = np.flatnonzero(starts[1:] != ends[:-1]) + 1
+    starts = starts[np.concatenate([[0], breaks])]
+    ends = ends[np.concatenate([breaks - 1, [len(ends) - 1]])]
+    
+    fout.flush()
+    in_fd = fin.fileno()
+    out_fd = fout.fileno()
+    
+    if hasattr(os, 'sendfile'):
+        copied = 0
+        try:
+            for start, end in zip(starts.tolist(), ends.tolist()):
+                while start < end:
+                    sent = os.sendfile(out_fd, in_fd, start, min(end - start, 1 << 30))
+                    if sent == 0:
+                        raise IOError("Unexpected end of input")
+                    start += sent
+                    copied += sent
+            return
+        except OSError as e:
+            # sendfile not supported for these files: fall back to writev
+            if copied or e.errno not in (errno.EINVAL, errno.ENOSYS, errno.EOPNOTSUPP):
+                raise
+    
+    iov_max = os.sysconf('SC_IOV_MAX') if hasattr(os, 'sysconf') else 1024
+    with mmap.mmap(in_fd, 0, access=mmap.ACCESS_READ) as mm:
+        view = memoryview(mm)
+        try:
+            batch = []
+            batch_bytes = 0
+            for start, end in zip(starts.tolist(), ends.tolist()):
+                for pos in range(start, end, max_batch_bytes):
+                    piece = view[pos:min(end, pos + max_batch_bytes)]
+                    batch.append(piece)
+                    batch_bytes += len(piece)
+                    if len(batch) >= iov_max or batch_bytes >= max_batch_bytes:
+                        _writev_all(out_fd, batch)
+                        batch, batch_bytes = [], 0
+            _writev_all(out_fd, batch)
+        finally:
+            view.release()
+
+
+def _writev_all(fd: int, buffers: list):
+    """os.writev until every buffer is written (writev may write partially)"""
+    while buffers:
+        written = os.writev(fd, buffers)
+        while buffers and written >= len(buffers[0]):
+            written -= len(buffers[0])
+            buffers[0].release()
+            buffers.pop(0)
+        if written:
+            buffers[0] = buffers[0][written:]
+
+
+def restore_articles(input_path: Path, output_path: Path, order_file: Path):
+    """
+    Inverse of STARLITReorder.reorder_articles: put the articles of a
+    reordered file back in their original order using the stored
+    permutation. Byte-exact, streams from an mmap like the reorder.
+    """
+    from article_order import load_order
+    
+    order, inverse = load_order(order_file)
+    with open(input_path, 'rb') as fin:
+        with mmap.mmap(fin.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            starts, ends = ArticleExtractor().article_spans(mm)
+        if len(starts) != len(order):
+            raise ValueError(f"{input_path} has {len(starts):,} articles, "
+                             f"order file has {len(order):,}")
+        
+        # Original article i sits at reordered position inverse[i]
+        positions = np.asarray(inverse, dtype=np.int64)
+        header_end = int(starts[0]) if len(starts) else os.fstat(fin.fileno()).st_size
+        span_starts = np.concatenate([[0], starts[positions]])
+        span_ends = np.concatenate([[header_end], ends[positions]])
+        with open(output_path, 'wb') as fout:
+            copy_spans(fin, fout, span_starts, span_ends)
 
 
 def main():
-    """Test article reordering on enwik_10mb."""
+    """
+    Usage:
+        python starlit_reorder.py                                  (enwik9 with the STARLIT order)
+        python starlit_reorder.py reorder INPUT OUTPUT ORDER_FILE  (writes OUTPUT.order)
+        python starlit_reorder.py restore INPUT OUTPUT ORDER_FILE
+    """
+    if len(sys.argv) == 5 and sys.argv[1] in ('reorder', 'restore'):
+        command, input_file, output_file, order_file = sys.argv[1], *map(Path, sys.argv[2:])
+        if command == 'reorder':
+            STARLITReorder(order_file).reorder_articles(input_file, output_file)
+        else:
+            restore_articles(input_file, output_file, order_file)
+            print(f"Restored {output_file} ({output_file.stat().st_size:,} bytes)")
+        return 0
     
     # Paths
     starlit_order = Path("starlit/src/readalike_prepr/data/new_article_order")
@@ -189,7 +336,7 @@ def main():
     
     if not input_file.exists():
         print(f"❌ Error: Input file not found: {input_file}")
-        print("   Make sure enwik_10mb exists in data/ directory!")
+        print("   Make sure enwik9 exists in data/ directory!")
         return 1
     
     # Reorder
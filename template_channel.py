@@ -0,0 +1,375 @@
+#!/usr/bin/env python3
+"""
+Lossless template channel: {{name|key=value|...}} as coded columns
+
+TemplateDictionary (graph_template_compressor.py, ultra_compressor.py)
+and MegaTemplateDictionary only estimated what template names would cost
+with a top-N lookup. This channel actually codes the templates:
+
+    name      rank in an adaptive frequency-ranked dictionary, 0 = new name
+    keys      per template name, the key that followed the previous key the
+              last time (infobox fields come in the same order), else an
+              MTF rank in the template's key list, else a literal
+    values    passed on verbatim (for the text model), nested templates
+              included
+
+Templates are found with a bracket-depth stack over the {{ }} [[ ]] and |
+tokens of the whole buffer - one regex pass, linear in the input, and
+nesting is handled correctly (the old \\{\\{([^}]+)\\}\\} regex stops at the
+first inner "}}"). Only outermost templates are lifted; the main stream
+keeps everything else, and the template positions are stored as deltas.
+"""
+import lzma
+import re
+import sys
+import time
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+MAGIC = b'TPL1'
+
+TOKEN_PATTERN = re.compile(rb'\{\{|\}\}|\[\[|\]\]|\|')
+OPEN_TEMPLATE, CLOSE_TEMPLATE, OPEN_LINK, CLOSE_LINK, PIPE = b'{', b'}', b'[', b']', b'|'
+
+# A key is the text before "=" only when it has no markup of its own
+KEY_PATTERN = re.compile(rb'[^=\[\]{}<>|]*')
+
+# Key codes
+END = 0          # no more parameters
+POSITIONAL = 1   # parameter without key
+PREDICTED = 2    # key = successor of the previous key in this template
+RANKED = 3       # 3 + r: MTF rank r in the template's key list, 3 + len(list): new key
+
+STREAMS = ('position', 'name', 'name_literal', 'key', 'key_literal', 'value_length', 'values')
+
+
+def _write_varint(out: bytearray, n: int):
+    while n >= 0x80:
+        out.append((n & 0x7F) | 0x80)
+        n >>= 7
+    out.append(n)
+
+
+def _read_varint(buf, pos: int) -> Tuple[int, int]:
+    n = 0
+    shift = 0
+    while True:
+        b = buf[pos]
+        pos += 1
+        n |= (b & 0x7F) << shift
+        if b < 0x80:
+            return n, pos
+        shift += 7
+
+
+def find_templates(data: bytes) -> List[Tuple[int, int, List[int]]]:
+    """
+    Outermost templates as (start, end, pipe positions) - end is past "}}",
+    pipes are the "|" at the template's own level (not inside nested
+    templates or links). Unbalanced brackets are left as text.
+    """
+    templates = []
+    stack = []  # [kind, start, pipes]
+    depths = {OPEN_TEMPLATE: [], OPEN_LINK: []}  # stack depths of each opener kind, innermost last
+    for m in TOKEN_PATTERN.finditer(data):
+        start = m.start()
+        kind = data[start:start + 1]
+        if kind == PIPE:
+            if stack:
+                stack[-1][2].append(start)
+        elif kind == OPEN_TEMPLATE or kind == OPEN_LINK:
+            depths[kind].append(len(stack))
+            stack.append([kind, start, []])
+        else:
+            opener = OPEN_TEMPLATE if kind == CLOSE_TEMPLATE else OPEN_LINK
+            if not depths[opener]:
+                continue  # closer without opener: text
+            depth = depths[opener][-1]
+            entry = stack[depth]
+            for inner in stack[depth:]:  # unclosed brackets inside are text
+                depths[inner[0]].pop()
+            del stack[depth:]
+            if opener == OPEN_TEMPLATE and not depths[OPEN_TEMPLATE]:
+                templates.append((entry[1], m.end(), entry[2]))
+    return templates
+
+
+class RankedDictionary:
+    """
+    Adaptive dictionary ranked by frequency (ties: most recent first).
+    rank() / item() then touch(): O(1) per use - an item swaps with the
+    first item of its count group, so the list stays sorted.
+    """
+
+    def __init__(self):
+        self.items: List[bytes] = []
+        self.index: Dict[bytes, int] = {}
+        self.counts: List[int] = []
+        self.group_start: Dict[int, int] = {}
+
+    def __len__(self):
+        return len(self.items)
+
+    def rank(self, item: bytes) -> int:
+        """Rank of item, -1 if unknown"""
+        return self.index.get(item, -1)
+
+    def add(self, item: bytes):
+        items = self.items
+        if not items or self.counts[-1] != 1:
+            self.group_start[1] = len(items)
+        self.index[item] = len(items)
+        items.append(item)
+        self.counts.append(1)
+
+    def touch(self, rank: int):
+        items, counts, index = self.items, self.counts, self.index
+        c = counts[rank]
+        j = self.group_start[c]
+        items[rank], items[j] = items[j], items[rank]
+        index[items[rank]] = rank
+        index[items[j]] = j
+        self.group_start[c] = j + 1
+        if j == 0 or counts[j - 1] != c + 1:
+            self.group_start[c + 1] = j
+        counts[j] = c + 1
+
+
+class TemplateModel:
+    """Shared encoder/decoder state: name dictionary and per-template key models"""
+
+    def __init__(self):
+        self.names = RankedDictionary()
+        self.keys: Dict[bytes, List[bytes]] = {}                # MTF key list per name
+        self.successor: Dict[bytes, Dict[bytes, bytes]] = {}    # name -> prev key -> next key
+
+    def predicted(self, name: bytes, previous: bytes):
+        successor = self.successor.get(name)
+        return successor.get(previous) if successor else None
+
+    def learn(self, name: bytes, previous: bytes, key: bytes):
+        self.successor.setdefault(name, {})[previous] = key
+        keys = self.keys.setdefault(name, [])
+        if key in keys:
+            keys.remove(key)
+        keys.insert(0, key)
+
+
+def split_parts(content: bytes, pipes: List[int], offset: int) -> List[bytes]:
+    parts = []
+    pos = 0
+    for pipe in pipes:
+        parts.append(content[pos:pipe - offset])
+        pos = pipe - offset + 1
+    parts.append(content[pos:])
+    return parts
+
+
+class TemplateChannelEncoder:
+    def __init__(self):
+        self.streams = {name: bytearray() for name in STREAMS}
+        self.model = TemplateModel()
+        self.stats = {'templates': 0, 'template_bytes': 0, 'name_hits': 0,
+                      'params': 0, 'keyed': 0, 'predicted': 0, 'ranked': 0, 'new_keys': 0}
+
+    def _literal(self, stream: str, value: bytes):
+        _write_varint(self.streams[stream], len(value))
+        self.streams[stream] += value
+
+    def _code_template(self, content: bytes, pipes: List[int], offset: int):
+        streams, model, stats = self.streams, self.model, self.stats
+        parts = split_parts(content, pipes, offset)
+        name = parts[0]
+
+        rank = model.names.rank(name)
+        if rank < 0:
+            _write_varint(streams['name'], 0)
+            self._literal('name_literal', name)
+            model.names.add(name)
+            rank = len(model.names) - 1
+        else:
+            _write_varint(streams['name'], rank + 1)
+            stats['name_hits'] += 1
+        model.names.touch(rank)
+
+        previous = b''
+        for part in parts[1:]:
+            stats['params'] += 1
+            m = KEY_PATTERN.match(part)
+            if m.end() == len(part) or part[m.end()] != 61:  # no "=" right after the key
+                _write_varint(streams['key'], POSITIONAL)
+                value = part
+            else:
+                key = part[:m.end()]
+                value = part[m.end() + 1:]
+                stats['keyed'] += 1
+                keys = model.keys.get(name, [])
+                if model.predicted(name, previous) == key:
+                    _write_varint(streams['key'], PREDICTED)
+                    stats['predicted'] += 1
+                elif key in keys:
+                    _write_varint(streams['key'], RANKED + keys.index(key))
+                    stats['ranked'] += 1
+                else:
+                    _write_varint(streams['key'], RANKED + len(keys))
+                    self._literal('key_literal', key)
+                    stats['new_keys'] += 1
+                model.learn(name, previous, key)
+                previous = key
+            _write_varint(streams['value_length'], len(value))
+            streams['values'] += value
+        _write_varint(streams['key'], END)
+
+    def encode(self, data: bytes) -> bytes:
+        """Returns the main stream; the channel is in metadata()"""
+        out = []
+        pos = 0
+        main_pos = 0
+        last = 0
+        for start, end, pipes in find_templates(data):
+            out.append(data[pos:start])
+            main_pos += start - pos
+            _write_varint(self.streams['position'], main_pos - last)
+            last = main_pos
+            self._code_template(data[start + 2:end - 2], pipes, start + 2)
+            self.stats['templates'] += 1
+            self.stats['template_bytes'] += end - start
+            pos = end
+        out.append(data[pos:])
+        return b''.join(out)
+
+    def metadata(self) -> bytes:
+        out = bytearray(MAGIC)
+        _write_varint(out, self.stats['templates'])
+        for name in STREAMS:
+            _write_varint(out, len(self.streams[name]))
+            out += self.streams[name]
+        return bytes(out)
+
+
+class TemplateChannelDecoder:
+    def __init__(self, metadata: bytes):
+        if metadata[:4] != MAGIC:
+            raise ValueError("Not a template channel block")
+        self.count, pos = _read_varint(metadata, 4)
+        self.streams = {}
+        for name in STREAMS:
+            n, pos = _read_varint(metadata, pos)
+            self.streams[name] = metadata[pos:pos + n]
+            pos += n
+        self.cursor = dict.fromkeys(STREAMS, 0)
+        self.model = TemplateModel()
+
+    def _varint(self, stream: str) -> int:
+        n, self.cursor[stream] = _read_varint(self.streams[stream], self.cursor[stream])
+        return n
+
+    def _bytes(self, stream: str, n: int) -> bytes:
+        pos = self.cursor[stream]
+        self.cursor[stream] = pos + n
+        return self.streams[stream][pos:pos + n]
+
+    def _template(self) -> bytes:
+        model = self.model
+        code = self._varint('name')
+        if code == 0:
+            name = self._bytes('name_literal', self._varint('name_literal'))
+            model.names.add(name)
+            rank = len(model.names) - 1
+        else:
+            rank = code - 1
+            name = model.names.items[rank]
+        model.names.touch(rank)
+
+        parts = [name]
+        previous = b''
+        while True:
+            code = self._varint('key')
+            if code == END:
+                break
+            value = self._bytes('values', self._varint('value_length'))
+            if code == POSITIONAL:
+                parts.append(value)
+                continue
+            if code == PREDICTED:
+                key = model.predicted(name, previous)
+            else:
+                keys = model.keys.get(name, [])
+                if code - RANKED < len(keys):
+                    key = keys[code - RANKED]
+                else:
+                    key = self._bytes('key_literal', self._varint('key_literal'))
+            model.learn(name, previous, key)
+            previous = key
+            parts.append(key + b'=' + value)
+        return b'{{' + b'|'.join(parts) + b'}}'
+
+    def decode(self, main: bytes) -> bytes:
+        out = []
+        pos = 0
+        for _ in range(self.count):
+            take = self._varint('position')
+            out.append(main[pos:pos + take])
+            pos += take
+            out.append(self._template())
+        out.append(main[pos:])
+        return b''.join(out)
+
+
+def main():
+    input_file = Path(sys.argv[1]) if len(sys.argv) > 1 else Path("wiki_1mb.txt")
+
+    print("=" * 70)
+    print("TEMPLATE CHANNEL - name dictionary + parameter-key prediction")
+    print("=" * 70)
+
+    data = input_file.read_bytes()
+    encoder = TemplateChannelEncoder()
+    start = time.perf_counter()
+    main_stream = encoder.encode(data)
+    metadata = encoder.metadata()
+    encode_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    restored = TemplateChannelDecoder(metadata).decode(main_stream)
+    decode_time = time.perf_counter() - start
+    if restored != data:
+        raise RuntimeError("Round trip FAILED")
+
+    stats = encoder.stats
+    mb = len(data) / 1e6
+    print(f"\nInput:        {input_file} ({len(data):,} bytes)")
+    print(f"Templates:    {stats['templates']:,} outermost ({stats['template_bytes']:,} bytes, "
+          f"{stats['template_bytes'] / len(data) * 100:.1f}% of input)")
+    print(f"Names:        {len(encoder.model.names):,} distinct, "
+          f"{stats['name_hits'] / max(1, stats['templates']) * 100:.1f}% dictionary hits")
+    print(f"Parameters:   {stats['params']:,} ({stats['keyed']:,} with key)")
+    keyed = max(1, stats['keyed'])
+    print(f"Keys:         {stats['predicted'] / keyed * 100:.1f}% predicted, "
+          f"{stats['ranked'] / keyed * 100:.1f}% ranked, {stats['new_keys'] / keyed * 100:.1f}% new")
+    print(f"Encode / decode: {mb / encode_time:.1f} / {mb / decode_time:.1f} MB/s")
+
+    print("\nStreams (raw bytes):")
+    for name in STREAMS:
+        print(f"  {name:<13} {len(encoder.streams[name]):>8,}")
+
+    whole = len(lzma.compress(data, preset=9))
+    split = len(lzma.compress(main_stream, preset=9)) + len(lzma.compress(metadata, preset=9))
+    print(f"\nxz -9, templates in text:    {whole:,} bytes")
+    print(f"xz -9, main + channel:       {split:,} bytes ({(split - whole) / whole * 100:+.2f}%)")
+    print("✅ Round trip verified")
+
+    # Unbalanced markup must stay linear: every closer used to scan the whole stack
+    n = 200000
+    for label, junk in (("[[ x n + }} x n", b'[[' * n + b'}}' * n), ("{{ x n + ]] x n", b'{{' * n + b']]' * n)):
+        start = time.perf_counter()
+        found = find_templates(junk)
+        elapsed = time.perf_counter() - start
+        if found or elapsed > 5:
+            raise RuntimeError(f"Unbalanced input {label}: {len(found)} templates in {elapsed:.1f}s")
+        print(f"✅ Unbalanced {label} (n={n:,}): {elapsed:.2f}s")
+    print("=" * 70)
+
+
+if __name__ == "__main__":
+    main()
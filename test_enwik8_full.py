@@ -13,10 +13,12 @@ Steps:
 """
 import os
 import re
-from collections import defaultdict, Counter
+from collections import Counter
 import math
 import time
 
+from model_cache import ModelCache
+
 class Enwik8Verification:
     """Full enwik8 verification (100 MB)"""
     
@@ -30,34 +32,20 @@ class Enwik8Verification:
         print("=" * 70)
         
         sample = text[:train_size]
+        cache = ModelCache()
         
-        # Text models
-        self.text_models = {}
-        for order in [5, 4, 3, 2]:
-            self.text_models[order] = defaultdict(lambda: Counter())
-        self.text_models[1] = Counter()
-        self.char_freq = Counter()
-        
+        # Text models (cached by content of the training slice)
         print(f"\nTraining text models on {train_size:,} chars...")
         start = time.time()
-        
-        for i in range(5, len(sample)):
-            char = sample[i]
-            self.text_models[5][sample[i-5:i]][char] += 1
-            self.text_models[4][sample[i-4:i]][char] += 1
-            self.text_models[3][sample[i-3:i]][char] += 1
-            self.text_models[2][sample[i-2:i]][char] += 1
-            self.text_models[1][char] += 1
-            self.char_freq[char] += 1
-            
-            if (i + 1) % 2000000 == 0:
-                elapsed = time.time() - start
-                rate = (i + 1) / elapsed
-                remaining = (len(sample) - i - 1) / rate
-                print(f"  Progress: {i+1:,} / {len(sample):,} ({rate:,.0f} chars/sec, {remaining:.0f}s left)")
+        text_orders = cache.get(sample, 'text_orders', orders=[5, 4, 3, 2])
+        # Probed on every character: plain dicts, not the mmapped tables
+        self.text_models = {k: table.to_dict() for k, table in text_orders.tables.items()}
+        self.text_models[1] = text_orders.order0
+        self.char_freq = Counter(text_orders.order0)
         
         elapsed = time.time() - start
-        print(f"  ✅ Text training: {elapsed:.1f}s")
+        source = "loaded from cache" if cache.stats['hits'] else "trained and cached"
+        print(f"  ✅ Text models: {elapsed:.1f}s ({source})")
         print(f"  Order-5: {len(self.text_models[5]):,} contexts")
         print(f"  Order-4: {len(self.text_models[4]):,} contexts")
         print(f"  Order-3: {len(self.text_models[3]):,} contexts")
@@ -65,17 +53,13 @@ class Enwik8Verification:
         
         # Link models
         print("\nTraining link models...")
-        links = re.findall(r'\[\[([^\]|]+)(?:\|[^\]]+)?\]\]', sample)
-        self.link_vocab = Counter(links)
-        
-        self.link_order6 = defaultdict(lambda: Counter())
-        
-        for i in range(6, len(links)):
-            ctx = tuple(links[i-6:i])
-            self.link_order6[ctx][links[i]] += 1
+        link_orders = cache.get(sample, 'link_orders', orders=[6, 2])
+        self.link_vocab = link_orders.vocab
+        self.link_order6 = link_orders.tables[6]
         
-        print(f"  ✅ Links: {len(links):,} total")
-        print(f"  ✅ Unique: {len(self.link_vocab):,}")
+        print(f"  ✅ Links: {sum(self.link_vocab.values()):,} total")
+        print(f"  Order-6: {len(self.link_order6):,} contexts")
+        print(f"  Unique links: {len(self.link_vocab):,}")
         
         self.models_trained = True
         print("\n✅ Models trained!")
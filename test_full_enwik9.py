@@ -14,10 +14,12 @@ Steps:
 """
 import os
 import re
-from collections import defaultdict, Counter
+from collections import Counter
 import math
 import time
 
+from model_cache import ModelCache
+
 class EnwikNineVerification:
     """Full enwik9 verification"""
     
@@ -54,49 +56,34 @@ class EnwikNineVerification:
         print("=" * 70)
         
         sample = text[:train_size]
+        cache = ModelCache()
         
-        # Text models
-        self.text_models = {}
-        for order in [5, 4, 3, 2]:
-            self.text_models[order] = defaultdict(lambda: Counter())
-        self.text_models[1] = Counter()
-        self.char_freq = Counter()
-        
+        # Text models (cached by content of the training slice)
         print(f"\nTraining text models on {train_size:,} chars...")
         start = time.time()
-        
-        for i in range(5, len(sample)):
-            char = sample[i]
-            self.text_models[5][sample[i-5:i]][char] += 1
-            self.text_models[4][sample[i-4:i]][char] += 1
-            self.text_models[3][sample[i-3:i]][char] += 1
-            self.text_models[2][sample[i-2:i]][char] += 1
-            self.text_models[1][char] += 1
-            self.char_freq[char] += 1
-            
-            if (i + 1) % 2000000 == 0:
-                elapsed = time.time() - start
-                rate = (i + 1) / elapsed
-                print(f"  Progress: {i+1:,} / {len(sample):,} ({rate:,.0f} chars/sec)")
+        text_orders = cache.get(sample, 'text_orders', orders=[5, 4, 3, 2])
+        # Probed on every character: plain dicts, not the mmapped tables
+        self.text_models = {k: table.to_dict() for k, table in text_orders.tables.items()}
+        self.text_models[1] = text_orders.order0
+        self.char_freq = Counter(text_orders.order0)
         
         elapsed = time.time() - start
-        print(f"  ✅ Text training: {elapsed:.1f}s")
+        source = "loaded from cache" if cache.stats['hits'] else "trained and cached"
+        print(f"  ✅ Text models: {elapsed:.1f}s ({source})")
         print(f"  Order-5: {len(self.text_models[5]):,} contexts")
         print(f"  Order-4: {len(self.text_models[4]):,} contexts")
+        print(f"  Order-3: {len(self.text_models[3]):,} contexts")
+        print(f"  Order-2: {len(self.text_models[2]):,} contexts")
         
         # Link models
         print("\nTraining link models...")
-        links = re.findall(r'\[\[([^\]|]+)(?:\|[^\]]+)?\]\]', sample)
-        self.link_vocab = Counter(links)
-        
-        self.link_order6 = defaultdict(lambda: Counter())
+        link_orders = cache.get(sample, 'link_orders', orders=[6, 2])
+        self.link_vocab = link_orders.vocab
+        self.link_order6 = link_orders.tables[6]
         
-        for i in range(6, len(links)):
-            ctx = tuple(links[i-6:i])
-            self.link_order6[ctx][links[i]] += 1
-        
-        print(f"  ✅ Links: {len(links):,} total")
-        print(f"  ✅ Unique: {len(self.link_vocab):,}")
+        print(f"  ✅ Links: {sum(self.link_vocab.values()):,} total")
+        print(f"  Order-6: {len(self.link_order6):,} contexts")
+        print(f"  Unique links: {len(self.link_vocab):,}")
         
         self.models_trained = True
         print("\n✅ Models trained on 10 MB!")
@@ -237,73 +224,38 @@ class EnwikNineVerification:
         print("🔬 TESTING ON FULL ENWIK9")
         print("=" * 70)
         
-        # Read first 10 MB for training
-        print("\nReading enwik9 for training...")
-        with open(filepath, 'rb') as f:
-            train_data = f.read(10 * 1024 * 1024)
-        
-        train_text = train_data.decode('utf-8', errors='ignore')
-        
-        # Train
-        self.train_models(train_text, train_size=len(train_text))
+        from parallel_eval import ENWIK9_SECTIONS, ParallelEvaluator, format_evaluation
+
+        # Train once on the first 10 MB; the models go into shared memory
+        print("\nTraining on the first 10 MB of enwik9...")
+        evaluator = ParallelEvaluator(filepath)
+        evaluator.train(10 * 1024 * 1024)
+        source = "loaded from cache" if evaluator.cache.stats['hits'] else "trained and cached"
+        print(f"  ✅ Models: {evaluator.train_seconds:.1f}s ({source}), "
+              f"{evaluator.shared_bytes / 1024 / 1024:.1f} MB shared")
         
-        # Test on multiple sections throughout the file
+        # Test on multiple sections throughout the file, one worker per section
         print("\n" + "=" * 70)
         print("📊 TESTING MULTIPLE SECTIONS")
         print("=" * 70)
         
-        # Test at different offsets (avoiding training data)
-        test_size = 1 * 1024 * 1024  # 1 MB per test
-        test_configs = [
-            (20 * 1024 * 1024, "20 MB offset"),
-            (100 * 1024 * 1024, "100 MB offset"),
-            (300 * 1024 * 1024, "300 MB offset"),
-            (500 * 1024 * 1024, "500 MB offset"),
-            (700 * 1024 * 1024, "700 MB offset"),
-            (900 * 1024 * 1024, "900 MB offset"),
-        ]
+        def progress(r):
+            print(f"  {r.name}: {r.chars:,} chars, baseline {r.baseline_bits:,.0f} bits, "
+                  f"combined {r.combined_bits:,.0f} bits ({r.percent:.2f}%, {r.seconds:.1f}s)")
         
-        all_savings = []
+        with evaluator:
+            evaluation = evaluator.evaluate(ENWIK9_SECTIONS, progress=progress)
         
-        for offset, name in test_configs:
-            if offset + test_size > filesize:
-                print(f"\n⚠️ Skipping {name} - beyond file size")
-                continue
-            
-            print(f"\n{'=' * 70}")
-            print(f"Test: {name}")
-            print(f"{'=' * 70}")
-            
-            # Read test section
-            with open(filepath, 'rb') as f:
-                f.seek(offset)
-                test_data = f.read(test_size)
-            
-            test_text = test_data.decode('utf-8', errors='ignore')
-            print(f"Testing on {len(test_text):,} chars...")
-            
-            # Compress
-            start = time.time()
-            baseline_bits = self.compress_baseline(test_text)
-            baseline_time = time.time() - start
-            
-            start = time.time()
-            combined_bits = self.compress_combined(test_text)
-            combined_time = time.time() - start
-            
-            savings = baseline_bits - combined_bits
-            percent = (savings / baseline_bits * 100) if baseline_bits > 0 else 0
-            
-            print(f"\n  Baseline: {baseline_bits:,.0f} bits ({baseline_time:.1f}s)")
-            print(f"  Combined: {combined_bits:,.0f} bits ({combined_time:.1f}s)")
-            print(f"  Savings: {savings:,.0f} bits ({percent:.2f}%)")
-            
-            all_savings.append({
-                'name': name,
-                'savings': savings,
-                'percent': percent,
-                'baseline': baseline_bits,
-            })
+        print(f"\n{format_evaluation(evaluation)}")
+        print(f"\n  {evaluation.workers} workers, {evaluation.wall_seconds:.1f}s wall, "
+              f"{evaluation.cpu_seconds:.1f}s of section time")
+        
+        all_savings = [{
+            'name': r.name,
+            'savings': r.savings,
+            'percent': r.percent,
+            'baseline': r.baseline_bits,
+        } for r in evaluation.results]
         
         # Final calculation
         print("\n" + "=" * 70)
@@ -325,6 +277,7 @@ class EnwikNineVerification:
             print(f"  Average: {avg_percent:.2f}%")
             print(f"  Minimum: {min_percent:.2f}%")
             print(f"  Maximum: {max_percent:.2f}%")
+            print(f"  95% CI: {evaluation.percent.low:.2f}% .. {evaluation.percent.high:.2f}%")
             
             # Calculate MB savings on full enwik9
             # enwik9 is 1 billion bytes
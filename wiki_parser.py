@@ -4,9 +4,13 @@ Parser struktury MediaWiki XML do wielokanałowego modelowania
 Rozbija tekst na różne "kanały" (nagłówki, linki, treść, etc.)
 """
 import re
+import time
+from array import array
 from enum import Enum
 from dataclasses import dataclass
-from typing import List, Tuple
+from typing import List, Tuple, Union
+
+import numpy as np
 
 class TokenType(Enum):
     """Typy tokenów w strukturze Wiki"""
@@ -26,6 +30,98 @@ class Token:
     content: bytes
     context: str = ""    # Dodatkowy kontekst (np. poziom nagłówka, nazwa template)
 
+# Jedna alternatywa na typ tokenu, każda w zewnętrznej grupie - m.lastindex
+# wskazuje typ. Kolejność jak w dawnym tokenize(): nagłówek, link, template,
+# tag XML, encja, \n, znak specjalny, tekst.
+TOKEN_PATTERN = re.compile(
+    rb'((={2,6})([^=]+)\2)'                 # 1: nagłówek (2: poziom, 3: treść)
+    rb'|(\[\[([^\]|]+)(?:\|[^\]]+)?\]\])'     # 4: link (5: cel)
+    rb'|(\{\{([^}]+)\}\})'                   # 6: template (7: treść)
+    rb'|(<(/?)(\w+)[^>]*>)'                  # 8: tag XML (9: zamykający, 10: nazwa)
+    rb'|(&[a-zA-Z]+;|&#\d+;)'                # 11: encja
+    rb'|(\n)'                                # 12: nowa linia
+    rb"|([*#:;'])"                           # 13: znak specjalny
+    rb"|([^\n*#:;'\[{<&=]+|[\[{<&=])"         # 14: tekst (także samotne [ { < & =)
+)
+
+# Numer grupy zewnętrznej -> (typ, grupa z treścią tokenu)
+_GROUP_TYPES = {
+    1: (TokenType.HEADING.value, 3),
+    4: (TokenType.LINK.value, 5),
+    6: (TokenType.TEMPLATE.value, 7),
+    8: (TokenType.XML_TAG.value, 10),
+    11: (TokenType.ENTITY.value, 11),
+    12: (TokenType.NEWLINE.value, 12),
+    13: (TokenType.SPECIAL.value, 13),
+    14: (TokenType.PLAIN_TEXT.value, 14),
+}
+
+_CHANNEL_TYPES = {
+    'heading': (TokenType.HEADING.value,),
+    'link': (TokenType.LINK.value,),
+    'template': (TokenType.TEMPLATE.value,),
+    'text': (TokenType.PLAIN_TEXT.value,),
+    'structure': (TokenType.XML_TAG.value, TokenType.ENTITY.value,
+                  TokenType.SPECIAL.value, TokenType.NEWLINE.value),
+}
+
+
+class TokenColumns:
+    """
+    Tokeny jako kolumny (struct-of-arrays) zamiast listy obiektów Token
+
+    Kolumny (tablice NumPy, ta sama długość):
+        type            uint8, TokenType.value
+        start, end      int64, zakres całego tokenu w data
+        content_start,
+        content_end     int64, zakres treści (jak Token.content)
+        info            uint8, poziom nagłówka / 1 dla tagu zamykającego
+
+    Treść nie jest kopiowana - content(i) zwraca memoryview na data.
+    """
+
+    __slots__ = ('data', 'type', 'start', 'end', 'content_start', 'content_end', 'info')
+
+    def __init__(self, data, type, start, end, content_start, content_end, info):
+        self.data = data
+        self.type = type
+        self.start = start
+        self.end = end
+        self.content_start = content_start
+        self.content_end = content_end
+        self.info = info
+
+    def __len__(self):
+        return len(self.type)
+
+    def content(self, i: int) -> memoryview:
+        return memoryview(self.data)[int(self.content_start[i]):int(self.content_end[i])]
+
+    def gather(self, mask: np.ndarray) -> List[memoryview]:
+        """Treści tokenów wybranych maską, w kolejności występowania"""
+        view = memoryview(self.data)
+        return [view[s:e] for s, e in zip(self.content_start[mask].tolist(),
+                                          self.content_end[mask].tolist())]
+
+    def to_tokens(self) -> List[Token]:
+        """Lista obiektów Token (zgodność ze starym API)"""
+        tokens = []
+        data = self.data
+        for t, s, e, info in zip(self.type.tolist(), self.content_start.tolist(),
+                                 self.content_end.tolist(), self.info.tolist()):
+            token_type = TokenType(t)
+            if token_type == TokenType.HEADING:
+                context = f"h{info}"
+            elif token_type == TokenType.XML_TAG:
+                context = "close" if info else "open"
+            elif token_type in (TokenType.LINK, TokenType.TEMPLATE, TokenType.ENTITY):
+                context = token_type.name.lower()
+            else:
+                context = ""
+            tokens.append(Token(type=token_type, content=bytes(data[s:e]), context=context))
+        return tokens
+
+
 class WikiParser:
     """
     Parser struktury MediaWiki
@@ -40,149 +136,94 @@ class WikiParser:
         self.xml_tag_pattern = re.compile(rb'<(/?)(\w+)([^>]*)>')
         self.entity_pattern = re.compile(rb'&[a-zA-Z]+;|&#\d+;')
         
+    def tokenize_columns(self, data: bytes) -> TokenColumns:
+        """
+        Rozbija dane na tokeny jednym przebiegiem re.finditer
+
+        Args:
+            data: surowe bajty z pliku enwik (bytes, bytearray lub mmap)
+
+        Returns:
+            TokenColumns - kolumny typów i zakresów odwołujące się do data
+        """
+        types = array('B')
+        starts = array('q')
+        ends = array('q')
+        content_starts = array('q')
+        content_ends = array('q')
+        info = array('B')
+        group_types = _GROUP_TYPES
+
+        for m in TOKEN_PATTERN.finditer(data):
+            group = m.lastindex
+            token_type, content_group = group_types[group]
+            s, e = m.span()
+            types.append(token_type)
+            starts.append(s)
+            ends.append(e)
+
+            if group == 1:
+                # Treść nagłówka bez spacji na brzegach, info = poziom
+                cs, ce = m.span(3)
+                while cs < ce and data[cs] in b' \t\r\n\x0b\x0c':
+                    cs += 1
+                while ce > cs and data[ce - 1] in b' \t\r\n\x0b\x0c':
+                    ce -= 1
+                content_starts.append(cs)
+                content_ends.append(ce)
+                info.append(m.end(2) - m.start(2))
+            elif group >= 11:
+                content_starts.append(s)
+                content_ends.append(e)
+                info.append(0)
+            else:
+                cs, ce = m.span(content_group)
+                content_starts.append(cs)
+                content_ends.append(ce)
+                info.append(1 if group == 8 and m.end(9) > m.start(9) else 0)
+
+        return TokenColumns(
+            data,
+            np.frombuffer(types, dtype=np.uint8),
+            np.frombuffer(starts, dtype=np.int64),
+            np.frombuffer(ends, dtype=np.int64),
+            np.frombuffer(content_starts, dtype=np.int64),
+            np.frombuffer(content_ends, dtype=np.int64),
+            np.frombuffer(info, dtype=np.uint8),
+        )
+
     def tokenize(self, data: bytes) -> List[Token]:
         """
         Rozbija dane na tokeny
-        
+
         Args:
             data: surowe bajty z pliku enwik
-        
+
         Returns:
-            Lista tokenów
+            Lista tokenów (do dużych danych używaj tokenize_columns)
         """
-        tokens = []
-        pos = 0
-        
-        while pos < len(data):
-            # Sprawdź nagłówki
-            match = self.heading_pattern.match(data, pos)
-            if match:
-                level = len(match.group(1))
-                content = match.group(2)
-                tokens.append(Token(
-                    type=TokenType.HEADING,
-                    content=content.strip(),
-                    context=f"h{level}"
-                ))
-                pos = match.end()
-                continue
-            
-            # Sprawdź linki
-            match = self.link_pattern.match(data, pos)
-            if match:
-                target = match.group(1)
-                tokens.append(Token(
-                    type=TokenType.LINK,
-                    content=target,
-                    context="link"
-                ))
-                pos = match.end()
-                continue
-            
-            # Sprawdź template
-            match = self.template_pattern.match(data, pos)
-            if match:
-                content = match.group(1)
-                tokens.append(Token(
-                    type=TokenType.TEMPLATE,
-                    content=content,
-                    context="template"
-                ))
-                pos = match.end()
-                continue
-            
-            # Sprawdź XML tag
-            match = self.xml_tag_pattern.match(data, pos)
-            if match:
-                closing = match.group(1)
-                tagname = match.group(2)
-                tokens.append(Token(
-                    type=TokenType.XML_TAG,
-                    content=tagname,
-                    context="close" if closing else "open"
-                ))
-                pos = match.end()
-                continue
-            
-            # Sprawdź entity
-            match = self.entity_pattern.match(data, pos)
-            if match:
-                tokens.append(Token(
-                    type=TokenType.ENTITY,
-                    content=match.group(0),
-                    context="entity"
-                ))
-                pos = match.end()
-                continue
-            
-            # Newline
-            if data[pos:pos+1] == b'\n':
-                tokens.append(Token(
-                    type=TokenType.NEWLINE,
-                    content=b'\n'
-                ))
-                pos += 1
-                continue
-            
-            # Specjalne znaki (markup)
-            if data[pos:pos+1] in b"*#:;'":
-                tokens.append(Token(
-                    type=TokenType.SPECIAL,
-                    content=data[pos:pos+1]
-                ))
-                pos += 1
-                continue
-            
-            # Plain text - zbieraj do następnego specjalnego znaku
-            start = pos
-            while pos < len(data):
-                ch = data[pos:pos+1]
-                # Zatrzymaj się na początku specjalnych struktur
-                if ch in b'\n*#:;\'[{<&=' or data[pos:pos+2] in [b'[[', b'{{', b'==']:
-                    break
-                pos += 1
-            
-            if pos > start:
-                tokens.append(Token(
-                    type=TokenType.PLAIN_TEXT,
-                    content=data[start:pos]
-                ))
-        
-        return tokens
-    
-    def tokens_to_channels(self, tokens: List[Token]) -> dict:
+        return self.tokenize_columns(data).to_tokens()
+
+    def tokens_to_channels(self, tokens: Union[TokenColumns, List[Token]]) -> dict:
         """
         Konwertuje tokeny na osobne kanały
-        
+
         Returns:
             dict z kluczami: 'heading', 'link', 'template', 'text', 'structure'
         """
-        channels = {
-            'heading': bytearray(),
-            'link': bytearray(),
-            'template': bytearray(),
-            'text': bytearray(),
-            'structure': bytearray(),  # Metadane struktury
-        }
-        
-        for token in tokens:
-            if token.type == TokenType.HEADING:
-                channels['heading'].extend(token.content)
-                channels['heading'].append(ord('\n'))
-            elif token.type == TokenType.LINK:
-                channels['link'].extend(token.content)
-                channels['link'].append(ord('\n'))
-            elif token.type == TokenType.TEMPLATE:
-                channels['template'].extend(token.content)
-                channels['template'].append(ord('\n'))
-            elif token.type == TokenType.PLAIN_TEXT:
-                channels['text'].extend(token.content)
-            elif token.type in [TokenType.XML_TAG, TokenType.ENTITY, TokenType.SPECIAL, TokenType.NEWLINE]:
-                channels['structure'].extend(token.content)
-        
-        # Konwertuj na bytes
-        return {k: bytes(v) for k, v in channels.items()}
-    
+        if not isinstance(tokens, TokenColumns):
+            tokens = _columns_from_tokens(tokens)
+
+        channels = {}
+        for name, types in _CHANNEL_TYPES.items():
+            parts = tokens.gather(np.isin(tokens.type, types))
+            if name in ('heading', 'link', 'template'):
+                # Jedna treść na linię
+                channels[name] = b'\n'.join(parts) + b'\n' if parts else b''
+            else:
+                channels[name] = b''.join(parts)
+        return channels
+
     def analyze_structure(self, data: bytes, max_bytes: int = 100000) -> dict:
         """
         Analizuje strukturę fragmentu danych
@@ -191,22 +232,36 @@ class WikiParser:
             Statystyki o tokenach
         """
         subset = data[:max_bytes]
-        tokens = self.tokenize(subset)
-        
+        columns = self.tokenize_columns(subset)
+        counts = np.bincount(columns.type, minlength=len(TokenType) + 1)
+        sizes = np.bincount(columns.type, weights=columns.content_end - columns.content_start,
+                            minlength=len(TokenType) + 1)
+
         stats = {
-            'total_tokens': len(tokens),
+            'total_tokens': len(columns),
             'by_type': {},
             'total_bytes': len(subset),
             'bytes_by_type': {}
         }
-        
-        for token in tokens:
-            type_name = token.type.name
-            stats['by_type'][type_name] = stats['by_type'].get(type_name, 0) + 1
-            stats['bytes_by_type'][type_name] = stats['bytes_by_type'].get(type_name, 0) + len(token.content)
-        
+
+        for token_type in TokenType:
+            if counts[token_type.value]:
+                stats['by_type'][token_type.name] = int(counts[token_type.value])
+                stats['bytes_by_type'][token_type.name] = int(sizes[token_type.value])
+
         return stats
 
+
+def _columns_from_tokens(tokens: List[Token]) -> TokenColumns:
+    """TokenColumns z listy obiektów Token (treści sklejone w nowy bufor)"""
+    data = b''.join(token.content for token in tokens)
+    lengths = np.fromiter((len(token.content) for token in tokens), dtype=np.int64, count=len(tokens))
+    ends = np.cumsum(lengths)
+    starts = ends - lengths
+    types = np.fromiter((token.type.value for token in tokens), dtype=np.uint8, count=len(tokens))
+    return TokenColumns(data, types, starts, ends, starts, ends, np.zeros(len(tokens), dtype=np.uint8))
+
+
 def demo():
     """Demonstracja parsera"""
     print("=" * 70)
@@ -260,6 +315,24 @@ The term &quot;AI&quot; was coined at this conference.
         percent = (bytes_count / stats['total_bytes']) * 100
         print(f"      {type_name:<15}: {count:>4} tokenów, {bytes_count:>6} bajtów ({percent:>5.1f}%)")
     
+    try:
+        with open("wiki_1mb.txt", 'rb') as f:
+            data = f.read()
+    except FileNotFoundError:
+        data = None
+    if data:
+        print("\n[4] Wydajność na wiki_1mb.txt...")
+        start = time.perf_counter()
+        columns = parser.tokenize_columns(data)
+        tokenize_time = time.perf_counter() - start
+        start = time.perf_counter()
+        parser.tokens_to_channels(columns)
+        channels_time = time.perf_counter() - start
+        mb = len(data) / 1e6
+        print(f"    Tokeny:             {len(columns):,}")
+        print(f"    tokenize_columns:   {mb / tokenize_time:.1f} MB/s")
+        print(f"    tokens_to_channels: {mb / channels_time:.1f} MB/s")
+    
     print("\n" + "=" * 70)
 
 if __name__ == "__main__":
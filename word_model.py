@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+"""
+Word-level context model for the bitwise coder
+
+hybrid_compressor.WordLevelModel only measures bigram accuracy on the top
+1000 words. This model takes part in coding: it keeps rolling hashes of
+the current partial word and the previous two whole words, updated once
+per byte (no regex, no string building), and predicts bits from hashed
+counters in a fixed-size ContextTable.
+
+Unicode: every byte >= 0x80 counts as a word byte, so UTF-8 letters
+(é, ł, ж, ...) stay inside their word without decoding the stream.
+"""
+import sys
+
+from context_mixing import HashedContextModel, hash_context, benchmark, OrderModel, ContextTable
+
+
+def _build_word_bytes():
+    """Byte -> normalized word byte (lowercase), 0 for word separators"""
+    table = bytearray(256)
+    for b in range(256):
+        if ord('a') <= b <= ord('z') or b >= 0x80:
+            table[b] = b
+        elif ord('A') <= b <= ord('Z'):
+            table[b] = b + 32
+    return bytes(table)
+
+
+WORD_BYTES = _build_word_bytes()
+
+WORD_MULT = 0x2F0B4C27
+
+
+class WordModel(HashedContextModel):
+    """
+    Contexts (one mixer input each):
+        1. current partial word
+        2. partial word + previous word
+        3. partial word + previous two words
+        4. previous word + last byte (predicts the start of the next word)
+    """
+
+    name = 'word'
+
+    def __init__(self, table=None, table_bits=22):
+        super().__init__(4, table, table_bits)
+        self.word0 = 0  # hash of the current partial word (0 = between words)
+        self.word1 = 0  # previous whole word
+        self.word2 = 0  # word before that
+        self.update_byte(0)
+
+    def update_byte(self, byte):
+        c = WORD_BYTES[byte]
+        if c:
+            self.word0 = ((self.word0 + c + 1) * WORD_MULT) & 0xFFFFFFFF
+        elif self.word0:
+            self.word2 = self.word1
+            self.word1 = self.word0
+            self.word0 = 0
+
+        w0 = self.word0
+        w1 = self.word1 * 0x6F4F2A45
+        self.hashes = [
+            hash_context(w0, 101),
+            hash_context(w0 ^ w1, 102),
+            hash_context(w0 ^ w1 ^ (self.word2 * 0x1B873593), 103),
+            hash_context(w1 ^ (byte << 32), 104),
+        ]
+
+
+def main():
+    size = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+
+    print("=" * 70)
+    print("WORD MODEL - contribution to the context mixing coder")
+    print("=" * 70)
+
+    with open("wiki_1mb.txt", 'rb') as f:
+        data = f.read(size)
+    print(f"\nInput: wiki_1mb.txt, first {len(data):,} bytes\n")
+
+    def orders_only():
+        return [OrderModel()]
+
+    def orders_and_words():
+        table = ContextTable(bits=22)
+        return [OrderModel(table=table), WordModel(table=table)]
+
+    base, _, _ = benchmark(data, orders_only, "orders 0-4,6")
+    with_words, _, _ = benchmark(data, orders_and_words, "orders + word model")
+
+    print(f"\n  Word model saves {base - with_words:,} bytes ({(base - with_words) / base * 100:.2f}%)")
+    print("=" * 70)
+
+
+if __name__ == "__main__":
+    main()